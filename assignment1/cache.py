@@ -0,0 +1,134 @@
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+from importlib import metadata
+from pathlib import Path
+from assignment1 import models as model_loaders
+from assignment1.models import SPACY_MODEL_NAME, HF_MODEL_NAME
+from assignment1.stats import stats_from_json
+
+
+# Bump when the stored record format or the censoring logic changes, so old records are never reused
+CACHE_SCHEMA_VERSION = 3
+DEFAULT_CACHE_PATH = Path.home() / ".cache" / "censoror" / "results.sqlite3"
+DEFAULT_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+
+def package_version(name):
+    # Installed version of a package, without importing it
+    try:
+        return metadata.version(name)
+    except metadata.PackageNotFoundError:
+        return "missing"
+
+
+def model_versions():
+    # Everything that changes the detected spans when it changes
+    return (f"schema={CACHE_SCHEMA_VERSION};spacy={package_version('spacy')};"
+            f"{SPACY_MODEL_NAME}={package_version(SPACY_MODEL_NAME)};"
+            f"transformers={package_version('transformers')};{HF_MODEL_NAME};backend={model_loaders.hf_backend}")
+
+
+def cache_key(text, entities_to_censor, *modes):
+    # Content hash of the input combined with the entity flags, the run modes and the model versions
+    digest = hashlib.sha256(text.encode("utf-8"))
+    digest.update(("\0" + ",".join(sorted(set(entities_to_censor))) + "\0" +
+                   ",".join(str(mode) for mode in modes) + "\0" + model_versions()).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def censored_spans(censored_text):
+    # Runs of black blocks in the censored text, redacting them on the original text reproduces it exactly
+    return [match.span() for match in re.finditer('█+', censored_text)]
+
+
+class ResultCache:
+    # SQLite store of the censored spans and stats of every input, keyed by cache_key
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_bytes=DEFAULT_CACHE_MAX_BYTES):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self._connection = None
+        self._lock = threading.RLock()
+
+    def __getstate__(self):
+        # Worker processes reopen their own connection
+        return {'path': self.path, 'max_bytes': self.max_bytes}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'], state['max_bytes'])
+
+    @property
+    def connection(self):
+        if self._connection is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            # Calls from other threads (e.g. the async ingest model stage) are serialized by the lock
+            self._connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, spans TEXT, "
+                                     "stats TEXT, size INTEGER, last_used REAL)")
+            self._connection.execute("CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)")
+            # Running byte total of the records in a one-row table, kept up to date by triggers so every process that
+            # shares the file sees it. A cache written before the table existed is summed once.
+            with self._connection:
+                self._connection.execute("CREATE TABLE IF NOT EXISTS cache_size (id INTEGER PRIMARY KEY "
+                                         "CHECK (id = 0), total INTEGER)")
+                self._connection.execute("INSERT OR IGNORE INTO cache_size "
+                                         "SELECT 0, COALESCE(SUM(size), 0) FROM results")
+                self._connection.execute("CREATE TRIGGER IF NOT EXISTS results_insert AFTER INSERT ON results BEGIN "
+                                         "UPDATE cache_size SET total = total + NEW.size WHERE id = 0; END")
+                self._connection.execute("CREATE TRIGGER IF NOT EXISTS results_update AFTER UPDATE OF size ON results "
+                                         "BEGIN UPDATE cache_size SET total = total - OLD.size + NEW.size "
+                                         "WHERE id = 0; END")
+                self._connection.execute("CREATE TRIGGER IF NOT EXISTS results_delete AFTER DELETE ON results BEGIN "
+                                         "UPDATE cache_size SET total = total - OLD.size WHERE id = 0; END")
+        return self._connection
+
+    def get(self, key):
+        # Cached (spans, stats) for a key, or None
+        with self._lock:
+            row = self.connection.execute("SELECT spans, stats FROM results WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            with self.connection:
+                self.connection.execute("UPDATE results SET last_used = ? WHERE key = ?", (time.time(), key))
+        spans = [tuple(span) for span in json.loads(row[0])]
+        return spans, stats_from_json(json.loads(row[1]))
+
+    def put(self, key, spans, stats):
+        spans_json = json.dumps(spans)
+        stats_json = json.dumps(stats)
+        with self._lock:
+            with self.connection:
+                # An upsert, not INSERT OR REPLACE: the rows that REPLACE deletes do not fire the delete trigger
+                self.connection.execute("INSERT INTO results VALUES (?, ?, ?, ?, ?) ON CONFLICT (key) DO UPDATE SET "
+                                        "spans = excluded.spans, stats = excluded.stats, size = excluded.size, "
+                                        "last_used = excluded.last_used",
+                                        (key, spans_json, stats_json, len(spans_json) + len(stats_json), time.time()))
+            self.evict()
+
+    def total_size(self):
+        return self.connection.execute("SELECT total FROM cache_size WHERE id = 0").fetchone()[0]
+
+    def evict(self):
+        # Drop the least recently used records until the cache fits in max_bytes
+        excess = self.total_size() - self.max_bytes
+        if excess <= 0:
+            return
+        freed = 0
+        keys = []
+        for key, size in self.connection.execute("SELECT key, size FROM results ORDER BY last_used"):
+            keys.append((key,))
+            freed += size
+            if freed >= excess:
+                break
+        with self.connection:
+            self.connection.executemany("DELETE FROM results WHERE key = ?", keys)
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
@@ -0,0 +1,122 @@
+import hashlib
+import re
+import threading
+from array import array
+from collections import OrderedDict
+from assignment1.cache import censored_spans
+from assignment1.instrumentation import metrics
+from assignment1.main import redact_spans
+from assignment1.spans import CompactSpans
+
+
+# Censored paragraphs remembered for the rest of the run, the least recently used are dropped first
+DEDUP_MAX_PARAGRAPHS = 100000
+# Paragraphs are separated by at least one blank line
+PARAGRAPH_BREAK = re.compile(r"\n[ \t]*\n\s*")
+
+
+def split_paragraphs(text, start=0, end=None):
+    # (start, end) of every paragraph of text[start:end], without the blank lines and the surrounding whitespace
+    end = len(text) if end is None else end
+    paragraphs = []
+    position = start
+    for match in PARAGRAPH_BREAK.finditer(text, start, end):
+        paragraphs.append((position, match.start()))
+        position = match.end()
+    paragraphs.append((position, end))
+
+    trimmed = []
+    for paragraph_start, paragraph_end in paragraphs:
+        content = text[paragraph_start:paragraph_end]
+        stripped = content.strip()
+        if stripped:
+            paragraph_start += len(content) - len(content.lstrip())
+            trimmed.append((paragraph_start, paragraph_start + len(stripped)))
+    return trimmed
+
+
+class Deduplicator:
+    # Censored spans and stats of every paragraph seen in the run, keyed by a hash of the paragraph text,
+    # the entity flags and the run modes. A paragraph repeated in other copies of a mail or in quoted replies
+    # goes through the models only once.
+
+    def __init__(self, max_paragraphs=DEDUP_MAX_PARAGRAPHS):
+        self.max_paragraphs = max_paragraphs
+        self.results = OrderedDict()
+        # Held while the results are looked up or updated, not while the models run
+        self.lock = threading.Lock()
+
+    def __getstate__(self):
+        # Worker processes start with an empty memory of their own
+        return {'max_paragraphs': self.max_paragraphs}
+
+    def __setstate__(self, state):
+        self.__init__(state['max_paragraphs'])
+
+    @staticmethod
+    def key(paragraph, entities_to_censor, modes):
+        digest = hashlib.sha256(paragraph.encode("utf-8"))
+        digest.update(("\0" + ",".join(sorted(set(entities_to_censor))) + "\0" +
+                       ",".join(str(mode) for mode in modes)).encode("utf-8"))
+        return digest.digest()
+
+    def censor(self, documents, entities_to_censor, modes, censor_all):
+        # documents is a list with the paragraph texts of every document, the result has (censored_text, stats)
+        # for each of them. censor_all(texts) censors the paragraphs seen for the first time, in one call.
+        keys = [[self.key(paragraph, entities_to_censor, modes) for paragraph in paragraphs]
+                for paragraphs in documents]
+        found = {}
+        missing = OrderedDict()
+        for paragraphs, paragraph_keys in zip(documents, keys):
+            document_hit = bool(paragraphs)
+            for paragraph, key in zip(paragraphs, paragraph_keys):
+                hit = key in found or key in missing
+                if not hit:
+                    with self.lock:
+                        if key in self.results:
+                            self.results.move_to_end(key)
+                            found[key] = self.results[key]
+                            hit = True
+                if not hit:
+                    missing[key] = paragraph
+                document_hit = document_hit and hit
+                metrics.count("dedup_paragraph_lookups")
+                metrics.count("dedup_chars_lookups", len(paragraph))
+                if hit:
+                    metrics.count("dedup_paragraph_hits")
+                    metrics.count("dedup_chars_hits", len(paragraph))
+            metrics.count("dedup_document_lookups")
+            if document_hit:
+                metrics.count("dedup_document_hits")
+
+        censored = censor_all(list(missing.values())) if missing else []
+        for (key, paragraph), (censored_text, stats) in zip(missing.items(), censored):
+            # Kept as int32 arrays, a long run remembers up to max_paragraphs results
+            spans = array('i', [offset for span in censored_spans(censored_text) for offset in span])
+            found[key] = (spans, CompactSpans.from_stats(stats))
+            self.remember(key, found[key])
+
+        # Every copy gets its own stats, the callers merge them into the stats of their document
+        return [[self.restore(paragraph, *found[key]) for paragraph, key in zip(paragraphs, paragraph_keys)]
+                for paragraphs, paragraph_keys in zip(documents, keys)]
+
+    @staticmethod
+    def restore(paragraph, spans, compact_stats):
+        # Censored text and a new stats dict of one copy of a paragraph
+        return redact_spans(paragraph, list(zip(spans[0::2], spans[1::2]))), compact_stats.to_stats()
+
+    def remember(self, key, result):
+        with self.lock:
+            self.results[key] = result
+            while len(self.results) > self.max_paragraphs:
+                self.results.popitem(last=False)
+
+
+# Deduplicator of the current run, None when the run does not deduplicate
+active = None
+
+
+def use_dedup(deduplicator):
+    global active
+    active = deduplicator
+    return deduplicator
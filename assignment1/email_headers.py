@@ -0,0 +1,73 @@
+import re
+from email.parser import HeaderParser
+from assignment1.stats import add_stat
+
+
+# Header fields whose values are people or their mail addresses, censored token by token with the names flag
+PERSON_HEADERS = ["from", "to", "cc", "bcc", "x-from", "x-to", "x-cc", "x-bcc", "x-origin", "x-filename"]
+# Header fields whose values are dates, censored as a whole with the dates flag
+DATE_HEADERS = ["date"]
+# Header fields with free text that still goes through the NER models
+MODEL_HEADERS = ["subject", "x-folder"]
+# Any header needed to treat a text as an RFC822 message
+REQUIRED_HEADERS = ["message-id", "date", "from"]
+
+HEADER_LINE = re.compile(r"([\x21-\x39\x3b-\x7e]+):[ \t]*")
+PERSON_TOKEN = re.compile(r"[^\s,;<>\"()]+")
+
+
+def find_body_start(text):
+    # Offset of the message body, or None when the text does not start with RFC822 headers
+    header_end = text.find("\n\n")
+    if header_end == -1 or not HEADER_LINE.match(text):
+        return None
+
+    message = HeaderParser().parsestr(text[:header_end + 1])
+    names = [name.lower() for name in message.keys()]
+    if message.defects or not any(name in names for name in REQUIRED_HEADERS):
+        return None
+    return header_end + 2
+
+
+def header_fields(text, body_start):
+    # Yield (name, value_start, value_end) for every header, continuation lines included
+    position = 0
+    current = None
+    for line in text[:body_start - 1].splitlines(keepends=True):
+        match = HEADER_LINE.match(line)
+        if match and not line[0].isspace():
+            if current:
+                yield current
+            current = (match.group(1).lower(), position + match.end(), position + len(line.rstrip("\r\n")))
+        elif current:
+            # Continuation line, extend the value of the current header
+            current = (current[0], current[1], position + len(line.rstrip("\r\n")))
+        position += len(line)
+    if current:
+        yield current
+
+
+def split_email(text, entities_to_censor):
+    # Censor header fields with deterministic rules and return the parts that still need the NER models.
+    # Returns (spans, stats, segments) or None when the text is not an email.
+    body_start = find_body_start(text)
+    if body_start is None:
+        return None
+
+    spans, stats, segments = [], {}, []
+    for name, value_start, value_end in header_fields(text, body_start):
+        if name in PERSON_HEADERS and 'PERSON' in entities_to_censor:
+            tokens = [match.span() for match in PERSON_TOKEN.finditer(text, value_start, value_end)]
+            if tokens:
+                # Censor every token but keep the separators, the whole value counts as one entity
+                spans.extend((start, end, 'PERSON') for start, end in tokens)
+                add_stat(stats, 'PERSON', tokens[0][0], tokens[-1][1], "email")
+        elif name in DATE_HEADERS and 'DATE' in entities_to_censor and value_start < value_end:
+            spans.append((value_start, value_end, 'DATE'))
+            add_stat(stats, 'DATE', value_start, value_end, "email")
+        elif name in MODEL_HEADERS and value_start < value_end:
+            segments.append((value_start, value_end))
+
+    if body_start < len(text):
+        segments.append((body_start, len(text)))
+    return spans, stats, segments
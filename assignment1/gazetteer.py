@@ -0,0 +1,213 @@
+import hashlib
+import json
+import re
+import threading
+from pathlib import Path
+from assignment1.main import redact_spans
+from assignment1.models import models
+from assignment1.stats import add_stat
+
+
+GAZETTEER_VERSION = 1
+# Labels of people and places that are worth remembering across documents
+GAZETTEER_LABELS = ["PERSON", "B-PER", "I-PER", "GPE", "LOC", "FAC", "B-LOC", "I-LOC"]
+# A learned entity is confirmed once the models found it in this many documents
+GAZETTEER_MIN_DOCUMENTS = 2
+GAZETTEER_MIN_CHARS = 3
+
+# Capitalized words that could still be a name or a place
+CANDIDATE_WORD = re.compile(r"\b[A-Z][a-z]+\b")
+SENTENCE_END_CHARS = ".!?:\n"
+
+
+class Gazetteer:
+    # Index of confirmed entity phrases, matched on the tokens of the blank SpaCy pipeline with a PhraseMatcher
+
+    def __init__(self, path=None, learn=False, skip_models=False):
+        self.path = Path(path) if path else None
+        self.learn = learn
+        self.skip_models = skip_models
+        self.entities = {}
+        self.seen = {}
+        self.observed = {}
+        self._matcher = None
+        # Worker threads of a --threads run match, observe and add phrases on the same index
+        self._lock = threading.RLock()
+
+    def __getstate__(self):
+        # The matcher is rebuilt from the phrases in worker processes
+        state = self.__dict__.copy()
+        state['_matcher'] = None
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.RLock()
+
+    def add(self, phrase, label):
+        phrase = phrase.strip()
+        with self._lock:
+            if len(phrase) < GAZETTEER_MIN_CHARS or phrase in self.entities:
+                return
+            self.entities[phrase] = label
+            if self._matcher is not None:
+                self._matcher.add(label, [models.get("rules").make_doc(phrase)])
+
+    def load(self, path=None):
+        # Read a persisted index, a missing file leaves the gazetteer empty
+        path = Path(path) if path else self.path
+        if path is None or not path.exists():
+            return self
+        content = json.loads(path.read_text(encoding="utf-8"))
+        for label, phrases in content.get('entities', {}).items():
+            for phrase in phrases:
+                self.add(phrase, label)
+        for phrase, (label, documents) in content.get('seen', {}).items():
+            self.seen.setdefault(phrase, [label, 0])[1] += documents
+        return self
+
+    def load_seed(self, seed_path):
+        # One entity per line, "LABEL<TAB>phrase" or just "phrase" for a person
+        for line in Path(seed_path).read_text(encoding="utf-8").splitlines():
+            if not line.strip() or line.startswith("#"):
+                continue
+            label, _, phrase = line.rpartition("\t")
+            self.add(phrase, label or "PERSON")
+        return self
+
+    def save(self, path=None):
+        path = Path(path) if path else self.path
+        entities = {}
+        for phrase, label in sorted(self.entities.items()):
+            entities.setdefault(label, []).append(phrase)
+        content = {'version': GAZETTEER_VERSION, 'entities': entities,
+                   'seen': {phrase: entry for phrase, entry in sorted(self.seen.items())}}
+
+        # Write then rename, so an interrupted run never leaves a truncated index
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = path.with_name(path.name + ".tmp")
+        temp_path.write_text(json.dumps(content, indent=1), encoding="utf-8")
+        temp_path.replace(path)
+
+    def fingerprint(self):
+        # Changes whenever the index changes, part of the result cache key
+        digest = hashlib.sha256()
+        for phrase, label in sorted(self.entities.items()):
+            digest.update(f"{label}\t{phrase}\n".encode("utf-8"))
+        return f"gazetteer={digest.hexdigest()[:16]};skip={self.skip_models}"
+
+    def shard_setting(self):
+        # The index the runs of a shard must share. A learning index grows between the runs, only its path counts.
+        if self.learn:
+            return f"gazetteer={self.path};learn;skip={self.skip_models}"
+        return self.fingerprint()
+
+    @property
+    def matcher(self):
+        with self._lock:
+            if self._matcher is None:
+                from spacy.matcher import PhraseMatcher
+
+                nlp_rules = models.get("rules")
+                matcher = PhraseMatcher(nlp_rules.vocab)
+                phrases_by_label = {}
+                for phrase, label in self.entities.items():
+                    phrases_by_label.setdefault(label, []).append(phrase)
+                for label, phrases in phrases_by_label.items():
+                    matcher.add(label, list(nlp_rules.tokenizer.pipe(phrases)))
+                self._matcher = matcher
+            return self._matcher
+
+    def find(self, text, entities_to_censor):
+        # (start, end, label) of every indexed phrase in the text, longest match first, in one pass over the tokens
+        if not self.entities or not any(label in entities_to_censor for label in set(self.entities.values())):
+            return []
+        nlp_rules = models.get("rules")
+        doc = nlp_rules.make_doc(text)
+        with self._lock:
+            found = self.matcher(doc)
+        matches = []
+        for match_id, start, end in found:
+            label = nlp_rules.vocab.strings[match_id]
+            if label in entities_to_censor:
+                matches.append((doc[start:end].start_char, doc[start:end].end_char, label))
+
+        spans = []
+        for start, end, label in sorted(matches, key=lambda match: (match[0], -match[1])):
+            if not spans or start >= spans[-1][1]:
+                spans.append((start, end, label))
+        return spans
+
+    def censor(self, text, entities_to_censor, stats):
+        spans = self.find(text, entities_to_censor)
+        for start, end, label in spans:
+            add_stat(stats, label, start, end, "gazetteer")
+        return redact_spans(text, spans)
+
+    def covers(self, censored_text):
+        # True when no capitalized word is left outside a sentence start, so the models have nothing to add
+        for match in CANDIDATE_WORD.finditer(censored_text):
+            if not starts_sentence(censored_text, match.start()):
+                return False
+        return True
+
+    def observe(self, text, stats):
+        # Remember the people and places the models found, confirmed ones join the index
+        phrases = set()
+        for label, value in stats.items():
+            if label not in GAZETTEER_LABELS or not isinstance(value, dict):
+                continue
+            for start, end in value['indices']:
+                phrase = text[start:end].strip()
+                if len(phrase) >= GAZETTEER_MIN_CHARS and phrase[0].isupper() and '█' not in phrase:
+                    phrases.add((phrase, label))
+
+        with self._lock:
+            for phrase, label in phrases:
+                self.observed.setdefault(phrase, [label, 0])[1] += 1
+                self.record(phrase, label, 1)
+
+    def record(self, phrase, label, documents):
+        if phrase in self.entities:
+            return
+        entry = self.seen.setdefault(phrase, [label, 0])
+        entry[1] += documents
+        if entry[1] >= GAZETTEER_MIN_DOCUMENTS:
+            del self.seen[phrase]
+            self.add(phrase, label)
+
+    def snapshot(self):
+        # Phrases observed by a worker process since the last snapshot, sent back to the parent
+        with self._lock:
+            observed, self.observed = self.observed, {}
+        return observed
+
+    def merge(self, snapshot):
+        with self._lock:
+            for phrase, (label, documents) in snapshot.items():
+                self.record(phrase, label, documents)
+
+
+def without_covered_labels(stages):
+    # Labels left for the model stages once the gazetteer covered every person and place of a document
+    return {stage: labels if stage == "rules" else [label for label in labels if label not in GAZETTEER_LABELS]
+            for stage, labels in stages.items()}
+
+
+def starts_sentence(text, position):
+    # Only spaces between the position and the end of the previous sentence or line
+    index = position - 1
+    while index >= 0 and text[index] in " \t":
+        index -= 1
+    return index < 0 or text[index] in SENTENCE_END_CHARS
+
+
+# Gazetteer of the current run, None when the run does not use one
+active = None
+
+
+def use_gazetteer(index):
+    global active
+    active = index
+    return index
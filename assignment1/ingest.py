@@ -0,0 +1,115 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Files waiting between two stages, a full queue makes the stage before it wait (backpressure)
+INGEST_QUEUE_SIZE = 8
+# Reader tasks, writer tasks and the threads they run the blocking file calls on
+INGEST_IO_WORKERS = 4
+
+
+async def read_files(file_queue, text_queue, read, io_executor):
+    # Reader task: prefetch files so the model stage never waits for the disk
+    loop = asyncio.get_running_loop()
+    while True:
+        item = await file_queue.get()
+        if item is None:
+            return
+        index, file_path = item
+        text = await loop.run_in_executor(io_executor, read, file_path)
+        await text_queue.put((index, file_path, text))
+
+
+async def censor_texts(text_queue, output_queue, censor, model_executor):
+    # Model stage: one text at a time on its own executor, so the models are never used concurrently
+    loop = asyncio.get_running_loop()
+    while True:
+        item = await text_queue.get()
+        if item is None:
+            return
+        index, file_path, text = item
+        # A file that could not be read is passed on as None
+        result = None if text is None else await loop.run_in_executor(model_executor, censor, text)
+        await output_queue.put((index, file_path, result))
+
+
+async def write_files(output_queue, results, write, io_executor, written):
+    # Writer task: flush the censored text while the next files are censored, then report the file as written
+    loop = asyncio.get_running_loop()
+    while True:
+        item = await output_queue.get()
+        if item is None:
+            return
+        index, file_path, result = item
+        if result is not None:
+            censored_text, stats = result
+            results[index] = await loop.run_in_executor(io_executor, write, file_path, censored_text, stats)
+        written(index)
+
+
+async def close_after(tasks, queue, consumers):
+    # Once every producer is done, tell each consumer of the queue to stop. A failed producer stops them too, so they
+    # finish the items handed to them before the error.
+    try:
+        await asyncio.gather(*tasks)
+    except Exception:
+        for _ in range(consumers):
+            await queue.put(None)
+        raise
+    for _ in range(consumers):
+        await queue.put(None)
+
+
+async def ingest(file_paths, read, censor, write, queue_size=INGEST_QUEUE_SIZE, io_workers=INGEST_IO_WORKERS,
+                 on_result=None):
+    # Overlap reading, inference and writing with bounded queues between the stages.
+    # read(file_path) returns the text or None, censor(text) returns (censored_text, stats)
+    # and write(file_path, censored_text, stats) returns the result kept for the file.
+    # Results come back in input order, None for files that could not be read. Given on_result, each result is passed
+    # to it instead, in input order, as soon as its file and every file before it are written, so progress such as the
+    # stats and a shard journal is recorded while the run goes on.
+    results = [None] * len(file_paths)
+    finished = [False] * len(file_paths)
+    emitted = 0
+
+    def written(index):
+        # Runs on the event loop, writer tasks never call it at the same time
+        nonlocal emitted
+        finished[index] = True
+        while on_result is not None and emitted < len(file_paths) and finished[emitted]:
+            result, results[emitted] = results[emitted], None
+            emitted += 1
+            on_result(result)
+    file_queue = asyncio.Queue()
+    text_queue = asyncio.Queue(maxsize=max(1, queue_size))
+    output_queue = asyncio.Queue(maxsize=max(1, queue_size))
+    io_workers = max(1, io_workers)
+    for item in enumerate(file_paths):
+        file_queue.put_nowait(item)
+    for _ in range(io_workers):
+        file_queue.put_nowait(None)
+
+    with ThreadPoolExecutor(max_workers=io_workers) as io_executor, \
+            ThreadPoolExecutor(max_workers=1) as model_executor:
+        readers = [asyncio.create_task(read_files(file_queue, text_queue, read, io_executor))
+                   for _ in range(io_workers)]
+        model = asyncio.create_task(censor_texts(text_queue, output_queue, censor, model_executor))
+        writers = [asyncio.create_task(write_files(output_queue, results, write, io_executor, written))
+                   for _ in range(io_workers)]
+        stages = asyncio.gather(close_after(readers, text_queue, 1), close_after([model], output_queue, io_workers))
+        writing = asyncio.gather(*writers)
+        await asyncio.wait([stages, writing], return_when=asyncio.FIRST_EXCEPTION)
+        if not writing.done():
+            # A stage before the writers failed, the files it censored before the error are still written
+            await asyncio.wait([writing])
+        # The first error stops the run, asyncio.run cancels the tasks still waiting on a queue
+        for future in (writing, stages):
+            if future.done() and future.exception() is not None:
+                raise future.exception()
+
+    return None if on_result is not None else results
+
+
+def run_ingest(file_paths, read, censor, write, queue_size=INGEST_QUEUE_SIZE, io_workers=INGEST_IO_WORKERS,
+               on_result=None):
+    return asyncio.run(ingest(file_paths, read, censor, write, queue_size, io_workers, on_result))
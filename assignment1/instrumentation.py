@@ -0,0 +1,155 @@
+import cProfile
+import json
+import pstats
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+
+class Metrics:
+    # Wall and CPU time per pipeline stage, plus per-file character counts, for one run
+
+    def __init__(self):
+        # Worker threads of a --threads run record into the same metrics
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.stages = {}
+        self.files = []
+        self.counters = {}
+        self.started = time.perf_counter()
+
+    @contextmanager
+    def time_stage(self, name):
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield
+        finally:
+            wall_seconds = time.perf_counter() - wall_start
+            cpu_seconds = time.process_time() - cpu_start
+            with self.lock:
+                stage = self.stages.setdefault(name, {'calls': 0, 'wall_seconds': 0.0, 'cpu_seconds': 0.0})
+                stage['calls'] += 1
+                stage['wall_seconds'] += wall_seconds
+                stage['cpu_seconds'] += cpu_seconds
+
+    def record_file(self, file_path, chars):
+        self.files.append({'file': str(file_path), 'chars': chars})
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def hit_rates(self):
+        # Share of hits for every "<name>_lookups" counter with a matching "<name>_hits" counter
+        rates = {}
+        for name, lookups in self.counters.items():
+            if name.endswith("_lookups") and lookups:
+                prefix = name[:-len("_lookups")]
+                rates[prefix] = round(self.counters.get(prefix + "_hits", 0) / lookups, 6)
+        return rates
+
+    def snapshot(self):
+        # Plain data that can be shipped back from a worker process
+        return {'stages': self.stages, 'files': self.files, 'counters': self.counters}
+
+    def merge(self, snapshot):
+        # Add the stage timings and files recorded by a worker process
+        for name, figures in snapshot['stages'].items():
+            stage = self.stages.setdefault(name, {'calls': 0, 'wall_seconds': 0.0, 'cpu_seconds': 0.0})
+            for key, value in figures.items():
+                stage[key] += value
+        self.files.extend(snapshot['files'])
+        for name, value in snapshot['counters'].items():
+            self.count(name, value)
+
+    def summary(self):
+        # Aggregate throughput of the run so far
+        wall_seconds = time.perf_counter() - self.started
+        chars = sum(entry['chars'] for entry in self.files)
+        return {
+            'files': len(self.files),
+            'chars': chars,
+            'wall_seconds': round(wall_seconds, 6),
+            'files_per_second': round(len(self.files) / wall_seconds, 3) if wall_seconds else 0.0,
+            'chars_per_second': round(chars / wall_seconds, 1) if wall_seconds else 0.0,
+            'stages': {name: {key: round(value, 6) for key, value in figures.items()}
+                       for name, figures in self.stages.items()},
+            'counters': dict(self.counters),
+            'hit_rates': self.hit_rates(),
+        }
+
+    def to_prometheus(self):
+        # Prometheus textfile collector format
+        summary = self.summary()
+        lines = [
+            "# HELP censoror_files_total Files censored in the run.",
+            "# TYPE censoror_files_total counter",
+            f"censoror_files_total {summary['files']}",
+            "# HELP censoror_chars_total Characters censored in the run.",
+            "# TYPE censoror_chars_total counter",
+            f"censoror_chars_total {summary['chars']}",
+            "# HELP censoror_run_seconds Wall time of the run.",
+            "# TYPE censoror_run_seconds gauge",
+            f"censoror_run_seconds {summary['wall_seconds']}",
+            "# HELP censoror_chars_per_second Aggregate throughput of the run.",
+            "# TYPE censoror_chars_per_second gauge",
+            f"censoror_chars_per_second {summary['chars_per_second']}",
+            "# HELP censoror_stage_seconds Time spent in each pipeline stage.",
+            "# TYPE censoror_stage_seconds counter",
+        ]
+        for name, figures in summary['stages'].items():
+            lines.append(f'censoror_stage_seconds{{stage="{name}",clock="wall"}} {figures["wall_seconds"]}')
+            lines.append(f'censoror_stage_seconds{{stage="{name}",clock="cpu"}} {figures["cpu_seconds"]}')
+        lines.append("# HELP censoror_stage_calls_total Calls of each pipeline stage.")
+        lines.append("# TYPE censoror_stage_calls_total counter")
+        for name, figures in summary['stages'].items():
+            lines.append(f'censoror_stage_calls_total{{stage="{name}"}} {figures["calls"]}')
+        if summary['counters']:
+            lines.append("# HELP censoror_events_total Events counted by the pipeline stages, e.g. dedup hits.")
+            lines.append("# TYPE censoror_events_total counter")
+            for name, value in summary['counters'].items():
+                lines.append(f'censoror_events_total{{event="{name}"}} {value}')
+        if summary['hit_rates']:
+            lines.append("# HELP censoror_hit_rate Share of lookups answered without running the models.")
+            lines.append("# TYPE censoror_hit_rate gauge")
+            for name, rate in summary['hit_rates'].items():
+                lines.append(f'censoror_hit_rate{{lookup="{name}"}} {rate}')
+        return "\n".join(lines) + "\n"
+
+    def write(self, metrics_path):
+        # A .prom path gets the Prometheus textfile format, anything else gets JSON with per-file counts
+        metrics_path = Path(metrics_path)
+        if metrics_path.suffix == ".prom":
+            content = self.to_prometheus()
+        else:
+            content = json.dumps(dict(self.summary(), per_file=self.files), indent=2)
+
+        # Write then rename, so a collector never reads a half-written file
+        temp_path = metrics_path.with_name(metrics_path.name + ".tmp")
+        temp_path.write_text(content, encoding="utf-8")
+        temp_path.replace(metrics_path)
+
+
+metrics = Metrics()
+
+
+@contextmanager
+def profiled(profile_path):
+    # Run the block under cProfile when a path is given, dump the pstats file and print the top entries
+    if not profile_path:
+        yield
+        return
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(profile_path)
+        pstats.Stats(profiler, stream=sys.stderr).sort_stats("cumulative").print_stats(20)
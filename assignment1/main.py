@@ -1,19 +1,97 @@
-import re
-import spacy
-from transformers import AutoTokenizer, AutoModelForTokenClassification, pipeline
-from assignment1.utils import phone_patterns, date_patterns
+import threading
+from collections import OrderedDict
+from assignment1.models import models
+from assignment1.regex_registry import get_pattern, scan_entities
+from assignment1.utils import ENTITY_TYPES
+from assignment1.stats import add_stat
 
 
-# Load SpaCy model
-nlp_spacy = spacy.load("en_core_web_md")
-ruler = nlp_spacy.add_pipe("entity_ruler", before="ner")
-ruler.add_patterns(phone_patterns)
-ruler.add_patterns(date_patterns)
+# Labels produced by the SpaCy entity ruler and by the statistical NER component
+SPACY_RULER_LABELS = ["PHONE", "DATE"]
+SPACY_NER_LABELS = ["PERSON", "DATE", "GPE", "FAC", "LOC"]
 
-# Load Hugging face model
-tokenizer = AutoTokenizer.from_pretrained("dslim/bert-base-NER")
-model = AutoModelForTokenClassification.from_pretrained("dslim/bert-base-NER")
-nlp_hugging_face = pipeline("ner", model=model, tokenizer=tokenizer)
+# Labels the rules engine finds with the blank SpaCy entity ruler, and the regex registry entity behind each label
+RULES_RULER_LABELS = ["PHONE", "DATE"]
+RULES_REGEX_ENTITIES = {"PHONE": "PHONE", "DATE": "DATE", "ADDRESS": "ADDRESS"}
+
+# Engine of each entity type when no --engine is given, the other types use the ensemble.
+# The rules engine runs the same phone patterns as the SpaCy ruler plus the regex registry, so phones lose nothing.
+# Dates keep SpaCy NER, which also finds relative dates ("last Friday") the date patterns do not.
+DEFAULT_ENGINES = {"phones": "rules"}
+
+# Entity behind each label, an engine that detects one label of an entity covers the other labels of that entity
+LABEL_ENTITIES = {"PERSON": "person", "B-PER": "person", "I-PER": "person",
+                  "GPE": "place", "FAC": "place", "LOC": "place", "B-LOC": "place", "I-LOC": "place"}
+
+# Batching limits for nlp.pipe
+SPACY_BATCH_SIZE = 32
+SPACY_MAX_CHUNK_CHARS = 100000
+
+# Token windows for the BERT model (512 positions minus [CLS] and [SEP]) and the overlap between them
+HF_MAX_TOKENS = 510
+HF_STRIDE = 64
+HF_BATCH_SIZE = 16
+HF_AGGREGATION_STRATEGY = "simple"
+
+# LRU cache of SpaCy entities found inside regex name candidates, names repeat across thousands of mails
+REGEX_CANDIDATE_CACHE_SIZE = 50000
+regex_candidate_cache = OrderedDict()
+# --threads workers share the cache, every read and update of it holds this lock
+regex_candidate_lock = threading.Lock()
+
+
+def assign_labels(labels, engine):
+    # (stage, label) pairs for the labels an engine can detect, the ensemble runs SpaCy and Hugging face
+    assigned = []
+    for label in labels:
+        is_hf_label = label[:2] in ("B-", "I-")
+        if engine == "rules" and label in RULES_REGEX_ENTITIES:
+            assigned.append(("rules", label))
+        elif engine in ("hf", "ensemble") and is_hf_label:
+            assigned.append(("hugging_face", label))
+        elif engine in ("spacy", "ensemble") and not is_hf_label:
+            assigned.append(("spacy", label))
+    return assigned
+
+
+def engine_labels(entities_to_censor, engine=None):
+    # Split the requested labels between the rules, SpaCy and Hugging face stages.
+    # Every entity type uses the given engine, or its default one when engine is None.
+    # Labels of an entity the engine cannot detect at all (e.g. places with rules, or dates with hf) fall back to
+    # the default engine of their type, so a run never censors less than it was asked to.
+    label_types = {label: entity_type for entity_type, labels in ENTITY_TYPES.items() for label in labels}
+    labels_by_type = {}
+    for label in entities_to_censor:
+        labels_by_type.setdefault(label_types.get(label, label), []).append(label)
+
+    stages = {"rules": [], "spacy": [], "hugging_face": []}
+    for entity_type, labels in labels_by_type.items():
+        default_engine = DEFAULT_ENGINES.get(entity_type, "ensemble")
+        assigned = assign_labels(labels, engine or default_engine)
+        covered = {LABEL_ENTITIES.get(label, label) for _, label in assigned}
+        assigned += assign_labels([label for label in labels if LABEL_ENTITIES.get(label, label) not in covered],
+                                  default_engine)
+        for stage, label in assigned:
+            stages[stage].append(label)
+    return stages
+
+
+def label_engines(entities_to_censor, engine=None):
+    # Stage that censors each requested label, recorded with every span of the columnar export
+    return {label: stage for stage, labels in engine_labels(entities_to_censor, engine).items() for label in labels}
+
+
+def models_for(entities_to_censor, engine="ensemble"):
+    # Names of the models that the requested entity types need, so a run never loads an unused engine
+    stages = engine_labels(entities_to_censor, engine)
+    needed = []
+    if any(label in RULES_RULER_LABELS for label in stages["rules"]):
+        needed.append("rules")
+    if any(label in SPACY_RULER_LABELS + SPACY_NER_LABELS for label in stages["spacy"]):
+        needed.append("spacy")
+    if stages["hugging_face"]:
+        needed.append("hugging_face")
+    return needed
 
 
 def recognize_entity(nlp_model, text):
@@ -22,99 +100,267 @@ def recognize_entity(nlp_model, text):
 
 
 def replace_with_black_block_by_indices(text, start, end):
-    # Calculate the length of the substring to be replaced
-    length = end - start
-
     # Replace the substring with black blocks
-    censored_text = text[:start] + ('█' * length) + text[end:]
-    return censored_text
+    return redact_spans(text, [(start, end)])
+
+
+def merge_spans(spans):
+    # Sort (start, end, ...) spans and merge overlapping or touching ones into a list of (start, end) intervals
+    merged = []
+    for span in sorted(spans):
+        start, end = span[0], span[1]
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(end, merged[-1][1])
+        elif start < end:
+            merged.append([start, end])
+    return [(start, end) for start, end in merged]
+
+
+def redact_spans(text, spans):
+    # Build the censored text in a single pass over the merged spans
+    parts = []
+    position = 0
+    for start, end in merge_spans(spans):
+        parts.append(text[position:start])
+        parts.append('█' * (end - start))
+        position = end
+    parts.append(text[position:])
+    return ''.join(parts)
+
+
+def select_spacy_pipes(entities_to_censor):
+    # Keep only the SpaCy components that can produce one of the requested labels
+    pipes = []
+    if any(label in SPACY_RULER_LABELS for label in entities_to_censor):
+        pipes.append("entity_ruler")
+    if any(label in SPACY_NER_LABELS for label in entities_to_censor):
+        pipes.extend(["tok2vec", "entity_ruler", "ner"])
+    return [pipe for pipe in models.get("spacy").pipe_names if pipe in pipes] if pipes else []
+
+
+def spacy_pipes_to_disable(nlp_spacy, pipes):
+    # Components left out of one nlp.pipe call. Passed per call instead of select_pipes, which would change the
+    # pipeline shared by every --threads worker.
+    return [pipe for pipe in nlp_spacy.pipe_names if pipe not in pipes]
+
+
+def split_text_into_chunks(text, max_chunk_chars=SPACY_MAX_CHUNK_CHARS):
+    # Split a large text on paragraph boundaries and yield (offset, chunk) pairs
+    if len(text) <= max_chunk_chars:
+        yield 0, text
+        return
+
+    start = 0
+    while start < len(text):
+        end = start + max_chunk_chars
+        if end < len(text):
+            # Prefer a paragraph break, then any whitespace, so entities are not cut in half
+            split_at = text.rfind("\n\n", start, end)
+            if split_at <= start:
+                split_at = max(text.rfind(" ", start, end), text.rfind("\n", start, end))
+            if split_at > start:
+                end = split_at
+        yield start, text[start:end]
+        start = end
+
+
+def censor_spacy_entities(text, entities, entities_to_censor, stats):
+    # Censor (entity_text, label, start_char, end_char) tuples found by SpaCy
+    spans = []
+    for entity_text, ent_label, ent_start_char, ent_end_char in entities:
+        if ent_label in entities_to_censor:
+            spans.append((ent_start_char, ent_end_char, ent_label))
+
+            # Update stats for output
+            add_stat(stats, ent_label, ent_start_char, ent_end_char, "spacy")
+
+    return redact_spans(text, spans)
+
+
+def censor_with_rules(text, entities_to_censor, stats):
+    # Model-free engine: the phone and date patterns on a tokenizer-only SpaCy pipeline plus the regex registry
+    spans = []
+    if any(label in RULES_RULER_LABELS for label in entities_to_censor):
+        doc = recognize_entity(models.get("rules"), text)
+        spans.extend((ent.start_char, ent.end_char, ent.label_) for ent in doc.ents
+                     if ent.label_ in entities_to_censor)
+
+    regex_labels = {RULES_REGEX_ENTITIES[label]: label for label in entities_to_censor
+                    if label in RULES_REGEX_ENTITIES}
+    if regex_labels:
+        spans.extend((start, end, regex_labels[entity])
+                     for entity, _, start, end in scan_entities(text, list(regex_labels)))
+
+    # The ruler and the regex often find the same entity, count it once
+    spans = merge_entity_spans(spans)
+    for start, end, label in spans:
+        add_stat(stats, label, start, end, "rules")
+
+    return redact_spans(text, spans)
 
 
 def censor_with_spacy(text, entities_to_censor, stats):
+    if "spacy" not in models_for(entities_to_censor):
+        return text
+
     # Process the text with SpaCy
-    doc = recognize_entity(nlp_spacy, text)
+    doc = recognize_entity(models.get("spacy"), text)
 
     # Censor required entities from the entity pool
-    censored_text = text
-    for ent in doc.ents:
-        ent_label = ent.label_
-        entity_text = ent.text
-        if ent_label in entities_to_censor:
-            censored_text = censored_text.replace(entity_text, '█' * len(entity_text))
+    entities = ((ent.text, ent.label_, ent.start_char, ent.end_char) for ent in doc.ents)
+    return censor_spacy_entities(text, entities, entities_to_censor, stats)
 
-            # Update stats for output
-            ent_start_char = ent.start_char
-            ent_end_char = ent.end_char
-            if ent_label in stats:
-                stats[ent_label]['count'] += 1
-                stats[ent_label]['indices'].append((ent_start_char, ent_end_char))
-            else:
-                stats[ent_label] = {'count': 1, 'indices': [(ent_start_char, ent_end_char)]}
 
-    return censored_text
+def censor_batch_with_spacy(texts, entities_to_censor, stats_list, batch_size=SPACY_BATCH_SIZE, n_process=1):
+    # Run many documents (and the chunks of large ones) through a single nlp.pipe call
+    entities_per_text = [[] for _ in texts]
+    pipes = select_spacy_pipes(entities_to_censor)
+    if pipes:
+        nlp_spacy = models.get("spacy")
+        chunks = ((chunk, (text_index, offset))
+                  for text_index, text in enumerate(texts)
+                  for offset, chunk in split_text_into_chunks(text))
+        docs = nlp_spacy.pipe(chunks, as_tuples=True, batch_size=batch_size, n_process=n_process,
+                              disable=spacy_pipes_to_disable(nlp_spacy, pipes))
+        for doc, (text_index, offset) in docs:
+            # Map chunk offsets back to the source document
+            entities_per_text[text_index].extend(
+                (ent.text, ent.label_, ent.start_char + offset, ent.end_char + offset) for ent in doc.ents)
+
+    return [censor_spacy_entities(text, entities, entities_to_censor, stats)
+            for text, entities, stats in zip(texts, entities_per_text, stats_list)]
 
 
 def censor_with_hf(text, entities_to_censor, stats):
-    # Process the text with Hugging face
-    doc = recognize_entity(nlp_hugging_face, text)
+    if "hugging_face" not in models_for(entities_to_censor):
+        return text
+
+    # Same token windows and aggregated spans as the batched engine, so texts longer than the BERT context are
+    # censored in full and the output does not depend on --batch-size
+    return censor_batch_with_hf([text], entities_to_censor, [stats])[0]
+
+
+def split_text_into_token_windows(text, max_tokens=HF_MAX_TOKENS, stride=HF_STRIDE):
+    # Split a text into overlapping (start_char, end_char) windows that fit in the BERT context
+    tokenizer = models.get("hugging_face").tokenizer
+    offsets = tokenizer(text, add_special_tokens=False, return_offsets_mapping=True)["offset_mapping"]
+    if len(offsets) <= max_tokens:
+        return [(0, len(text))]
+
+    windows = []
+    step = max(1, max_tokens - stride)
+    for first_token in range(0, len(offsets), step):
+        last_token = min(first_token + max_tokens, len(offsets)) - 1
+        windows.append((offsets[first_token][0], offsets[last_token][1]))
+        if last_token == len(offsets) - 1:
+            break
+    return windows
 
-    # Convert text to list of characters
-    censored_text_list = list(text)
 
-    for ner in doc:
-        entity_type = ner['entity']
-        if entity_type in entities_to_censor:
-            # Update the count in stats using dict.get for cleaner code
-            stats[entity_type] = stats.get(entity_type, 0) + 1
+def merge_entity_spans(spans):
+    # Merge overlapping (start, end, label) spans found by neighbouring windows
+    merged = []
+    for start, end, label in sorted(spans):
+        if merged and start < merged[-1][1] and label == merged[-1][2]:
+            merged[-1] = (merged[-1][0], max(end, merged[-1][1]), label)
+        else:
+            merged.append((start, end, label))
+    return merged
 
-            start_idx, end_idx = ner['start'], ner['end']
-            # Replace the entire entity with blocks in one operation
-            censored_text_list[start_idx:end_idx] = '█' * (end_idx - start_idx)
 
-            # # Replace characters within the entity with blocks
-            # i = start_idx
-            # while censored_text_list[i].isalpha():
-            #     censored_text_list[i] = '█'
-            #     i += 1
+def censor_batch_with_hf(texts, entities_to_censor, stats_list, batch_size=HF_BATCH_SIZE):
+    # Run the token windows of many texts through Hugging face in fixed-size batches
+    hf_labels = {}
+    for label in entities_to_censor:
+        if label[:2] in ("B-", "I-"):
+            # Aggregated spans carry the bare group name (PER, LOC), report them under the first matching flag
+            hf_labels.setdefault(label[2:], label)
+    spans_per_text = [[] for _ in texts]
+    if hf_labels:
+        windows = [(text_index, start, end)
+                   for text_index, text in enumerate(texts)
+                   for start, end in split_text_into_token_windows(text)]
+        window_texts = [texts[text_index][start:end] for text_index, start, end in windows]
+        nlp_hugging_face = models.get("hugging_face")
+        results = nlp_hugging_face(window_texts, batch_size=batch_size,
+                                   aggregation_strategy=HF_AGGREGATION_STRATEGY) if window_texts else []
+        for (text_index, window_start, _), window_entities in zip(windows, results):
+            for ner in window_entities:
+                if ner['entity_group'] in hf_labels:
+                    # Shift window offsets back into document coordinates
+                    spans_per_text[text_index].append((ner['start'] + window_start, ner['end'] + window_start,
+                                                       hf_labels[ner['entity_group']]))
 
-        # Join the list back into a string and return
-    return ''.join(censored_text_list)
+    censored_texts = []
+    for text, spans, stats in zip(texts, spans_per_text, stats_list):
+        spans = merge_entity_spans(spans)
+        for start, end, entity_type in spans:
+            add_stat(stats, entity_type, start, end, "hugging_face")
+        censored_texts.append(redact_spans(text, spans))
+
+    return censored_texts
 
 
 def check_entity_regex(text, entity):
-    if entity == 'NAME':
-        ent_regex = (r"\b(?:(?:[A-Z][a-z]+,?\s)?[A-Z][a-z]*\.?(?:\s|\s?[A-Z][-])?[A-Z]?[a-z]*\.?|[A-Z][a-z]+(?:[-']["
-                     r"A-Z][a-z]+)?(?:\s[A-Z]\.?\s?[A-Z]?[a-z]*\.?)?)\b")
-    else:
+    # Use the precompiled pattern from the registry
+    ent_regex = get_pattern(entity)
+    if ent_regex is None:
         return []
 
     output = []
-    for match in re.finditer(ent_regex, text):
-        # Extract the matched word
-        matched_word = match.group()
-        # Get the start index of the matched word
-        start_index = match.start()
-        # Calculate the length of the matched word
-        end_index = match.end()
-        # Append the tuple (matched_word, start_index, word_length) to the output list
-        output.append((matched_word, int(start_index), int(end_index)))
+    for match in ent_regex.finditer(text):
+        # Append the tuple (matched_word, start_index, end_index) to the output list
+        output.append((match.group(), match.start(), match.end()))
 
     return output
 
 
-def censor_with_regex(text, entities_to_censor):
-    censored_text = text
+def validate_candidates(candidates):
+    # Map each candidate string to the (label, start_char, end_char) entities SpaCy finds in it
+    validated = {}
+    missing = []
+    with regex_candidate_lock:
+        for candidate in dict.fromkeys(candidates):
+            if candidate in regex_candidate_cache:
+                regex_candidate_cache.move_to_end(candidate)
+                validated[candidate] = regex_candidate_cache[candidate]
+            else:
+                missing.append(candidate)
+
+    if missing:
+        # Parse every uncached candidate in one batched call with only the entity components enabled, outside the
+        # lock so threads do not wait for each other's parse
+        nlp_spacy = models.get("spacy")
+        pipes = select_spacy_pipes(SPACY_RULER_LABELS + SPACY_NER_LABELS)
+        docs = nlp_spacy.pipe(missing, batch_size=SPACY_BATCH_SIZE, disable=spacy_pipes_to_disable(nlp_spacy, pipes))
+        parsed = {candidate: [(ent.label_, ent.start_char, ent.end_char) for ent in doc.ents]
+                  for candidate, doc in zip(missing, docs)}
+        validated.update(parsed)
+        with regex_candidate_lock:
+            regex_candidate_cache.update(parsed)
+            # Evict the least recently used candidates
+            while len(regex_candidate_cache) > REGEX_CANDIDATE_CACHE_SIZE:
+                regex_candidate_cache.popitem(last=False)
+
+    return validated
+
+
+def censor_with_regex(text, entities_to_censor, stats=None):
+    # Name candidates of the regex registry, validated by SpaCy. Given stats, the spans are counted as "regex".
+    spans = []
     if 'PERSON' in entities_to_censor:
         name_regex_list = check_entity_regex(text, 'NAME')
-        for ent in name_regex_list:
-            # Parse with Spacy
-            parsed_word = recognize_entity(nlp_spacy, ent[0])
-            for par_ent in parsed_word.ents:
-                en_label = par_ent.label_
+        validated = validate_candidates(matched_word for matched_word, _, _ in name_regex_list)
+        for matched_word, match_start, _ in name_regex_list:
+            for en_label, ent_start_char, ent_end_char in validated[matched_word]:
                 if en_label in entities_to_censor:
-                    censored_text = censored_text.replace(par_ent.text, '█' * len(par_ent.text))
+                    # Shift the entity offsets from the matched word back into the text
+                    spans.append((match_start + ent_start_char, match_start + ent_end_char, en_label))
 
-    return censored_text
+    if stats is not None:
+        for start, end, label in spans:
+            add_stat(stats, label, start, end, "regex")
+    return redact_spans(text, spans)
 
 
 def write_censored_file(censored_text, output_file_path):
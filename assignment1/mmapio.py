@@ -0,0 +1,86 @@
+import mmap
+import os
+import re
+from contextlib import nullcontext
+
+
+# Largest part of a mapped file decoded and censored at once, files below it are censored as one text
+MMAP_BLOCK_BYTES = 64 * 1024
+PARAGRAPH_BREAK_BYTES = re.compile(rb"\n[ \t]*\n")
+CENSOR_BLOCK = "█"
+
+
+def map_file(file_path):
+    # Read-only memory map of a file, used as a context manager. Its pages come from the page cache on demand
+    # instead of being read into a copy. OSError when the file cannot be opened.
+    with open(file_path, "rb") as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            # An empty file cannot be mapped
+            return nullcontext(b"")
+        return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def find_byte_split_point(data, start, limit):
+    # Prefer a paragraph break, then a line break, then a space, and never cut a UTF-8 character in two
+    for separator in (b"\n\n", b"\n", b" "):
+        split_at = data.rfind(separator, start + (limit - start) // 2, limit)
+        if split_at != -1:
+            return split_at + len(separator)
+    while limit > start and data[limit] & 0xC0 == 0x80:
+        limit -= 1
+    return limit
+
+
+def mapped_blocks(data, start=0, end=None, block_bytes=MMAP_BLOCK_BYTES):
+    # (start, end) byte ranges of at most block_bytes that cover data[start:end], cut between paragraphs when possible
+    end = len(data) if end is None else end
+    blocks = []
+    while end - start > block_bytes:
+        limit = start + block_bytes
+        split_at = None
+        for match in PARAGRAPH_BREAK_BYTES.finditer(data, start + block_bytes // 2, limit):
+            split_at = match.end()
+        if split_at is None:
+            split_at = find_byte_split_point(data, start, limit)
+        blocks.append((start, split_at))
+        start = split_at
+    if start < end:
+        blocks.append((start, end))
+    return blocks
+
+
+def byte_spans(text, spans, offset=0):
+    # (start, end) byte offsets of the UTF-8 encoding of text for (start, end) character spans in increasing order
+    if text.isascii():
+        return [(start + offset, end + offset) for start, end in spans]
+    result = []
+    position = 0
+    byte_position = offset
+    for start, end in spans:
+        byte_start = byte_position + len(text[position:start].encode("utf-8"))
+        byte_end = byte_start + len(text[start:end].encode("utf-8"))
+        result.append((byte_start, byte_end))
+        position, byte_position = end, byte_end
+    return result
+
+
+def write_patched(data, output_file_path, patches):
+    # Copy data to the output file with every (start, end) byte range replaced by one black block per character.
+    # The unchanged ranges are written straight from the map, only the redacted ones are built in memory.
+    view = memoryview(data)
+    try:
+        with open(output_file_path, "wb") as file:
+            position = 0
+            for start, end in sorted(patches):
+                if start < position:
+                    # Overlaps a range already redacted
+                    start = position
+                if start >= end:
+                    continue
+                file.write(view[position:start])
+                redacted = bytes(view[start:end]).decode("utf-8", errors="replace")
+                file.write((CENSOR_BLOCK * len(redacted)).encode("utf-8"))
+                position = end
+            file.write(view[position:])
+    finally:
+        view.release()
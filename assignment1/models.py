@@ -0,0 +1,141 @@
+from contextlib import contextmanager
+from functools import partial
+from pathlib import Path
+import os
+import sys
+import threading
+from assignment1.utils import phone_patterns, date_patterns, HF_BACKENDS
+
+
+SPACY_MODEL_NAME = "en_core_web_md"
+HF_MODEL_NAME = "dslim/bert-base-NER"
+# The ONNX export of the Hugging face model is done once and reused by later runs
+ONNX_CACHE_DIR = Path.home() / ".cache" / "censoror" / "onnx"
+
+
+def load_spacy_model():
+    # Load SpaCy model and extend it with the phone and date patterns
+    import spacy
+
+    nlp_spacy = spacy.load(SPACY_MODEL_NAME)
+    ruler = nlp_spacy.add_pipe("entity_ruler", before="ner")
+    ruler.add_patterns(phone_patterns)
+    ruler.add_patterns(date_patterns)
+    return nlp_spacy
+
+
+def load_rules_model():
+    # Tokenizer-only SpaCy pipeline with the phone and date patterns, no statistical model is loaded
+    import spacy
+
+    nlp_rules = spacy.blank("en")
+    ruler = nlp_rules.add_pipe("entity_ruler")
+    ruler.add_patterns(phone_patterns)
+    ruler.add_patterns(date_patterns)
+    return nlp_rules
+
+
+def load_hugging_face_model(backend="torch"):
+    # Load Hugging face model, the pipeline keeps a reference to its tokenizer
+    from transformers import AutoTokenizer, AutoModelForTokenClassification, pipeline
+
+    if backend not in HF_BACKENDS:
+        raise ValueError(f"Unknown Hugging face backend {backend}, use one of {', '.join(HF_BACKENDS)}")
+
+    tokenizer = AutoTokenizer.from_pretrained(HF_MODEL_NAME)
+    if backend == "onnx":
+        model = load_onnx_model()
+    else:
+        model = AutoModelForTokenClassification.from_pretrained(HF_MODEL_NAME)
+        if backend == "quantized":
+            # int8 weights for the Linear layers, activations are quantized on the fly on CPU
+            import torch
+
+            model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return pipeline("ner", model=model, tokenizer=tokenizer)
+
+
+def load_onnx_model():
+    # Export the Hugging face model to ONNX on first use and run it with ONNX Runtime
+    try:
+        from optimum.onnxruntime import ORTModelForTokenClassification
+    except ImportError as e:
+        raise ImportError("The onnx backend needs the optimum[onnxruntime] package") from e
+
+    export_dir = ONNX_CACHE_DIR / HF_MODEL_NAME.replace("/", "--")
+    if (export_dir / "model.onnx").exists():
+        return ORTModelForTokenClassification.from_pretrained(export_dir)
+    model = ORTModelForTokenClassification.from_pretrained(HF_MODEL_NAME, export=True)
+    model.save_pretrained(export_dir)
+    return model
+
+
+class ModelRegistry:
+    # Loads each model the first time it is requested and keeps it for the rest of the run
+
+    def __init__(self):
+        self.loaders = {}
+        self.loaded = {}
+        self.lock = threading.Lock()
+
+    def register(self, name, loader):
+        # A new loader replaces the model loaded by the previous one
+        with self.lock:
+            self.loaders[name] = loader
+            self.loaded.pop(name, None)
+
+    def get(self, name):
+        if name not in self.loaded:
+            # Threads that ask for a model at the same time share one load of it
+            with self.lock:
+                if name not in self.loaded:
+                    self.loaded[name] = self.loaders[name]()
+        return self.loaded[name]
+
+    def is_loaded(self, name):
+        return name in self.loaded
+
+    def warmup(self, names):
+        # Preload the given models, e.g. before the first file or in a fresh worker process
+        for name in names:
+            self.get(name)
+
+
+models = ModelRegistry()
+models.register("rules", load_rules_model)
+models.register("spacy", load_spacy_model)
+models.register("hugging_face", load_hugging_face_model)
+
+# Backend of the Hugging face model for the current run
+hf_backend = "torch"
+
+
+def use_hf_backend(backend):
+    global hf_backend
+    if backend == hf_backend:
+        return
+    if backend not in HF_BACKENDS:
+        raise ValueError(f"Unknown Hugging face backend {backend}, use one of {', '.join(HF_BACKENDS)}")
+    hf_backend = backend
+    models.register("hugging_face", partial(load_hugging_face_model, backend))
+
+
+def torch_threads_per_worker(threads):
+    # Split the cores between the worker threads, each matmul of a thread then runs on its share of them
+    return max(1, (os.cpu_count() or 1) // max(1, threads))
+
+
+@contextmanager
+def torch_threads(count):
+    # Intra-op threads of torch while the block runs. torch keeps one pool for the whole process, so the setting
+    # applies to every thread. Nothing to tune when torch was never imported, e.g. with the rules engine.
+    torch = sys.modules.get("torch")
+    if torch is None:
+        yield
+        return
+    previous = torch.get_num_threads()
+    torch.set_num_threads(count)
+    try:
+        yield
+    finally:
+        torch.set_num_threads(previous)
@@ -0,0 +1,84 @@
+import re
+from assignment1 import gazetteer
+from assignment1.gazetteer import starts_sentence
+from assignment1.instrumentation import metrics
+
+
+# Segments scoring below the threshold skip every censoring stage
+PREFILTER_THRESHOLD = 2
+PREFILTER_THRESHOLDS = [1, 2, 3, 4]
+
+CAPITALIZED_WORD = re.compile(r"\b[A-Z][\w'-]*")
+DIGITS = re.compile(r"\d+")
+# Words that hint at a place even in lower case, e.g. "our office in houston on main street"
+LOCATION_CUES = re.compile(r"\b(?:street|st|avenue|ave|road|rd|boulevard|blvd|drive|dr|lane|ln|suite|floor|"
+                           r"building|city|county|state|office|downtown|north|south|east|west)\b", re.IGNORECASE)
+# Capitalized words at the start of a sentence that are almost never a name or a place
+COMMON_STARTERS = {
+    "A", "After", "All", "Also", "An", "And", "Any", "Are", "As", "At", "Attached", "Based", "Before", "Best",
+    "But", "By", "Call", "Can", "Could", "Dear", "Did", "Do", "Does", "For", "Forward", "From", "Good", "Great",
+    "Have", "He", "Hello", "Her", "Here", "Hi", "His", "How", "I", "If", "In", "Is", "It", "Its", "Just", "Let",
+    "Looks", "My", "No", "Not", "Note", "Now", "Of", "Ok", "On", "Once", "One", "Or", "Our", "Please", "Regards",
+    "See", "Send", "She", "Since", "So", "Some", "Sorry", "Sounds", "Thank", "Thanks", "That", "The", "Their",
+    "Then", "There", "These", "They", "This", "To", "We", "What", "When", "Where", "Which", "Who", "Why", "Will",
+    "With", "Would", "Yes", "You", "Your",
+}
+# Any of these makes a segment a candidate on its own
+DIGIT_SCORE = PREFILTER_THRESHOLDS[-1]
+GAZETTEER_SCORE = PREFILTER_THRESHOLDS[-1]
+
+
+def segment_score(text, entities_to_censor=None):
+    # Lexical cues that an entity may be in the segment: capitalized words, digit shapes, location words and
+    # known entities. A capitalized word inside a sentence counts 2, one that starts a sentence 1, unless it is a
+    # common sentence starter. The pronoun "I" never counts.
+    score = 0
+    for match in CAPITALIZED_WORD.finditer(text):
+        word = match.group()
+        if word == "I" or word.startswith("I'"):
+            continue
+        if not starts_sentence(text, match.start()):
+            score += 2
+        elif word not in COMMON_STARTERS:
+            score += 1
+    if DIGITS.search(text):
+        score += DIGIT_SCORE
+    score += len(LOCATION_CUES.findall(text))
+    if gazetteer.active is not None and gazetteer.active.find(text, entities_to_censor or []):
+        score += GAZETTEER_SCORE
+    return score
+
+
+class Prefilter:
+    # Keeps only the segments whose lexical score reaches the threshold, the others are left as they are
+
+    def __init__(self, threshold=PREFILTER_THRESHOLD):
+        self.threshold = threshold
+
+    def fingerprint(self):
+        return f"prefilter={self.threshold}"
+
+    def is_candidate(self, text, entities_to_censor=None):
+        candidate = segment_score(text, entities_to_censor) >= self.threshold
+        # A skipped segment is a lookup answered without the models
+        metrics.count("prefilter_lookups")
+        metrics.count("prefilter_chars_lookups", len(text))
+        if not candidate:
+            metrics.count("prefilter_hits")
+            metrics.count("prefilter_chars_hits", len(text))
+        return candidate
+
+    def candidates(self, text, segments, entities_to_censor=None):
+        # (start, end) of the segments of text that still need to be censored
+        return [(start, end) for start, end in segments
+                if self.is_candidate(text[start:end], entities_to_censor)]
+
+
+# Prefilter of the current run, None when every segment is censored
+active = None
+
+
+def use_prefilter(prefilter):
+    global active
+    active = prefilter
+    return prefilter
@@ -0,0 +1,88 @@
+import re
+
+MONTH = (r"(?:Jan(?:uary)?|Feb(?:ruary)?|Mar(?:ch)?|Apr(?:il)?|May|June?|July?|Aug(?:ust)?|Sep(?:t(?:ember)?)?"
+         r"|Oct(?:ober)?|Nov(?:ember)?|Dec(?:ember)?)")
+
+# Raw patterns for every entity that can be detected with a regular expression alone.
+# Order is priority: where the matches of two entities overlap, the one registered first wins,
+# so the most specific patterns come first and the broad NAME pattern comes last.
+default_patterns = {
+    # Format: jane.doe@enron.com
+    "EMAIL": r"\b[\w.+-]+@[\w-]+(?:\.[\w-]+)+\b",
+    # Format: 123-456-7890, (123) 456-7890, +1 123-456-7890, 1-123-456-7890, 123.456.7890, 123 456 7890
+    "PHONE": r"(?:\+1[-.\s]?|\b1[-.\s])?(?:\(\d{3}\)|\b\d{3})[-.\s]?\d{3}[-.\s]\d{4}\b",
+    # Format: 05/03/2001, 10/11/01, 12.02.2001, Jan 18, 2001, Dec. 15, February 12, 14 May 2001
+    "DATE": (r"\b(?:\d{1,2}[/.-]\d{1,2}[/.-](?:\d{4}|\d{2})"
+             rf"|{MONTH}\.?\s\d{{1,2}}(?:,\s\d{{4}})?"
+             rf"|\d{{1,2}}\s{MONTH}\.?,?\s\d{{4}})\b"),
+    # Format: 1400 Smith Street, 55 Main St.
+    "ADDRESS": (r"\b\d{1,6}\s(?:[A-Z][a-z]+\s){1,3}"
+                r"(?:Street|St|Avenue|Ave|Road|Rd|Boulevard|Blvd|Drive|Dr|Lane|Ln|Way|Court|Ct|Place|Pl)\b\.?"),
+    # Format: Bill Christensen, Mr. Moore, John E. Moore
+    "NAME": (r"\b(?:(?:[A-Z][a-z]+,?\s)?[A-Z][a-z]*\.?(?:\s|\s?[A-Z][-])?[A-Z]?[a-z]*\.?|[A-Z][a-z]+(?:[-']["
+             r"A-Z][a-z]+)?(?:\s[A-Z]\.?\s?[A-Z]?[a-z]*\.?)?)(?<!\s)\b"),
+}
+
+# Precompiled patterns keyed by entity, in priority order
+compiled_patterns = {}
+
+
+def register_pattern(entity, pattern, before=None):
+    # Add or replace an entity pattern at runtime, optionally placing it before another entity in the priority order
+    compiled = re.compile(pattern)
+    if compiled.groupindex:
+        raise ValueError(f"Pattern for {entity} must not define named groups")
+
+    compiled_patterns.pop(entity, None)
+    if before in compiled_patterns:
+        items = list(compiled_patterns.items())
+        index = [name for name, _ in items].index(before)
+        items.insert(index, (entity, compiled))
+        compiled_patterns.clear()
+        compiled_patterns.update(items)
+    else:
+        compiled_patterns[entity] = compiled
+
+    return compiled
+
+
+def get_pattern(entity):
+    # Precompiled pattern for one entity, or None if it is not registered
+    return compiled_patterns.get(entity)
+
+
+def scan_entities(text, entities=None):
+    # One finditer pass per registered entity, or per requested one, in priority order. A match that overlaps one of
+    # an entity with a higher priority is dropped, so the broad NAME pattern never swallows a date or a phone behind
+    # a capitalized word. A single alternation would not do that: its first alternative that matches at a position
+    # wins, wherever it sits in the list. Returns (entity, matched_word, start, end) tuples in text order.
+    output = []
+    # Sorted (start, end) spans of the kept matches, they never overlap
+    taken = []
+    for entity, pattern in compiled_patterns.items():
+        if entities is not None and entity not in entities:
+            continue
+        kept = []
+        position = 0
+        for match in pattern.finditer(text):
+            start, end = match.span()
+            # The matches come in text order, so the first taken span that ends after this start only moves forward
+            while position < len(taken) and taken[position][1] <= start:
+                position += 1
+            if position < len(taken) and taken[position][0] < end:
+                continue
+            kept.append((start, end))
+            output.append((entity, match.group(), start, end))
+        taken = sorted(taken + kept) if taken else kept
+    output.sort(key=lambda item: item[2])
+    return output
+
+
+def reset_patterns():
+    # Restore the default registry
+    compiled_patterns.clear()
+    for entity, pattern in default_patterns.items():
+        compiled_patterns[entity] = re.compile(pattern)
+
+
+reset_patterns()
@@ -0,0 +1,192 @@
+import json
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from assignment1.stats import without_engines
+
+
+SERVER_HOST = "127.0.0.1"
+SERVER_PORT = 8000
+# Requests censored together in one call of the models
+SERVER_MAX_BATCH = 16
+# How long the first request of a batch waits for others to join it
+SERVER_BATCH_WINDOW_SECONDS = 0.01
+# Requests accepted at the same time, the next ones are answered with 503
+SERVER_MAX_CONCURRENCY = 64
+SERVER_MAX_BODY_BYTES = 10 * 1024 * 1024
+
+
+class MicroBatcher:
+    # Collects the requests that arrive within a short window and censors them with one call on a single model thread.
+    # censor_batch(texts, entities_to_censor, engine) returns (censored_text, stats) for every text.
+
+    def __init__(self, censor_batch, max_batch=SERVER_MAX_BATCH, window_seconds=SERVER_BATCH_WINDOW_SECONDS):
+        self.censor_batch = censor_batch
+        self.max_batch = max(1, max_batch)
+        self.window_seconds = window_seconds
+        self.requests = queue.Queue()
+        self.thread = threading.Thread(target=self.run, name="censor-batcher", daemon=True)
+        self.thread.start()
+
+    def submit(self, text, entities_to_censor, engine=None):
+        # Future of (censored_text, stats, batch_size) for one text
+        future = Future()
+        self.requests.put((text, entities_to_censor, engine, future))
+        return future
+
+    def next_batch(self):
+        # Block for the first request, then take the ones arriving within the window, None once closed
+        first = self.requests.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.monotonic() + self.window_seconds
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                request = self.requests.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if request is None:
+                # Finish this batch, then stop
+                self.requests.put(None)
+                break
+            batch.append(request)
+        return batch
+
+    def run(self):
+        while True:
+            batch = self.next_batch()
+            if batch is None:
+                return
+
+            # Requests with other flags or another engine need their own model call
+            groups = {}
+            for text, entities_to_censor, engine, future in batch:
+                groups.setdefault((tuple(entities_to_censor), engine), []).append((text, future))
+            for (entities_to_censor, engine), requests in groups.items():
+                try:
+                    results = self.censor_batch([text for text, _ in requests], list(entities_to_censor), engine)
+                except Exception as e:
+                    for _, future in requests:
+                        future.set_exception(e)
+                    continue
+                for (_, future), (censored_text, stats) in zip(requests, results):
+                    future.set_result((censored_text, stats, len(requests)))
+
+    def close(self):
+        self.requests.put(None)
+        self.thread.join()
+
+
+class CensorRequestHandler(BaseHTTPRequestHandler):
+    # POST /censor with a JSON body, the server's parse_request turns it into (text, entities_to_censor, engine)
+
+    def do_GET(self):
+        if self.path == "/health":
+            self.send_json(200, {'status': 'ok'})
+        else:
+            self.send_json(404, {'error': f"Unknown path {self.path}"})
+
+    def do_POST(self):
+        started = time.perf_counter()
+        if self.path != "/censor":
+            self.send_json(404, {'error': f"Unknown path {self.path}"})
+            return
+
+        try:
+            text, entities_to_censor, engine = self.read_request()
+        except ValueError as e:
+            self.send_json(400, {'error': str(e)})
+            return
+
+        if not self.server.slots.acquire(blocking=False):
+            self.send_json(503, {'error': "Too many concurrent requests"}, {'Retry-After': "1"})
+            return
+        try:
+            censored_text, stats, batch_size = self.server.batcher.submit(text, entities_to_censor, engine).result()
+        except Exception as e:
+            self.send_json(500, {'error': str(e)})
+            return
+        finally:
+            self.server.slots.release()
+
+        latency_ms = round((time.perf_counter() - started) * 1000, 3)
+        self.send_json(200, {'censored_text': censored_text, 'stats': without_engines(stats),
+                             'batch_size': batch_size, 'latency_ms': latency_ms}, {'X-Latency-Ms': str(latency_ms)})
+        self.log_message("censored %d characters in %.3f ms, batch of %d", len(text), latency_ms, batch_size)
+
+    def read_request(self):
+        # (text, entities_to_censor, engine) of the request body, ValueError when it is not valid
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+        except ValueError:
+            raise ValueError("Content-Length must be an integer")
+        if length < 0:
+            # rfile.read(-1) would wait for the client to close the connection
+            raise ValueError("Content-Length must not be negative")
+        if length > SERVER_MAX_BODY_BYTES:
+            raise ValueError(f"Request body larger than {SERVER_MAX_BODY_BYTES} bytes")
+        try:
+            body = json.loads(self.rfile.read(length).decode("utf-8"))
+        except (UnicodeDecodeError, json.JSONDecodeError) as e:
+            raise ValueError(f"Invalid JSON body: {e}")
+        if not isinstance(body, dict):
+            raise ValueError("The body must be a JSON object")
+        return self.server.parse_request(body)
+
+    def send_json(self, status, content, headers=None):
+        body = json.dumps(content).encode("utf-8")
+        self.send_response(status)
+        self.send_header('Content-Type', "application/json")
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_request(self, code='-', size='-'):
+        # Censor requests log their latency instead of the access log line
+        pass
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            sys.stderr.write(f"{self.address_string()} {self.command} {self.path} {format % args}\n")
+
+
+class CensorServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, batcher, parse_request, max_concurrency=SERVER_MAX_CONCURRENCY, verbose=True):
+        super().__init__(address, CensorRequestHandler)
+        self.batcher = batcher
+        self.parse_request = parse_request
+        self.slots = threading.BoundedSemaphore(max(1, max_concurrency))
+        self.verbose = verbose
+
+    def server_close(self):
+        super().server_close()
+        self.batcher.close()
+
+
+def create_server(censor_batch, parse_request, host=SERVER_HOST, port=SERVER_PORT, max_batch=SERVER_MAX_BATCH,
+                  window_seconds=SERVER_BATCH_WINDOW_SECONDS, max_concurrency=SERVER_MAX_CONCURRENCY, verbose=True):
+    # parse_request(body) returns (text, entities_to_censor, engine) or raises ValueError for a bad request.
+    # Port 0 picks a free port, server.server_address has the one in use
+    return CensorServer((host, port), MicroBatcher(censor_batch, max_batch, window_seconds), parse_request,
+                        max_concurrency, verbose)
+
+
+def serve(server):
+    print(f"Censoring on http://{server.server_address[0]}:{server.server_address[1]}/censor")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
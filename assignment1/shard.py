@@ -0,0 +1,181 @@
+import json
+import os
+import re
+from collections import Counter
+from glob import glob
+from pathlib import Path
+from assignment1.stats import stats_from_json
+
+
+SHARD_MANIFEST_VERSION = 1
+# Journal of every shard, kept in the output directory shared by the shards
+SHARD_MANIFEST_NAME = ".censoror-shard-{index}-of-{count}.jsonl"
+SHARD_MANIFEST_GLOB = ".censoror-shard-*-of-*.jsonl"
+SHARD_SPEC = re.compile(r"^(\d+)/(\d+)$")
+
+
+def parse_shard(value):
+    # "i/N" of the --shard option, shards are numbered from 1 to N
+    match = SHARD_SPEC.match(value.strip())
+    if match is None:
+        raise ValueError(f"Invalid shard {value}, use i/N, e.g. 1/4")
+    index, count = int(match.group(1)), int(match.group(2))
+    if not 1 <= index <= count:
+        raise ValueError(f"Invalid shard {value}, i must be between 1 and N")
+    return index, count
+
+
+def shard_files(file_paths, index, count):
+    # Every count-th file of the sorted list, starting at the index-th one. Every node that sees the same input
+    # gets the same split, whatever order its glob returns.
+    return sorted(file_paths)[index - 1::count]
+
+
+def manifest_path(output_dir, index, count):
+    return Path(output_dir) / SHARD_MANIFEST_NAME.format(index=index, count=count)
+
+
+class ShardManifest:
+    # Append-only journal of the files a shard has censored: a header line, then one JSON line with the censored file
+    # and its stats for every file, written and synced once the censored file is written. A line cut by a crash is
+    # dropped when the journal is loaded, so a file is either fully recorded or censored again.
+    # A last {"complete": true} line marks a shard that censored all of its files. Only the names of the censored
+    # files are kept in memory, their stats stay in the journal until merge_manifests reads them.
+
+    def __init__(self, path, index, count, settings=None):
+        self.path = Path(path)
+        self.index = index
+        self.count = count
+        self.settings = settings or {}
+        self.completed = set()
+        self.complete = False
+        self.journal = None
+
+    def header(self):
+        return {'version': SHARD_MANIFEST_VERSION, 'shard': [self.index, self.count], 'settings': self.settings}
+
+    def load(self):
+        # Files recorded by earlier runs of this shard, a missing journal means nothing was censored yet
+        if not self.path.exists():
+            return self
+        header, records, complete, valid_bytes = read_journal(self.path)
+        # Drop a line cut by a crash before new records are appended after it
+        if valid_bytes < self.path.stat().st_size:
+            os.truncate(self.path, valid_bytes)
+        if header is None:
+            return self
+        if header.get('shard') != [self.index, self.count]:
+            raise ValueError(f"{self.path} belongs to shard {header.get('shard')}, not {self.index}/{self.count}")
+        if header.get('settings') != self.settings:
+            raise ValueError(f"{self.path} was written with other flags, remove it or use another output directory")
+        self.completed = set(records)
+        self.complete = complete
+        return self
+
+    def done(self, censored_file_path):
+        return str(censored_file_path) in self.completed
+
+    def record(self, censored_file_path, stats):
+        self.completed.add(str(censored_file_path))
+        self.complete = False
+        self.append({'file': str(censored_file_path), 'stats': stats})
+
+    def finish(self):
+        # Mark the shard as complete once every one of its files is censored
+        if not self.complete:
+            self.complete = True
+            self.append({'complete': True})
+
+    def append(self, content):
+        # One write of a whole line, synced so the record survives a crash of the node
+        if self.journal is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            new = not self.path.exists() or self.path.stat().st_size == 0
+            self.journal = open(self.path, "a", encoding="utf-8")
+            if new:
+                self.journal.write(json.dumps(self.header()) + "\n")
+        self.journal.write(json.dumps(content) + "\n")
+        self.journal.flush()
+        os.fsync(self.journal.fileno())
+
+    def close(self):
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+
+
+def journal_lines(path):
+    # Content and end offset of every whole JSON line of a journal, a line cut by a crash ends it
+    offset = 0
+    with open(path, "rb") as file:
+        for line in file:
+            if not line.endswith(b"\n"):
+                return
+            try:
+                content = json.loads(line)
+            except json.JSONDecodeError:
+                return
+            offset += len(line)
+            yield content, offset
+
+
+def read_journal(path):
+    # Header, number of records of every censored file, completion and byte length of the whole lines of a journal.
+    # The stats are not kept, journal_records reads them when they are needed.
+    header = None
+    records = Counter()
+    complete = False
+    valid_bytes = 0
+    for content, valid_bytes in journal_lines(path):
+        if header is None:
+            header = content
+        elif content.get('complete'):
+            complete = True
+        else:
+            complete = False
+            records[content['file']] += 1
+    return header, records, complete, valid_bytes
+
+
+def journal_records(path):
+    # Censored file and stats of every record of a journal, one at a time
+    for content, _ in journal_lines(path):
+        if 'file' in content:
+            yield content['file'], stats_from_json(content['stats'])
+
+
+def find_manifests(output_dir):
+    return sorted(glob(str(Path(output_dir) / SHARD_MANIFEST_GLOB)))
+
+
+def merge_manifests(manifest_paths, stats_collector):
+    # Add the records of every shard journal to stats_collector, shard by shard. The journals are read once for the
+    # headers and the file names, then streamed record by record into stats_collector.
+    # Returns the shards of the split that are missing or not complete, an empty list when the run is complete.
+    journals = {}
+    finished = set()
+    for path in manifest_paths:
+        header, records, complete, _ = read_journal(path)
+        if header is None:
+            continue
+        index, count = header['shard']
+        journals[(index, count)] = (path, records)
+        if complete:
+            finished.add((index, count))
+
+    counts = {count for _, count in journals}
+    if not counts:
+        raise ValueError("No shard journal found")
+    if len(counts) > 1:
+        raise ValueError(f"Journals of several splits ({', '.join(map(str, sorted(counts)))} shards), "
+                         f"merge them separately")
+
+    for _, (path, records) in sorted(journals.items()):
+        for censored_file_path, stats in journal_records(path):
+            # A file censored again by a later run of the shard is counted once, with its last stats
+            records[censored_file_path] -= 1
+            if records[censored_file_path] == 0:
+                stats_collector.add(censored_file_path, stats)
+
+    count = counts.pop()
+    return [index for index in range(1, count + 1) if (index, count) not in finished]
@@ -0,0 +1,208 @@
+import csv
+import sys
+from array import array
+from pathlib import Path
+from assignment1.stats import NO_ENGINE, SPAN_ENGINES, normalize_stats, span_engine_ids
+
+
+SPANS_FORMATS = ["parquet", "arrow", "csv"]
+SPANS_SUFFIXES = {".parquet": "parquet", ".arrow": "arrow", ".feather": "arrow", ".ipc": "arrow"}
+SPANS_COLUMNS = ["file", "label", "engine", "start", "end"]
+# Array type code of every column, a run has only a handful of engines so their ids take one byte
+SPANS_COLUMN_TYPES = {'file': 'i', 'label': 'i', 'engine': 'b', 'start': 'i', 'end': 'i'}
+# Spans buffered before they are written as one Parquet row group or Arrow record batch
+SPANS_BATCH_ROWS = 65536
+SPANS_BUFFER_BYTES = 1024 * 1024
+
+
+class CompactSpans:
+    # Stats of one document in a single int32 array: the count of every label, then the start, end and label id of
+    # every span. The engine id of every span sits in a parallel array of one byte per span. Two arrays instead of
+    # one tuple per span and one list and dict per label.
+    __slots__ = ("labels", "data", "engines")
+
+    # Documents with the same labels share one tuple of label names
+    label_sets = {}
+
+    def __init__(self, labels=(), data=None, engines=None):
+        self.labels = self.label_sets.setdefault(labels, labels)
+        self.data = data if data is not None else array('i')
+        self.engines = engines if engines is not None else array('b')
+
+    @classmethod
+    def from_stats(cls, stats):
+        stats = normalize_stats(stats)
+        data = array('i', [value['count'] for value in stats.values()])
+        engines = array('b')
+        for label_id, value in enumerate(stats.values()):
+            for start, end in value['indices']:
+                data.extend((start, end, label_id))
+            engines.extend(span_engine_ids(value))
+        return cls(tuple(stats), data, engines)
+
+    def to_stats(self):
+        # A new stats dict in the {'count', 'indices'} schema, with the labels in their original order
+        stats = {label: {'count': count, 'indices': []} for label, count in zip(self.labels, self.data)}
+        spans = iter(self.data[len(self.labels):])
+        for (start, end, label_id), engine_id in zip(zip(spans, spans, spans), self.engines):
+            value = stats[self.labels[label_id]]
+            value['indices'].append((start, end))
+            if engine_id != NO_ENGINE or 'engines' in value:
+                value.setdefault('engines', [NO_ENGINE] * (len(value['indices']) - 1)).append(engine_id)
+        return stats
+
+    def __len__(self):
+        return len(self.engines)
+
+    def nbytes(self):
+        return self.data.itemsize * len(self.data) + self.engines.itemsize * len(self.engines)
+
+
+class SpanTable:
+    # Spans of many documents as int32 columns, int8 for the engine. File names, labels and engines are kept once in
+    # lookup lists and every span refers to them by id.
+
+    def __init__(self):
+        self.names = {'file': [], 'label': [], 'engine': []}
+        self.ids = {'file': {}, 'label': {}, 'engine': {}}
+        self.columns = {column: array(SPANS_COLUMN_TYPES[column]) for column in SPANS_COLUMNS}
+
+    def intern(self, column, value):
+        ids = self.ids[column]
+        if value not in ids:
+            ids[value] = len(self.names[column])
+            self.names[column].append(value)
+        return ids[value]
+
+    def add(self, file_name, stats, engines=None):
+        # Every span carries the engine that censored it. engines maps every label to the engine that censors it,
+        # for the spans recorded without one, e.g. by a cache entry or a shard journal of an older run.
+        file_id = self.intern('file', file_name)
+        for label, value in normalize_stats(stats).items():
+            if not value['indices']:
+                continue
+            label_id = self.intern('label', label)
+            label_engine = (engines or {}).get(label, "")
+            for (start, end), engine_id in zip(value['indices'], span_engine_ids(value)):
+                engine = label_engine if engine_id == NO_ENGINE else SPAN_ENGINES[engine_id]
+                self.columns['file'].append(file_id)
+                self.columns['label'].append(label_id)
+                self.columns['engine'].append(self.intern('engine', engine))
+                self.columns['start'].append(start)
+                self.columns['end'].append(end)
+
+    def rows(self):
+        # (file, label, engine, start, end) of every span
+        files, labels, engines = self.names['file'], self.names['label'], self.names['engine']
+        for file_id, label_id, engine_id, start, end in zip(*(self.columns[column] for column in SPANS_COLUMNS)):
+            yield files[file_id], labels[label_id], engines[engine_id], start, end
+
+    def to_arrow(self):
+        # Arrow record batch of the table, the integer columns are handed over without a copy
+        import pyarrow as pa
+        arrays = []
+        for column in SPANS_COLUMNS:
+            column_type = pa.int8() if SPANS_COLUMN_TYPES[column] == 'b' else pa.int32()
+            ids = pa.Array.from_buffers(column_type, len(self), [None, pa.py_buffer(self.columns[column])])
+            if column in self.names:
+                arrays.append(pa.array(self.names[column], pa.string()).take(ids))
+            else:
+                arrays.append(ids)
+        return pa.RecordBatch.from_arrays(arrays, names=SPANS_COLUMNS)
+
+    def __len__(self):
+        return len(self.columns['start'])
+
+    def nbytes(self):
+        return sum(column.itemsize * len(column) for column in self.columns.values())
+
+
+def spans_format_of(path, spans_format=None):
+    # The given format, or the one of the file extension, CSV for any other extension
+    return spans_format or SPANS_SUFFIXES.get(Path(path).suffix.lower(), "csv")
+
+
+class SpanWriter:
+    # Streams every censored span of a run to a Parquet, Arrow IPC or CSV file, in batches of SPANS_BATCH_ROWS spans.
+    # Parquet and Arrow need the optional pyarrow package, without it the spans are written as CSV next to the
+    # requested path.
+
+    def __init__(self, path, spans_format=None, engines=None, batch_rows=SPANS_BATCH_ROWS):
+        self.path = Path(path)
+        self.spans_format = spans_format_of(path, spans_format)
+        if self.spans_format not in SPANS_FORMATS:
+            raise ValueError(f"Unknown spans format {self.spans_format}, use one of {', '.join(SPANS_FORMATS)}")
+        self.engines = engines or {}
+        self.batch_rows = batch_rows
+        self.table = SpanTable()
+        self.spans = 0
+        self.sink = None
+        self.writer = None
+        self.closed = False
+        self.open_sink()
+
+    def open_sink(self):
+        if self.spans_format != "csv":
+            try:
+                import pyarrow
+            except ImportError:
+                self.path = self.path.with_suffix(".csv")
+                self.spans_format = "csv"
+                print(f"pyarrow is not installed, writing the spans as CSV to {self.path}", file=sys.stderr)
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if self.spans_format == "csv":
+            self.sink = open(self.path, "w", encoding="utf-8", newline="", buffering=SPANS_BUFFER_BYTES)
+            self.writer = csv.writer(self.sink, lineterminator="\n")
+            self.writer.writerow(SPANS_COLUMNS)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def add(self, file_name, stats):
+        self.table.add(file_name, stats, self.engines)
+        if len(self.table) >= self.batch_rows:
+            self.flush()
+
+    def flush(self):
+        if not len(self.table):
+            return
+        self.spans += len(self.table)
+        if self.spans_format == "csv":
+            self.writer.writerows(self.table.rows())
+        else:
+            self.write_batch(self.table.to_arrow())
+        # A new table, pyarrow may still hold the buffers of the old one
+        self.table = SpanTable()
+
+    def write_batch(self, batch):
+        if self.writer is None:
+            if self.spans_format == "parquet":
+                import pyarrow.parquet as pq
+                self.writer = pq.ParquetWriter(self.path, batch.schema)
+            else:
+                import pyarrow as pa
+                self.writer = pa.ipc.new_file(self.path, batch.schema)
+        if self.spans_format == "parquet":
+            self.writer.write_batch(batch)
+        else:
+            self.writer.write(batch)
+
+    def close(self):
+        if self.closed:
+            return
+        self.flush()
+        if self.spans_format == "csv":
+            self.sink.close()
+            self.sink = None
+        elif self.writer is None:
+            # No span at all, still write a valid empty file
+            self.write_batch(SpanTable().to_arrow())
+            self.writer.close()
+        else:
+            self.writer.close()
+        self.writer = None
+        self.closed = True
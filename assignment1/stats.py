@@ -0,0 +1,164 @@
+import csv
+import json
+import sys
+
+
+STATS_FORMATS = ["text", "jsonl", "csv"]
+# Buffer of the stats file, records are flushed in blocks instead of one write per document
+STATS_BUFFER_BYTES = 1024 * 1024
+
+
+# Engines that censor spans. The 'engines' list of a stats entry runs parallel to 'indices' and holds the small id of
+# the engine of every span, its index in SPAN_ENGINES, or NO_ENGINE for a span recorded without one.
+SPAN_ENGINES = ("rules", "spacy", "hugging_face", "gazetteer", "regex", "email")
+SPAN_ENGINE_IDS = {engine: engine_id for engine_id, engine in enumerate(SPAN_ENGINES)}
+NO_ENGINE = -1
+
+
+def add_stat(stats, label, start, end, engine=None):
+    # Count one censored entity in the uniform {'count', 'indices'} schema, with the id of the engine that found it
+    entry = stats.get(label)
+    if not isinstance(entry, dict):
+        # A missing label, or a bare count left by a caller
+        entry = stats[label] = {'count': entry or 0, 'indices': []}
+    entry['count'] += 1
+    entry['indices'].append((start, end))
+    if engine is not None or 'engines' in entry:
+        # Spans added without an engine before the first one with an engine get NO_ENGINE
+        engine_id = NO_ENGINE if engine is None else SPAN_ENGINE_IDS[engine]
+        entry.setdefault('engines', [NO_ENGINE] * (len(entry['indices']) - 1)).append(engine_id)
+
+
+def stats_from_json(stats):
+    # JSON turns the (start, end) index tuples into lists, turn them back
+    for value in stats.values():
+        if isinstance(value, dict) and 'indices' in value:
+            value['indices'] = [tuple(index) for index in value['indices']]
+    return stats
+
+
+def span_engine_ids(value):
+    # Engine id of every span of a stats entry
+    return value.get('engines') or [NO_ENGINE] * len(value['indices'])
+
+
+def span_engines(value):
+    # Engine name of every span of a stats entry, None for spans recorded without one
+    return [None if engine_id == NO_ENGINE else SPAN_ENGINES[engine_id] for engine_id in span_engine_ids(value)]
+
+
+def without_engines(stats):
+    # Stats as written to --stats and answered by the service, the engine of every span is exported by --spans-out
+    return {label: {'count': value['count'], 'indices': value['indices']}
+            if isinstance(value, dict) and 'engines' in value else value
+            for label, value in stats.items()}
+
+
+def normalize_stats(stats):
+    # Uniform {'count', 'indices'} entry for every label, bare counts carry no indices
+    return {label: value if isinstance(value, dict) else {'count': value, 'indices': []}
+            for label, value in stats.items()}
+
+
+class StatsCollector:
+    # Accumulates the stats of every file of a run and writes them to one buffered sink.
+    # stats_output is "stderr", "stdout", a file path, or None to keep the totals only.
+    # A span_writer also gets every censored span of the run, for the columnar export.
+    # hit_rates, e.g. the share of repeated documents and paragraphs of a --dedup run, go into the summary.
+
+    def __init__(self, stats_output, stats_format="text", span_writer=None):
+        if stats_format not in STATS_FORMATS:
+            raise ValueError(f"Unknown stats format {stats_format}, use one of {', '.join(STATS_FORMATS)}")
+        self.stats_output = stats_output
+        self.stats_format = stats_format
+        self.files = 0
+        self.totals = {}
+        self.hit_rates = {}
+        self.sink = None
+        self.writer = None
+        self.span_writer = span_writer
+        self.open_sink()
+
+    def open_sink(self):
+        if self.stats_output == "stderr":
+            self.sink = sys.stderr
+        elif self.stats_output == "stdout":
+            self.sink = sys.stdout
+        elif self.stats_output:
+            try:
+                self.sink = open(self.stats_output, "w", encoding="utf-8", newline="",
+                                 buffering=STATS_BUFFER_BYTES)
+            except IOError as e:
+                print(f"An error occurred while writing to the file: {e}")
+        if self.sink is not None and self.stats_format == "csv":
+            self.writer = csv.writer(self.sink, lineterminator="\n")
+            self.writer.writerow(["file", "label", "count", "indices"])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def add(self, censored_file_path, stats):
+        stats = normalize_stats(stats)
+        self.files += 1
+        for label, value in stats.items():
+            self.totals[label] = self.totals.get(label, 0) + value['count']
+        if self.sink is not None:
+            self.write_record(str(censored_file_path), stats)
+        if self.span_writer is not None:
+            self.span_writer.add(str(censored_file_path), stats)
+
+    def write_record(self, file_name, stats):
+        stats = without_engines(stats)
+        if self.stats_format == "jsonl":
+            self.sink.write(json.dumps({'file': file_name, 'stats': stats}) + "\n")
+        elif self.stats_format == "csv":
+            for label, value in stats.items():
+                indices = ";".join(f"{start}-{end}" for start, end in value['indices'])
+                self.writer.writerow([file_name, label, value['count'], indices])
+        else:
+            stats_message = f"File: {file_name}\n"
+            for label, value in stats.items():
+                stats_message += f"{label}: {value['count']} occurrences\n"
+            self.sink.write(stats_message + "\n")
+
+    def summary(self):
+        summary = {'files': self.files, 'totals': dict(self.totals)}
+        if self.hit_rates:
+            summary['hit_rates'] = dict(self.hit_rates)
+        return summary
+
+    def write_summary(self):
+        if self.stats_format == "jsonl":
+            self.sink.write(json.dumps({'summary': self.summary()}) + "\n")
+        elif self.stats_format == "csv":
+            for label, count in self.totals.items():
+                self.writer.writerow(["TOTAL", label, count, ""])
+            for name, rate in self.hit_rates.items():
+                self.writer.writerow(["HIT_RATE", name, rate, ""])
+        else:
+            summary_message = f"Summary: {self.files} files\n"
+            for label, count in self.totals.items():
+                summary_message += f"{label}: {count} occurrences\n"
+            for name, rate in self.hit_rates.items():
+                summary_message += f"{name} hit rate: {rate:.1%}\n"
+            self.sink.write(summary_message + "\n")
+
+    def flush(self):
+        if self.sink is not None:
+            self.sink.flush()
+
+    def close(self):
+        # End-of-run summary, then a single flush of the sink
+        if self.span_writer is not None:
+            self.span_writer.close()
+        if self.sink is None:
+            return
+        self.write_summary()
+        if self.sink in (sys.stdout, sys.stderr):
+            self.sink.flush()
+        else:
+            self.sink.close()
+        self.sink = None
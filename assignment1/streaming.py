@@ -0,0 +1,67 @@
+from assignment1.stats import add_stat, span_engines
+
+
+# Bounded chunk size read from a stream and the context shared with the neighbouring chunks
+STREAM_CHUNK_CHARS = 64 * 1024
+STREAM_OVERLAP_CHARS = 256
+
+
+def find_split_point(buffer, limit):
+    # Prefer a paragraph break, then a line break, then a space, so chunks end between sentences
+    for separator in ("\n\n", "\n", " "):
+        split_at = buffer.rfind(separator, limit // 2, limit)
+        if split_at != -1:
+            return split_at + len(separator)
+    return limit
+
+
+def read_chunks(stream, chunk_chars=STREAM_CHUNK_CHARS):
+    # Yield paragraph-aligned chunks of at most chunk_chars characters from a text stream
+    buffer = ""
+    while True:
+        block = stream.read(chunk_chars)
+        buffer += block
+        while len(buffer) >= chunk_chars or (not block and buffer):
+            split_at = find_split_point(buffer, chunk_chars) if len(buffer) >= chunk_chars else len(buffer)
+            yield buffer[:split_at]
+            buffer = buffer[split_at:]
+        if not block:
+            return
+
+
+def merge_window_stats(stats, window_stats, keep_start, keep_end, offset):
+    # Add the stats of one window, keeping only entities that start inside the emitted part of the window
+    for label, value in window_stats.items():
+        if isinstance(value, dict):
+            for (start, end), engine in zip(value['indices'], span_engines(value)):
+                if keep_start <= start < keep_end:
+                    add_stat(stats, label, start + offset, end + offset, engine)
+        else:
+            # Bare counts carry no offsets, so they are added as they are
+            stats[label] = stats.get(label, 0) + value
+
+
+def censor_stream(input_stream, output_stream, censor, chunk_chars=STREAM_CHUNK_CHARS,
+                  overlap_chars=STREAM_OVERLAP_CHARS):
+    # Censor a text stream chunk by chunk and write the output incrementally.
+    # censor(text) returns (censored_text, stats) and must keep the text length unchanged.
+    # Each chunk is censored together with the end of the previous chunk and the start of the next one,
+    # so entities that cross a chunk edge are censored on both sides of it.
+    stats = {}
+    chunks = read_chunks(input_stream, chunk_chars)
+    previous, current = "", next(chunks, None)
+    offset = 0
+    while current is not None:
+        following = next(chunks, None)
+        head = previous[-overlap_chars:] if overlap_chars else ""
+        tail = following[:overlap_chars] if following and overlap_chars else ""
+
+        censored_window, window_stats = censor(head + current + tail)
+        output_stream.write(censored_window[len(head):len(head) + len(current)])
+        merge_window_stats(stats, window_stats, len(head), len(head) + len(current), offset - len(head))
+
+        offset += len(current)
+        previous, current = current, following
+
+    output_stream.flush()
+    return stats
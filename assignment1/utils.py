@@ -1,5 +1,11 @@
 import argparse
-import sys
+from assignment1.ingest import INGEST_QUEUE_SIZE, INGEST_IO_WORKERS
+from assignment1.stats import STATS_FORMATS
+from assignment1.spans import SPANS_FORMATS
+from assignment1.shard import parse_shard
+from assignment1.watch import WATCH_POLL_SECONDS, WATCH_DEBOUNCE_SECONDS
+from assignment1.server import (SERVER_HOST, SERVER_PORT, SERVER_MAX_BATCH, SERVER_BATCH_WINDOW_SECONDS,
+                                SERVER_MAX_CONCURRENCY)
 
 
 # Pattern for identifying phone number in different formats
@@ -68,36 +74,26 @@ date_patterns = [
 ]
 
 
-def output_stats(stats, stats_output, censored_file_path):
-    # Construct stats message
-    stats_message = f"File: {censored_file_path}\n"
-    for entity, count in stats.items():
-        stats_message += f"{entity}: {count} occurrences\n"
+# Labels censored for each entity type flag
+ENTITY_TYPES = {
+    "names": ["PERSON", "B-PER", "I-PER"],
+    "dates": ["DATE"],
+    "phones": ["PHONE"],
+    "address": ["ADDRESS", "B-LOC", "I-LOC", "GPE", "FAC", "LOC"],
+}
 
-    # Determine the output destination
-    if stats_output == "stderr":
-        print(stats_message, file=sys.stderr)
-    elif stats_output == "stdout":
-        print(stats_message, file=sys.stdout)
-    else:  # Output to a file
-        try:
-            with open(stats_output, "w") as file:
-                file.write(stats_message + "\n")
-        except IOError as e:
-            print(f"An error occurred while writing to the file: {e}")
+# Engines that can be chosen with --engine
+ENGINES = ["rules", "spacy", "hf", "ensemble"]
+# Backends of the BERT NER stage that can be chosen with --hf-backend
+HF_BACKENDS = ["torch", "quantized", "onnx"]
 
 
 def extract_arguments(arg_parser):
     # Determine which entities to censor based on flags
     entities_to_censor = []
-    if arg_parser.names:
-        entities_to_censor.extend(["PERSON", "B-PER", "I-PER"])
-    if arg_parser.dates:
-        entities_to_censor.append("DATE")
-    if arg_parser.phones:
-        entities_to_censor.append("PHONE")
-    if arg_parser.address:
-        entities_to_censor.extend(["ADDRESS", "B-LOC", "I-LOC", "GPE", "FAC", "LOC"])
+    for entity_type, labels in ENTITY_TYPES.items():
+        if getattr(arg_parser, entity_type):
+            entities_to_censor.extend(labels)
 
     inp_path = arg_parser.input
     out_path = arg_parser.output
@@ -111,19 +107,129 @@ def arguments_parser():
     parser = argparse.ArgumentParser(description="Censor sensitive information from text files.")
 
     # Define all arguments that the script should accept
-    parser.add_argument("--input", type=str, required=True,
-                        help="Input path. Could be a single file or folder.")
+    parser.add_argument("--input", type=str,
+                        help='Input path. Could be a single file or folder. Use "-" to read from stdin.')
     parser.add_argument("--names", action="store_true", help="Name censor flag.")
     parser.add_argument("--dates", action="store_true", help="Date censor flag.")
     parser.add_argument("--phones", action="store_true", help="Phone Number censor flag.")
     parser.add_argument("--address", action="store_true", help="Address censor flag.")
-    parser.add_argument("--output", type=str, required=True,
-                        help="Path or Directory to store the censored files.")
+    parser.add_argument("--output", type=str,
+                        help='Path or Directory to store the censored files. Use "-" to write to stdout.')
     parser.add_argument("--stats", type=str,
                         help='File or stream to output the stats. Use "stderr" or "stdout" for console output or '
                              'provide a file path to write to a file.',
                         )
+    parser.add_argument("--engine", choices=ENGINES,
+                        help="Engine used for every entity type. By default phones use the rules engine and names, "
+                             "dates and addresses use the ensemble of SpaCy, Hugging face and regex. Entities the "
+                             "engine cannot detect, e.g. places with rules, keep their default engine.")
+    parser.add_argument("--hf-backend", choices=HF_BACKENDS, default="torch",
+                        help="Runtime of the Hugging face model: PyTorch, dynamic int8 quantized PyTorch or "
+                             "ONNX Runtime (needs optimum[onnxruntime]).")
+    parser.add_argument("--stats-format", choices=STATS_FORMATS, default="text",
+                        help="Format of the stats records and of the end-of-run summary.")
+    parser.add_argument("--spans-out", type=str,
+                        help="Write every censored span (file, label, engine, start, end) to this columnar file.")
+    parser.add_argument("--spans-format", choices=SPANS_FORMATS,
+                        help="Format of --spans-out, chosen from its extension by default. Parquet and Arrow IPC "
+                             "need pyarrow, CSV is written instead when it is missing.")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of worker processes used to censor files in parallel.")
+    parser.add_argument("--threads", type=int, default=1,
+                        help="Number of worker threads used to censor files in parallel. They share one copy of "
+                             "the models instead of loading one per --workers process.")
+    parser.add_argument("--batch-size", type=int, default=1,
+                        help="Number of files fed together through SpaCy's nlp.pipe.")
+    parser.add_argument("--warmup", action="store_true",
+                        help="Load the models needed by the chosen flags before processing the first file.")
+    parser.add_argument("--async-io", action="store_true",
+                        help="Read, censor and write files in overlapping asyncio stages.")
+    parser.add_argument("--queue-size", type=int, default=INGEST_QUEUE_SIZE,
+                        help="Files buffered between the --async-io stages before readers and the model wait.")
+    parser.add_argument("--io-workers", type=int, default=INGEST_IO_WORKERS,
+                        help="Reader and writer tasks of the --async-io pipeline.")
+    parser.add_argument("--stream", action="store_true",
+                        help="Read and write files in bounded chunks so memory stays flat for very large inputs.")
+    parser.add_argument("--mmap", action="store_true",
+                        help="Memory-map every input file, decode and censor it one block at a time and write the "
+                             "output by patching the redacted byte ranges, for inputs too large to hold in memory.")
+    parser.add_argument("--watch", action="store_true",
+                        help="Keep running and censor new or changed files matching --input as they arrive.")
+    parser.add_argument("--watch-state", type=str,
+                        help="JSON file of the files already censored by --watch, defaults to "
+                             ".censoror-watch.json in the output directory.")
+    parser.add_argument("--watch-interval", type=float, default=WATCH_POLL_SECONDS,
+                        help="Seconds between directory scans when inotify is not available.")
+    parser.add_argument("--watch-debounce", type=float, default=WATCH_DEBOUNCE_SECONDS,
+                        help="Seconds a file must stay unchanged before it is censored.")
+    parser.add_argument("--shard", type=shard_argument,
+                        help='Censor only the i-th of N parts of the sorted input files, e.g. "2/4". A journal in the '
+                             'output directory records the finished files, so a rerun resumes where it stopped.')
+    parser.add_argument("--serve", action="store_true",
+                        help="Run a local HTTP service that censors the text posted to /censor, instead of files.")
+    parser.add_argument("--host", type=str, default=SERVER_HOST, help="Address the --serve service listens on.")
+    parser.add_argument("--port", type=int, default=SERVER_PORT, help="Port the --serve service listens on.")
+    parser.add_argument("--max-batch", type=int, default=SERVER_MAX_BATCH,
+                        help="Most concurrent requests censored together in one model call.")
+    parser.add_argument("--batch-window-ms", type=float, default=SERVER_BATCH_WINDOW_SECONDS * 1000,
+                        help="How long the first request of a batch waits for other requests to join it.")
+    parser.add_argument("--max-concurrency", type=int, default=SERVER_MAX_CONCURRENCY,
+                        help="Requests handled at the same time, the next ones get a 503 answer.")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Do not reuse or store results in the content-hash result cache.")
+    parser.add_argument("--cache-path", type=str,
+                        help="SQLite file of the result cache, defaults to ~/.cache/censoror/results.sqlite3.")
+    parser.add_argument("--cache-size-mb", type=int, default=512,
+                        help="Size limit of the result cache, least recently used results are evicted first.")
+    parser.add_argument("--gazetteer", type=str,
+                        help="JSON index of known people and places, censored in one scan and saved after the run.")
+    parser.add_argument("--gazetteer-seed", type=str,
+                        help='Text file of known entities, one "LABEL<TAB>phrase" or "phrase" (a person) per line.')
+    parser.add_argument("--gazetteer-learn", action="store_true",
+                        help="Add the people and places the models find in several documents to the gazetteer.")
+    parser.add_argument("--gazetteer-skip-models", action="store_true",
+                        help="Skip name and location inference for documents the gazetteer fully covers.")
+    parser.add_argument("--dedup", action="store_true",
+                        help="Censor every distinct paragraph once per run and reuse its spans for repeated copies.")
+    parser.add_argument("--prefilter", action="store_true",
+                        help="Censor only the paragraphs with capitalized words, digits, location words or known "
+                             "entities, the others skip every censoring stage.")
+    parser.add_argument("--prefilter-threshold", type=int, default=2,
+                        help="Lexical score a paragraph needs to be censored with --prefilter, lower keeps more.")
+    parser.add_argument("--email", action="store_true",
+                        help="Censor RFC822 headers with fixed rules and send only the message body to the models.")
+    parser.add_argument("--metrics-out", type=str,
+                        help="Write per-stage timings and throughput to this file, Prometheus textfile format for "
+                             "a .prom path and JSON otherwise.")
+    parser.add_argument("--profile", type=str,
+                        help="Run under cProfile and dump the pstats output to this file.")
 
-    # Parse the command-line arguments
-    return parser.parse_args()
+    # Parse the command-line arguments, only the service runs without input and output
+    args = parser.parse_args()
+    if not args.serve and (args.input is None or args.output is None):
+        parser.error("the following arguments are required: --input, --output")
+    if args.shard is not None and (args.serve or args.watch or "-" in (args.input, args.output)):
+        parser.error("--shard needs files for --input and --output, without --serve or --watch")
+    if args.threads > 1 and args.workers > 1:
+        parser.error("use either --threads or --workers")
+    return args
+
+
+def shard_argument(value):
+    try:
+        return parse_shard(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def merge_arguments_parser(argv=None):
+    # Arguments of "censoror.py merge", which combines the stats of the shards of a --shard run
+    parser = argparse.ArgumentParser(prog="censoror.py merge",
+                                     description="Combine the stats journaled by every shard of a --shard run.")
+    parser.add_argument("--output", type=str, required=True, help="Output directory shared by the shards.")
+    parser.add_argument("--stats", type=str, default="stdout",
+                        help='File or stream of the combined stats, "stderr", "stdout" or a file path.')
+    parser.add_argument("--stats-format", choices=STATS_FORMATS, default="text",
+                        help="Format of the stats records and of the summary.")
+    return parser.parse_args(argv)
 
@@ -0,0 +1,207 @@
+import ctypes
+import ctypes.util
+import hashlib
+import json
+import os
+import select
+import struct
+import threading
+import time
+from fnmatch import fnmatch
+from glob import glob, has_magic
+from pathlib import Path
+
+
+WATCH_STATE_VERSION = 1
+# State file kept in the output directory unless --watch-state is given
+WATCH_STATE_NAME = ".censoror-watch.json"
+# Seconds between two directory scans when inotify is not available
+WATCH_POLL_SECONDS = 1.0
+# A file is censored once it has not been written to for this many seconds, so partial writes are never picked up
+WATCH_DEBOUNCE_SECONDS = 2.0
+
+# inotify(7) events that can make a file new, changed or gone
+IN_MODIFY = 0x002
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_FROM = 0x040
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_Q_OVERFLOW = 0x4000
+INOTIFY_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+INOTIFY_EVENT = struct.Struct("iIII")
+INOTIFY_READ_BYTES = 64 * 1024
+
+
+def file_digest(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        for block in iter(lambda: file.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class WatchState:
+    # mtime, size and content hash of every file censored by the watch mode, persisted between runs
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.files = {}
+        self.dirty = False
+
+    def load(self):
+        # A missing state file means nothing was censored yet
+        if self.path.exists():
+            content = json.loads(self.path.read_text(encoding="utf-8"))
+            self.files = {file_path: tuple(entry) for file_path, entry in content.get('files', {}).items()}
+        return self
+
+    def save(self):
+        content = {'version': WATCH_STATE_VERSION,
+                   'files': {file_path: list(entry) for file_path, entry in sorted(self.files.items())}}
+
+        # Write then rename, so an interrupted run never leaves a truncated state file
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = self.path.with_name(self.path.name + ".tmp")
+        temp_path.write_text(json.dumps(content, indent=1), encoding="utf-8")
+        temp_path.replace(self.path)
+        self.dirty = False
+
+    def unchanged(self, file_path, file_stat):
+        # Same mtime and size as when the file was censored, the content is not read again
+        entry = self.files.get(file_path)
+        return entry is not None and entry[:2] == (file_stat.st_mtime_ns, file_stat.st_size)
+
+    def same_content(self, file_path, digest):
+        entry = self.files.get(file_path)
+        return entry is not None and entry[2] == digest
+
+    def record(self, file_path, file_stat, digest):
+        self.files[file_path] = (file_stat.st_mtime_ns, file_stat.st_size, digest)
+        self.dirty = True
+
+    def forget(self, file_path):
+        if self.files.pop(file_path, None) is not None:
+            self.dirty = True
+
+
+class PollingWatcher:
+    # Rescans the input pattern every interval, works on every platform and file system
+
+    def __init__(self, input_pattern):
+        self.input_pattern = input_pattern
+
+    def wait(self, timeout):
+        time.sleep(timeout)
+        return glob(self.input_pattern)
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    # Blocks on the Linux inotify API of the watched directory and returns only the files that were touched
+
+    def __init__(self, input_pattern):
+        self.input_pattern = input_pattern
+        self.directory = os.path.dirname(input_pattern) or "."
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        if libc.inotify_add_watch(self.fd, os.fsencode(self.directory), INOTIFY_MASK) < 0:
+            error = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(error, f"Cannot watch {self.directory}")
+
+    def wait(self, timeout):
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+
+        file_paths = set()
+        data = os.read(self.fd, INOTIFY_READ_BYTES)
+        offset = 0
+        while offset < len(data):
+            _, mask, _, length = INOTIFY_EVENT.unpack_from(data, offset)
+            name = data[offset + INOTIFY_EVENT.size:offset + INOTIFY_EVENT.size + length].rstrip(b"\0")
+            offset += INOTIFY_EVENT.size + length
+            if mask & IN_Q_OVERFLOW:
+                # Events were dropped, rescan everything once
+                file_paths.update(glob(self.input_pattern))
+            elif name:
+                file_path = os.path.join(self.directory, os.fsdecode(name))
+                if fnmatch(file_path, self.input_pattern):
+                    file_paths.add(file_path)
+        return file_paths
+
+    def close(self):
+        os.close(self.fd)
+
+
+def create_watcher(input_pattern):
+    # inotify where the platform has it and the directory part of the pattern is a plain path, polling otherwise
+    if not has_magic(os.path.dirname(input_pattern)):
+        try:
+            return InotifyWatcher(input_pattern)
+        except (AttributeError, OSError, TypeError):
+            pass
+    return PollingWatcher(input_pattern)
+
+
+def watch(input_pattern, state, poll_seconds=WATCH_POLL_SECONDS, debounce_seconds=WATCH_DEBOUNCE_SECONDS, stop=None,
+          watcher=None):
+    # Yield every new or changed file matching the pattern once it is no longer being written to.
+    # A file is recorded in the state after the caller resumes the generator, i.e. once it was censored.
+    # Runs until stop is set, a stop that is already set makes a single pass over the existing files.
+    stop = stop or threading.Event()
+    watcher = watcher or create_watcher(input_pattern)
+    # Files present before the start are checked once against the state, later only the files the watcher reports
+    pending = set(glob(input_pattern))
+    try:
+        while True:
+            ready, quiet_in = ready_files(pending, state, debounce_seconds)
+            for file_path, file_stat, digest in ready:
+                yield file_path
+                state.record(file_path, file_stat, digest)
+            if state.dirty:
+                state.save()
+
+            if stop.is_set():
+                return
+            timeout = poll_seconds if quiet_in is None else min(poll_seconds, quiet_in)
+            pending.update(watcher.wait(timeout))
+    finally:
+        watcher.close()
+
+
+def ready_files(pending, state, debounce_seconds):
+    # (file_path, stat, digest) of the pending files to censor now, and the seconds until the next one is quiet.
+    # Files still being written to stay in pending.
+    ready = []
+    quiet_in = None
+    now = time.time()
+    for file_path in sorted(pending):
+        try:
+            file_stat = os.stat(file_path)
+        except FileNotFoundError:
+            pending.discard(file_path)
+            state.forget(file_path)
+            continue
+
+        if state.unchanged(file_path, file_stat):
+            pending.discard(file_path)
+            continue
+        written_ago = now - file_stat.st_mtime
+        if written_ago < debounce_seconds:
+            quiet_in = min(quiet_in or debounce_seconds, debounce_seconds - written_ago)
+            continue
+
+        pending.discard(file_path)
+        digest = file_digest(file_path)
+        if state.same_content(file_path, digest):
+            # Touched but not changed, only the new mtime is remembered
+            state.record(file_path, file_stat, digest)
+            continue
+        ready.append((file_path, file_stat, digest))
+    return ready, quiet_in
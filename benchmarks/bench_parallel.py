@@ -0,0 +1,128 @@
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from glob import glob
+from pathlib import Path
+from assignment1.utils import ENGINES
+from benchmarks.bench_pipeline import git_commit
+
+
+# Seconds between two samples of the memory of a run
+RSS_SAMPLE_SECONDS = 0.05
+ENTITY_FLAGS = ["--names", "--dates", "--phones", "--address"]
+
+
+def process_tree(pid):
+    # pid and every process started by it, from /proc
+    pids = [pid]
+    for parent in pids:
+        for task in glob(f"/proc/{parent}/task/*/children"):
+            try:
+                pids.extend(int(child) for child in Path(task).read_text().split())
+            except OSError:
+                continue
+    return pids
+
+
+def memory_mb(pid):
+    # Proportional set size of a process, pages shared with other processes are split between them.
+    # Falls back to the resident set size on kernels without smaps_rollup.
+    for file_name, field in (("smaps_rollup", "Pss:"), ("status", "VmRSS:")):
+        try:
+            for line in Path(f"/proc/{pid}/{file_name}").read_text().splitlines():
+                if line.startswith(field):
+                    return int(line.split()[1]) / 1024
+        except OSError:
+            continue
+    return 0.0
+
+
+def run_case(command):
+    # Wall time of a censoror.py run and the peak memory of its whole process tree, worker processes included
+    start = time.perf_counter()
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+    peak_mb = 0.0
+    while process.poll() is None:
+        peak_mb = max(peak_mb, sum(memory_mb(pid) for pid in process_tree(process.pid)))
+        time.sleep(RSS_SAMPLE_SECONDS)
+    wall_seconds = time.perf_counter() - start
+    if process.returncode != 0:
+        raise RuntimeError(f"{' '.join(command)} exited with {process.returncode}")
+    return wall_seconds, peak_mb
+
+
+def same_output(output_dir, reference_dir):
+    reference = sorted(Path(reference_dir).glob("*.censored"))
+    return bool(reference) and all((Path(output_dir) / path.name).read_bytes() == path.read_bytes()
+                                   for path in reference)
+
+
+def main(input_pattern, scale, threads, workers, flags, engine, batch_size, output_path):
+    file_paths = sorted(glob(input_pattern))[:scale]
+    cases = [("serial", [])]
+    cases += [(f"threads={count}", ["--threads", str(count)]) for count in threads]
+    cases += [(f"processes={count}", ["--workers", str(count)]) for count in workers]
+    results = {"commit": git_commit(), "input": input_pattern, "files": len(file_paths), "flags": flags,
+               "engine": engine, "batch_size": batch_size, "cpus": os.cpu_count(), "cases": {}}
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        input_dir = Path(work_dir) / "input"
+        input_dir.mkdir()
+        total_chars = 0
+        for file_path in file_paths:
+            shutil.copy(file_path, input_dir)
+            total_chars += len(Path(file_path).read_text(encoding="utf-8"))
+
+        for case, options in cases:
+            output_dir = Path(work_dir) / case
+            output_dir.mkdir()
+            metrics_path = Path(work_dir) / f"{case}.json"
+            command = [sys.executable, "censoror.py", "--input", str(input_dir / "*"), "--output", str(output_dir),
+                       "--stats", os.devnull, "--no-cache", "--batch-size", str(batch_size),
+                       "--metrics-out", str(metrics_path)] + flags + options
+            if engine:
+                command += ["--engine", engine]
+            wall_seconds, peak_mb = run_case(command)
+            # Time spent in censoror.main, without the interpreter start and the imports
+            censor_seconds = json.loads(metrics_path.read_text(encoding="utf-8"))["wall_seconds"]
+            figures = {
+                "wall_seconds": round(wall_seconds, 3),
+                "censor_seconds": round(censor_seconds, 3),
+                "docs_per_sec": round(len(file_paths) / censor_seconds, 2) if censor_seconds else None,
+                "mb_per_sec": round(total_chars / (1024 * 1024) / censor_seconds, 4) if censor_seconds else None,
+                "peak_memory_mb": round(peak_mb, 1),
+                "same_output": same_output(output_dir, Path(work_dir) / "serial"),
+            }
+            results["cases"][case] = figures
+            print(f"{case:>14}: {figures['docs_per_sec']:>9} docs/s {figures['mb_per_sec']:>9} MB/s "
+                  f"wall {figures['wall_seconds']:>8} s peak memory {figures['peak_memory_mb']:>8} MB "
+                  f"same output {figures['same_output']}")
+
+    if output_path:
+        Path(output_path).write_text(json.dumps(results, indent=2), encoding="utf-8")
+        print(f"Results written to {output_path}")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare serial, --threads and --workers runs of censoror.py in "
+                                                 "throughput and peak memory.")
+    parser.add_argument("--input", type=str, default="files/*.txt", help="Glob pattern of the corpus.")
+    parser.add_argument("--scale", type=int, default=600, help="Number of files censored by every run.")
+    parser.add_argument("--threads", type=int, nargs="*", default=[2, 4], help="Thread counts to run.")
+    parser.add_argument("--workers", type=int, nargs="*", default=[2, 4], help="Process counts to run.")
+    parser.add_argument("--batch-size", type=int, default=1, help="--batch-size of every run.")
+    parser.add_argument("--engine", choices=ENGINES, help="Engine of every run, the full pipeline by default.")
+    for flag in ENTITY_FLAGS:
+        parser.add_argument(flag, action="store_true", help=f"Pass {flag} to every run.")
+    parser.add_argument("--json", type=str, help="Write the results to this JSON file.")
+    args = parser.parse_args()
+
+    # Without any flag every entity type is censored
+    entity_flags = [flag for flag in ENTITY_FLAGS if getattr(args, flag[2:])] or ENTITY_FLAGS
+    main(args.input, args.scale, args.threads, args.workers, entity_flags, args.engine, args.batch_size, args.json)
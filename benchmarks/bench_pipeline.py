@@ -0,0 +1,177 @@
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import statistics
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from glob import glob
+from pathlib import Path
+from assignment1.main import censor_with_rules, censor_with_spacy, censor_with_hf, censor_with_regex, models_for
+from assignment1.models import models, use_hf_backend
+from assignment1.utils import extract_arguments, HF_BACKENDS
+import censoror
+
+
+ALL_ENTITIES = ["PERSON", "B-PER", "I-PER", "DATE", "PHONE", "ADDRESS", "B-LOC", "I-LOC", "GPE", "FAC", "LOC"]
+
+
+def peak_rss_mb():
+    # Peak resident set size of this process so far (ru_maxrss is in KB on Linux). Every case runs in a process of
+    # its own, so this is the peak of that case and not the one of a heavier case measured before it.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def percentile(values, fraction):
+    # Nearest-rank percentile of a list of numbers
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(fraction * len(ordered)) - 1))]
+
+
+def summarize(latencies, total_chars, wall_seconds):
+    # Throughput and latency figures for one benchmark case
+    return {
+        "docs": len(latencies),
+        "wall_seconds": round(wall_seconds, 4),
+        "docs_per_sec": round(len(latencies) / wall_seconds, 2) if wall_seconds else None,
+        "mb_per_sec": round(total_chars / (1024 * 1024) / wall_seconds, 4) if wall_seconds else None,
+        "p50_ms": round(statistics.median(latencies) * 1000, 2) if latencies else None,
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 2) if latencies else None,
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+
+def bench_stage(stage, texts, entities_to_censor):
+    # Time one censor function file by file
+    latencies = []
+    start = time.perf_counter()
+    for text in texts:
+        file_start = time.perf_counter()
+        if stage is censor_with_regex:
+            stage(text, entities_to_censor)
+        else:
+            stage(text, entities_to_censor, {})
+        latencies.append(time.perf_counter() - file_start)
+    return summarize(latencies, sum(len(text) for text in texts), time.perf_counter() - start)
+
+
+def bench_main(file_paths, entities_to_censor, run_options):
+    # Time the full censoror.main over a copy of the selected files
+    with tempfile.TemporaryDirectory() as work_dir:
+        input_dir = Path(work_dir) / "input"
+        output_dir = Path(work_dir) / "output"
+        input_dir.mkdir()
+        output_dir.mkdir()
+        total_chars = 0
+        for file_path in file_paths:
+            text = Path(file_path).read_text(encoding="utf-8")
+            total_chars += len(text)
+            (input_dir / Path(file_path).name).write_text(text, encoding="utf-8")
+
+        # Wrap censor_file to record the per-file latency of the serial path
+        latencies = []
+        censor_file = censoror.censor_file
+
+        def timed_censor_file(*args, **kwargs):
+            file_start = time.perf_counter()
+            result = censor_file(*args, **kwargs)
+            latencies.append(time.perf_counter() - file_start)
+            return result
+
+        censoror.censor_file = timed_censor_file
+        try:
+            start = time.perf_counter()
+            censoror.main(str(input_dir / "*"), str(output_dir), entities_to_censor, os.devnull, **run_options)
+            wall_seconds = time.perf_counter() - start
+        finally:
+            censoror.censor_file = censor_file
+
+    return summarize(latencies, total_chars, wall_seconds)
+
+
+def run_case(stage, file_paths, entities_to_censor, hf_backend):
+    # One benchmark case, run in a fresh process by main. The models are loaded before the timer starts, and the
+    # peak RSS once they are loaded is reported next to the peak of the whole case.
+    use_hf_backend(hf_backend)
+    models.warmup(models_for(entities_to_censor, "rules" if stage == "rules" else None))
+    models_rss_mb = round(peak_rss_mb(), 1)
+    if stage == "main":
+        figures = bench_main(file_paths, entities_to_censor, {})
+    else:
+        stage_functions = {"rules": censor_with_rules, "spacy": censor_with_spacy, "hf": censor_with_hf,
+                           "regex": censor_with_regex}
+        texts = [Path(file_path).read_text(encoding="utf-8") for file_path in file_paths]
+        figures = bench_stage(stage_functions[stage], texts, entities_to_censor)
+    figures["models_rss_mb"] = models_rss_mb
+    return figures
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(results, baseline_path):
+    # Print the throughput change of every case against an earlier results file
+    baseline = json.loads(Path(baseline_path).read_text(encoding="utf-8"))
+    print(f"\nCompared with {baseline_path} ({baseline.get('commit')}):")
+    for case, figures in results["cases"].items():
+        old = baseline["cases"].get(case)
+        if old and old.get("docs_per_sec") and figures.get("docs_per_sec"):
+            change = (figures["docs_per_sec"] / old["docs_per_sec"] - 1) * 100
+            print(f"{case:>28}: {old['docs_per_sec']:>9} -> {figures['docs_per_sec']:>9} docs/s ({change:+.1f}%)")
+
+
+def main(input_pattern, scales, stages, entities_to_censor, output_path, baseline_path, hf_backend="torch"):
+    file_paths = sorted(glob(input_pattern))
+    results = {"commit": git_commit(), "input": input_pattern, "entities": entities_to_censor,
+               "hf_backend": hf_backend, "cases": {}}
+
+    # A fresh spawned process per case, so ru_maxrss starts from zero and the models are loaded for the case alone
+    context = multiprocessing.get_context("spawn")
+    for scale in scales:
+        selected = file_paths[:scale]
+        for stage in stages:
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                figures = executor.submit(run_case, stage, selected, entities_to_censor, hf_backend).result()
+            case = f"{stage}@{len(selected)}"
+            results["cases"][case] = figures
+            print(f"{case:>28}: {figures['docs_per_sec']:>9} docs/s {figures['mb_per_sec']:>9} MB/s "
+                  f"p50 {figures['p50_ms']:>9} ms p95 {figures['p95_ms']:>9} ms "
+                  f"peak RSS {figures['peak_rss_mb']:>8} MB (models {figures['models_rss_mb']:>8} MB)")
+
+    if output_path:
+        Path(output_path).write_text(json.dumps(results, indent=2), encoding="utf-8")
+        print(f"Results written to {output_path}")
+    if baseline_path:
+        compare(results, baseline_path)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the censoring stages and censoror.main.")
+    parser.add_argument("--input", type=str, default="files/*.txt", help="Glob pattern of the corpus.")
+    parser.add_argument("--scales", type=int, nargs="+", default=[10, 100, 600],
+                        help="Number of files used for each run.")
+    parser.add_argument("--stages", nargs="+", default=["rules", "spacy", "hf", "regex", "main"],
+                        choices=["rules", "spacy", "hf", "regex", "main"], help="Stages to benchmark.")
+    parser.add_argument("--names", action="store_true", help="Name censor flag.")
+    parser.add_argument("--dates", action="store_true", help="Date censor flag.")
+    parser.add_argument("--phones", action="store_true", help="Phone Number censor flag.")
+    parser.add_argument("--address", action="store_true", help="Address censor flag.")
+    parser.add_argument("--hf-backend", choices=HF_BACKENDS, default="torch",
+                        help="Runtime of the Hugging face model, compare runs with --json and --compare.")
+    parser.add_argument("--json", type=str, help="Write the results to this JSON file.")
+    parser.add_argument("--compare", type=str, help="Earlier JSON results to compare against.")
+    parser.set_defaults(output=None, stats=None)
+    args = parser.parse_args()
+
+    # Without any flag every entity type is censored
+    entities = extract_arguments(args)[3] or ALL_ENTITIES
+    main(args.input, args.scales, args.stages, entities, args.json, args.compare, args.hf_backend)
@@ -0,0 +1,131 @@
+import argparse
+import json
+import re
+import time
+from glob import glob
+from pathlib import Path
+from assignment1.cache import censored_spans
+from assignment1.dedup import split_paragraphs
+from assignment1.email_headers import find_body_start, header_fields
+from assignment1.prefilter import Prefilter, PREFILTER_THRESHOLDS, segment_score, use_prefilter
+from assignment1.utils import extract_arguments, ENGINES
+from benchmarks.bench_pipeline import ALL_ENTITIES, git_commit
+import censoror
+
+
+# Headers whose names are looked for in the message body, a model-free estimate of the recall on names
+HEADER_NAME_FIELDS = ["x-from", "x-to", "x-cc"]
+NAME_TOKEN = re.compile(r"\b[A-Z][a-z]{2,}\b")
+
+
+def body_paragraphs(text):
+    # Paragraphs of the message body and the name tokens of its X-From, X-To and X-cc headers
+    body_start = find_body_start(text)
+    if body_start is None:
+        return split_paragraphs(text), set()
+    names = set()
+    for name, value_start, value_end in header_fields(text, body_start):
+        if name in HEADER_NAME_FIELDS:
+            names.update(NAME_TOKEN.findall(text, value_start, value_end))
+    return split_paragraphs(text, body_start), names
+
+
+def lexical_report(texts, thresholds, entities_to_censor):
+    # Share of paragraphs and characters each threshold sends to the models, and the share of the header names
+    # mentioned in the body that are in a kept paragraph
+    scored = []
+    start = time.perf_counter()
+    for text in texts:
+        paragraphs, names = body_paragraphs(text)
+        for paragraph_start, paragraph_end in paragraphs:
+            paragraph = text[paragraph_start:paragraph_end]
+            mentions = sum(1 for token in NAME_TOKEN.findall(paragraph) if token in names)
+            scored.append((segment_score(paragraph, entities_to_censor), len(paragraph), mentions))
+    scoring_ms = (time.perf_counter() - start) * 1000
+
+    total_chars = sum(chars for _, chars, _ in scored) or 1
+    total_mentions = sum(mentions for _, _, mentions in scored) or 1
+    report = {"paragraphs": len(scored), "scoring_ms": round(scoring_ms, 2), "thresholds": {}}
+    for threshold in thresholds:
+        kept = [(chars, mentions) for score, chars, mentions in scored if score >= threshold]
+        report["thresholds"][threshold] = {
+            "paragraphs_kept": round(len(kept) / max(1, len(scored)), 4),
+            "chars_kept": round(sum(chars for chars, _ in kept) / total_chars, 4),
+            "header_name_recall": round(sum(mentions for _, mentions in kept) / total_mentions, 4),
+        }
+    return report
+
+
+def censored_chars(texts, entities_to_censor, engine):
+    # Wall time of censoring every text in email mode, and the (text, offset) of every censored character
+    chars = set()
+    start = time.perf_counter()
+    for index, text in enumerate(texts):
+        censored_text, _ = censoror.censor_document(text, entities_to_censor, True, engine)
+        chars.update((index, offset) for span_start, span_end in censored_spans(censored_text)
+                     for offset in range(span_start, span_end))
+    return time.perf_counter() - start, chars
+
+
+def model_report(texts, thresholds, entities_to_censor, engine):
+    # Recall of every threshold against the censored characters of a run without the prefilter, and its speedup
+    use_prefilter(None)
+    # Warm the models so the reference run does not pay for loading them
+    censored_chars(texts[:1], entities_to_censor, engine)
+    reference_seconds, reference = censored_chars(texts, entities_to_censor, engine)
+    report = {"reference_seconds": round(reference_seconds, 3), "thresholds": {}}
+    for threshold in thresholds:
+        use_prefilter(Prefilter(threshold))
+        seconds, candidate = censored_chars(texts, entities_to_censor, engine)
+        report["thresholds"][threshold] = {
+            "seconds": round(seconds, 3),
+            "speedup": round(reference_seconds / seconds, 3) if seconds else None,
+            "recall": round(len(reference & candidate) / len(reference), 4) if reference else 1.0,
+        }
+    use_prefilter(None)
+    return report
+
+
+def main(input_pattern, thresholds, entities_to_censor, engine, with_models, output_path):
+    texts = [Path(file_path).read_text(encoding="utf-8") for file_path in sorted(glob(input_pattern))]
+    results = {"commit": git_commit(), "input": input_pattern, "entities": entities_to_censor, "engine": engine,
+               "lexical": lexical_report(texts, thresholds, entities_to_censor)}
+
+    print(f"{len(texts)} files, {results['lexical']['paragraphs']} body paragraphs scored in "
+          f"{results['lexical']['scoring_ms']} ms")
+    for threshold, figures in results["lexical"]["thresholds"].items():
+        print(f"threshold {threshold}: {figures['paragraphs_kept']:.1%} of paragraphs and "
+              f"{figures['chars_kept']:.1%} of characters kept, header name recall {figures['header_name_recall']:.1%}")
+
+    if with_models:
+        results["models"] = model_report(texts, thresholds, entities_to_censor, engine)
+        print(f"without prefilter: {results['models']['reference_seconds']} s")
+        for threshold, figures in results["models"]["thresholds"].items():
+            print(f"threshold {threshold}: {figures['seconds']} s ({figures['speedup']}x), "
+                  f"recall {figures['recall']:.2%}")
+
+    if output_path:
+        Path(output_path).write_text(json.dumps(results, indent=2), encoding="utf-8")
+        print(f"Results written to {output_path}")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recall versus speed of the --prefilter thresholds.")
+    parser.add_argument("--input", type=str, default="files/*.txt", help="Glob pattern of the corpus.")
+    parser.add_argument("--thresholds", type=int, nargs="+", default=PREFILTER_THRESHOLDS,
+                        help="Prefilter thresholds to compare.")
+    parser.add_argument("--models", action="store_true",
+                        help="Also censor the corpus with and without the prefilter and compare the censored text.")
+    parser.add_argument("--engine", choices=ENGINES, help="Engine used for every entity type with --models.")
+    parser.add_argument("--names", action="store_true", help="Name censor flag.")
+    parser.add_argument("--dates", action="store_true", help="Date censor flag.")
+    parser.add_argument("--phones", action="store_true", help="Phone Number censor flag.")
+    parser.add_argument("--address", action="store_true", help="Address censor flag.")
+    parser.add_argument("--json", type=str, help="Write the results to this JSON file.")
+    parser.set_defaults(output=None, stats=None)
+    args = parser.parse_args()
+
+    # Without any flag every entity type is censored
+    entities = extract_arguments(args)[3] or ALL_ENTITIES
+    main(args.input, args.thresholds, entities, args.engine, args.models, args.json)
@@ -0,0 +1,44 @@
+import argparse
+import time
+from glob import glob
+from pathlib import Path
+from assignment1.regex_registry import compiled_patterns, scan_entities
+
+
+def load_corpus(input_pattern):
+    # Read every file of the corpus into one string
+    return "\n".join(Path(file_path).read_text(encoding="utf-8") for file_path in sorted(glob(input_pattern)))
+
+
+def time_scans(scan, text, repeat):
+    # Run a scan function several times and return the best wall time in seconds
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        scan(text)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def scan_per_entity(text):
+    # Baseline: one finditer pass per entity pattern
+    return [match for pattern in compiled_patterns.values() for match in pattern.finditer(text)]
+
+
+def main(input_pattern, repeat):
+    text = load_corpus(input_pattern)
+    size_mb = len(text.encode("utf-8")) / (1024 * 1024)
+    print(f"Corpus: {input_pattern} ({size_mb:.2f} MB)")
+
+    for name, scan in [("registry scan", scan_entities), ("one pass per entity", scan_per_entity)]:
+        seconds = time_scans(scan, text, repeat)
+        print(f"{name:>22}: {seconds * 1000:8.1f} ms, {size_mb / seconds:8.2f} MB/s, "
+              f"{seconds / size_mb * 1000:8.1f} ms per MB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Micro-benchmark of the regex registry scans.")
+    parser.add_argument("--input", type=str, default="files/*.txt", help="Glob pattern of the corpus to scan.")
+    parser.add_argument("--repeat", type=int, default=5, help="Number of timed runs, the best one is reported.")
+    args = parser.parse_args()
+    main(args.input, args.repeat)
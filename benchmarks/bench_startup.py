@@ -0,0 +1,47 @@
+import argparse
+import subprocess
+import sys
+import time
+from assignment1.models import models
+
+
+def time_command(command, repeat):
+    # Run a command several times and return the best wall time in seconds
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(command, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def time_model_loads(names):
+    # Time the first load of each model through the registry
+    timings = {}
+    for name in names:
+        start = time.perf_counter()
+        models.get(name)
+        timings[name] = time.perf_counter() - start
+    return timings
+
+
+def main(repeat, load_models):
+    commands = [
+        ("python startup", [sys.executable, "-c", "pass"]),
+        ("import assignment1.main", [sys.executable, "-c", "import assignment1.main"]),
+        ("censoror.py --help", [sys.executable, "censoror.py", "--help"]),
+    ]
+    for name, command in commands:
+        print(f"{name:>24}: {time_command(command, repeat) * 1000:8.1f} ms")
+
+    if load_models:
+        for name, seconds in time_model_loads(["spacy", "hugging_face"]).items():
+            print(f"{'load ' + name:>24}: {seconds * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure CLI startup time and model load time.")
+    parser.add_argument("--repeat", type=int, default=5, help="Number of timed runs, the best one is reported.")
+    parser.add_argument("--load-models", action="store_true", help="Also time the first load of every model.")
+    args = parser.parse_args()
+    main(args.repeat, args.load_models)
@@ -1,44 +1,671 @@
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from glob import glob
 from pathlib import Path
-from assignment1.utils import output_stats, extract_arguments, arguments_parser
-from assignment1.main import censor_with_spacy, censor_with_hf, censor_with_regex, write_censored_file
+import multiprocessing
+import sys
+from assignment1.utils import extract_arguments, arguments_parser, merge_arguments_parser, ENTITY_TYPES, ENGINES
+from assignment1.main import (censor_with_rules, censor_with_spacy, censor_batch_with_spacy, censor_with_hf,
+                              censor_batch_with_hf, censor_with_regex, write_censored_file, models_for, engine_labels,
+                              label_engines, redact_spans)
+from assignment1.cache import ResultCache, cache_key, censored_spans, DEFAULT_CACHE_PATH
+from assignment1.models import models, use_hf_backend, torch_threads, torch_threads_per_worker
+from assignment1.streaming import censor_stream, merge_window_stats, STREAM_OVERLAP_CHARS
+from assignment1.mmapio import map_file, mapped_blocks, byte_spans, write_patched, MMAP_BLOCK_BYTES
+from assignment1.email_headers import split_email
+from assignment1.instrumentation import metrics, profiled
+from assignment1.ingest import run_ingest, INGEST_QUEUE_SIZE, INGEST_IO_WORKERS
+from assignment1.stats import StatsCollector
+from assignment1.spans import SpanWriter
+from assignment1.shard import ShardManifest, find_manifests, manifest_path, merge_manifests, shard_files
+from assignment1 import gazetteer, dedup, prefilter
+from assignment1.dedup import Deduplicator, split_paragraphs, use_dedup
+from assignment1.prefilter import Prefilter, use_prefilter
+from assignment1.gazetteer import Gazetteer, use_gazetteer, without_covered_labels
+from assignment1.server import (create_server, serve, SERVER_MAX_BATCH, SERVER_BATCH_WINDOW_SECONDS,
+                                SERVER_MAX_CONCURRENCY)
+from assignment1.watch import watch, WatchState, WATCH_STATE_NAME, WATCH_POLL_SECONDS, WATCH_DEBOUNCE_SECONDS
 
 
-def main(input_pattern, output_dir, entities_to_censor, stats_output):
-    # Find all text files
-    files_to_censor = glob(input_pattern)
+def censor_text(text_to_process, entities_to_censor, engine=None):
+    stats = {}
+    stages = engine_labels(entities_to_censor, engine)
 
-    # Process each file
-    for file_path in files_to_censor:
-        # Read a specific file
-        print("Current file: ", Path(file_path))
-        try:
+    # Process text with different models
+    censored_text = text_to_process
+    if stages["rules"]:
+        with metrics.time_stage("rules"):
+            censored_text = censor_with_rules(censored_text, stages["rules"], stats)  # censor by rules only
+    if gazetteer.active is not None:
+        with metrics.time_stage("gazetteer"):
+            censored_text, stages = censor_with_gazetteer(censored_text, entities_to_censor, stages, stats)
+    with metrics.time_stage("spacy"):
+        censored_text = censor_with_spacy(censored_text, stages["spacy"], stats)  # censor by Spacy
+    with metrics.time_stage("hf"):
+        censored_text = censor_with_hf(censored_text, stages["hugging_face"], stats)  # censor by Hugging face
+    with metrics.time_stage("regex"):
+        censored_text = censor_with_regex(censored_text, stages["spacy"], stats)  # censor by Regex and Spacy
+
+    if gazetteer.active is not None and gazetteer.active.learn:
+        gazetteer.active.observe(text_to_process, stats)
+    return censored_text, stats
+
+
+def censor_with_gazetteer(text_to_process, entities_to_censor, stages, stats):
+    # Censor the known people and places in one scan, the models can be skipped when nothing else is left
+    censored_text = gazetteer.active.censor(text_to_process, entities_to_censor, stats)
+    if gazetteer.active.skip_models and gazetteer.active.covers(censored_text):
+        stages = without_covered_labels(stages)
+    return censored_text, stages
+
+
+def run_modes(email_mode, engine):
+    # Everything besides the text and the flags that changes the censored output, part of the cache key
+    return (email_mode, engine, gazetteer.active.fingerprint() if gazetteer.active is not None else None,
+            dedup.active is not None, prefilter.active.fingerprint() if prefilter.active is not None else None)
+
+
+def plan_text(text_to_process, entities_to_censor, email_mode=False):
+    # Spans and stats found by cheap rules, plus the (start, end) segments that still need the models
+    if email_mode:
+        planned = split_email(text_to_process, entities_to_censor)
+        if planned is not None:
+            return planned
+    return [], {}, [(0, len(text_to_process))]
+
+
+def merge_segments(text_to_process, spans, stats, segments, censored_segments):
+    # Map the censored segments back into the text and apply every span in a single pass
+    if not spans and segments == [(0, len(text_to_process))]:
+        # Nothing was split off, the censored segment is the censored text
+        return censored_segments[0]
+    for (start, end), (censored_segment, segment_stats) in zip(segments, censored_segments):
+        spans.extend((span_start + start, span_end + start)
+                     for span_start, span_end in censored_spans(censored_segment))
+        merge_window_stats(stats, segment_stats, 0, end - start, start)
+    return redact_spans(text_to_process, spans), stats
+
+
+def model_segments(text_to_process, segments, entities_to_censor):
+    # With dedup or the prefilter the segments are split into paragraphs, so a repeated paragraph is censored only
+    # once and paragraphs without any entity cue are not censored at all
+    if dedup.active is None and prefilter.active is None:
+        return segments
+    paragraphs = [paragraph for start, end in segments
+                  for paragraph in split_paragraphs(text_to_process, start, end)]
+    if prefilter.active is not None:
+        paragraphs = prefilter.active.candidates(text_to_process, paragraphs, entities_to_censor)
+    return paragraphs
+
+
+def censor_segments(documents, entities_to_censor, email_mode, engine, censor_all):
+    # Censor the segment texts of every document, censor_all(texts) returns (censored_text, stats) for each text
+    if dedup.active is not None:
+        return dedup.active.censor(documents, entities_to_censor, run_modes(email_mode, engine), censor_all)
+    censored = censor_all([segment for segments in documents for segment in segments])
+    results = []
+    position = 0
+    for segments in documents:
+        results.append(censored[position:position + len(segments)])
+        position += len(segments)
+    return results
+
+
+def censor_document(text_to_process, entities_to_censor, email_mode=False, engine=None):
+    spans, stats, segments = plan_text(text_to_process, entities_to_censor, email_mode)
+    segments = model_segments(text_to_process, segments, entities_to_censor)
+    # Only the segments left by the rules go through the models
+    censored_segments = censor_segments([[text_to_process[start:end] for start, end in segments]], entities_to_censor,
+                                        email_mode, engine,
+                                        lambda texts: [censor_text(text, entities_to_censor, engine)
+                                                       for text in texts])[0]
+    return merge_segments(text_to_process, spans, stats, segments, censored_segments)
+
+
+def cached_censor_text(text_to_process, entities_to_censor, cache, email_mode=False, engine=None):
+    # Reuse the spans and stats stored for unchanged inputs, run the models only on a cache miss
+    if cache is None:
+        return censor_document(text_to_process, entities_to_censor, email_mode, engine)
+
+    key = cache_key(text_to_process, entities_to_censor, *run_modes(email_mode, engine))
+    cached = cache.get(key)
+    if cached is not None:
+        spans, stats = cached
+        return redact_spans(text_to_process, spans), stats
+
+    censored_text, stats = censor_document(text_to_process, entities_to_censor, email_mode, engine)
+    cache.put(key, censored_spans(censored_text), stats)
+    return censored_text, stats
+
+
+def read_file(file_path):
+    # Read a specific file, None when it cannot be read
+    print("Current file: ", Path(file_path))
+    try:
+        with metrics.time_stage("read"):
             text_to_process = Path(file_path).read_text(encoding="utf-8")
-        except Exception as e:
-            print(f"Error reading file {file_path}: {e}")
-            continue
+    except Exception as e:
+        print(f"Error reading file {file_path}: {e}")
+        return None
+    metrics.record_file(file_path, len(text_to_process))
+    return text_to_process
+
 
-        stats = {}
+def censored_file_path_of(file_path, output_dir):
+    return Path(output_dir) / (Path(file_path).stem + ".censored")
 
-        # Process text with different models
-        censored_text = censor_with_spacy(text_to_process, entities_to_censor, stats)  # censor by Spacy
-        censored_text = censor_with_hf(censored_text, entities_to_censor, stats)  # censor by Hugging face
-        censored_text = censor_with_regex(censored_text, entities_to_censor)  # censor by Regex and Spacy
 
-        # Create censored output file
-        censored_file_path = Path(output_dir) / (Path(file_path).stem + ".censored")
+def write_output(file_path, output_dir, censored_text, stats):
+    # Create censored output file
+    censored_file_path = censored_file_path_of(file_path, output_dir)
+    with metrics.time_stage("write"):
         write_censored_file(censored_text, censored_file_path)
+    return censored_file_path, stats
+
+
+def censor_file(file_path, output_dir, entities_to_censor, cache=None, email_mode=False, engine=None):
+    text_to_process = read_file(file_path)
+    if text_to_process is None:
+        return None
+
+    censored_text, stats = cached_censor_text(text_to_process, entities_to_censor, cache, email_mode, engine)
+    return write_output(file_path, output_dir, censored_text, stats)
+
+
+def censor_file_mapped(file_path, output_dir, entities_to_censor, cache=None, email_mode=False, engine=None):
+    # Censor a memory-mapped file one block at a time and write it by patching the redacted byte ranges,
+    # so the whole text is never decoded or copied at once
+    print("Current file: ", Path(file_path))
+    try:
+        mapping = map_file(file_path)
+    except OSError as e:
+        print(f"Error reading file {file_path}: {e}")
+        return None
+
+    censored_file_path = censored_file_path_of(file_path, output_dir)
+    with mapping as data:
+        try:
+            patches, stats, chars = censor_mapped(data, entities_to_censor, cache, email_mode, engine)
+        except UnicodeDecodeError as e:
+            print(f"Error reading file {file_path}: {e}")
+            return None
+        metrics.record_file(file_path, chars)
+        with metrics.time_stage("write"):
+            write_patched(data, censored_file_path, patches)
+    return censored_file_path, stats
+
+
+def plan_mapped(data, entities_to_censor, email_mode=False):
+    # Byte patches and stats found by the header rules, the (byte_start, char_start, text) of the header parts left
+    # for the models, and the byte and character offsets of the body. Only the header block is decoded.
+    if email_mode:
+        header_end = data.find(b"\n\n")
+        if header_end != -1:
+            header_text = data[:header_end + 2].decode("utf-8")
+            planned = split_email(header_text, entities_to_censor)
+            if planned is not None:
+                spans, stats, segments = planned
+                patches = byte_spans(header_text, sorted((start, end) for start, end, _ in spans))
+                parts = [(byte_start, start, header_text[start:end])
+                         for (byte_start, _), (start, end) in zip(byte_spans(header_text, segments), segments)]
+                return patches, stats, parts, header_end + 2, len(header_text)
+    return [], {}, [], 0, 0
+
+
+def censor_mapped(data, entities_to_censor, cache=None, email_mode=False, engine=None, block_bytes=MMAP_BLOCK_BYTES,
+                  overlap_chars=STREAM_OVERLAP_CHARS):
+    # Redacted (start, end) byte ranges, stats and length in characters of a mapped file.
+    # The body is decoded and censored one block of at most block_bytes at a time. Like censor_stream, each block is
+    # censored together with the end of the previous block and the start of the next one, so entities that cross a
+    # block edge are censored on both sides of it.
+    patches, stats, parts, body_start, chars = plan_mapped(data, entities_to_censor, email_mode)
+    for byte_start, char_start, text in parts:
+        censor_mapped_text(text, byte_start, char_start, entities_to_censor, cache, engine, patches, stats)
+    blocks = mapped_blocks(data, body_start, block_bytes=block_bytes)
+    texts = (read_mapped_block(data, block_start, block_end) for block_start, block_end in blocks)
+    previous, current = "", next(texts, None)
+    for block_start, _ in blocks:
+        following = next(texts, None)
+        head = previous[-overlap_chars:] if overlap_chars else ""
+        tail = following[:overlap_chars] if following and overlap_chars else ""
+        censor_mapped_text(current, block_start, chars, entities_to_censor, cache, engine, patches, stats, head, tail)
+        chars += len(current)
+        previous, current = current, following
+    return patches, stats, chars
+
+
+def read_mapped_block(data, block_start, block_end):
+    with metrics.time_stage("read"):
+        return data[block_start:block_end].decode("utf-8")
+
+
+def censor_mapped_text(text, byte_start, char_start, entities_to_censor, cache, engine, patches, stats, head="",
+                       tail=""):
+    # Censor one decoded part of a mapped file with the head and tail of its neighbours around it, adding the byte
+    # patches and the stats of the part itself in whole-file offsets
+    censored_window, window_stats = cached_censor_text(head + text + tail, entities_to_censor, cache, engine=engine)
+    censored_text = censored_window[len(head):len(head) + len(text)]
+    patches.extend(byte_spans(text, censored_spans(censored_text), byte_start))
+    merge_window_stats(stats, window_stats, len(head), len(head) + len(text), char_start - len(head))
+
+
+def censor_files(file_paths, output_dir, entities_to_censor, batch_size=1, cache=None, email_mode=False,
+                 engine=None):
+    # Censor a group of files, batching the SpaCy and Hugging face passes across all of them
+    if batch_size <= 1:
+        return [censor_file(file_path, output_dir, entities_to_censor, cache, email_mode, engine)
+                for file_path in file_paths]
+
+    results = [None] * len(file_paths)
+    texts = {}
+    for index, file_path in enumerate(file_paths):
+        text_to_process = read_file(file_path)
+        if text_to_process is not None:
+            texts[index] = text_to_process
+
+    censored = cached_censor_batch(list(texts.values()), entities_to_censor, cache, email_mode, engine, batch_size)
+    for index, (censored_text, stats) in zip(texts, censored):
+        results[index] = write_output(file_paths[index], output_dir, censored_text, stats)
+
+    return results
+
+
+def cached_censor_batch(texts, entities_to_censor, cache=None, email_mode=False, engine=None, batch_size=1):
+    # Batched counterpart of cached_censor_text, returns (censored_text, stats) for every text
+    censored = [None] * len(texts)
+    plans = []
+    for index, text_to_process in enumerate(texts):
+        # Cache hits skip inference, only the misses go into the batch
+        key = None
+        cached = None
+        if cache is not None:
+            key = cache_key(text_to_process, entities_to_censor, *run_modes(email_mode, engine))
+            cached = cache.get(key)
+        if cached is not None:
+            spans, stats = cached
+            censored[index] = (redact_spans(text_to_process, spans), stats)
+        else:
+            spans, stats, segments = plan_text(text_to_process, entities_to_censor, email_mode)
+            segments = model_segments(text_to_process, segments, entities_to_censor)
+            plans.append((index, key, text_to_process, spans, stats, segments))
+
+    # Every segment that needs the models, across all texts of the batch, goes through them in one call
+    censored_segments = censor_segments([[text_to_process[start:end] for start, end in segments]
+                                         for _, _, text_to_process, _, _, segments in plans],
+                                        entities_to_censor, email_mode, engine,
+                                        lambda texts: censor_batch(texts, entities_to_censor, engine, batch_size))
+
+    for (index, key, text_to_process, spans, stats, segments), text_segments in zip(plans, censored_segments):
+        censored_text, stats = merge_segments(text_to_process, spans, stats, segments, text_segments)
+        if cache is not None:
+            cache.put(key, censored_spans(censored_text), stats)
+        censored[index] = (censored_text, stats)
+
+    return censored
+
+
+def censor_batch(texts, entities_to_censor, engine, batch_size):
+    # Batched counterpart of censor_text, returns (censored_text, stats) for every text
+    stats_list = [{} for _ in texts]
+    stages = engine_labels(entities_to_censor, engine)
+    censored_texts = texts
+    if stages["rules"]:
+        with metrics.time_stage("rules"):
+            censored_texts = [censor_with_rules(text, stages["rules"], stats)
+                              for text, stats in zip(censored_texts, stats_list)]
+    stages_list = [stages] * len(texts)
+    if gazetteer.active is not None:
+        with metrics.time_stage("gazetteer"):
+            gazetteer_results = [censor_with_gazetteer(text, entities_to_censor, stages, stats)
+                                 for text, stats in zip(censored_texts, stats_list)]
+        censored_texts = [censored_text for censored_text, _ in gazetteer_results]
+        stages_list = [text_stages for _, text_stages in gazetteer_results]
+
+    # Texts fully covered by the gazetteer need fewer labels, so they are batched separately
+    groups = {}
+    for index, text_stages in enumerate(stages_list):
+        group_key = tuple((stage, tuple(labels)) for stage, labels in text_stages.items())
+        groups.setdefault(group_key, (text_stages, []))[1].append(index)
+
+    censored_texts = list(censored_texts)
+    for text_stages, indices in groups.values():
+        group_texts = [censored_texts[index] for index in indices]
+        group_stats = [stats_list[index] for index in indices]
+        with metrics.time_stage("spacy"):
+            group_texts = censor_batch_with_spacy(group_texts, text_stages["spacy"], group_stats,
+                                                  batch_size=batch_size)
+        with metrics.time_stage("hf"):
+            group_texts = censor_batch_with_hf(group_texts, text_stages["hugging_face"], group_stats)
+        for index, censored_text in zip(indices, group_texts):
+            with metrics.time_stage("regex"):
+                # censor by Regex and Spacy
+                censored_texts[index] = censor_with_regex(censored_text, text_stages["spacy"],
+                                                          stats_list[index])
+
+    if gazetteer.active is not None and gazetteer.active.learn:
+        for text, stats in zip(texts, stats_list):
+            gazetteer.active.observe(text, stats)
+    return list(zip(censored_texts, stats_list))
+
+
+def censor_files_async(file_paths, output_dir, entities_to_censor, cache=None, email_mode=False, engine=None,
+                       queue_size=INGEST_QUEUE_SIZE, io_workers=INGEST_IO_WORKERS, on_result=None):
+    # Reader, model and writer stages connected by bounded queues, so the models run while files are read and written.
+    # Given on_result, every (censored_file_path, stats) result is passed to it as soon as its file is written.
+    return run_ingest(file_paths, read_file,
+                      lambda text: cached_censor_text(text, entities_to_censor, cache, email_mode, engine),
+                      lambda file_path, censored_text, stats: write_output(file_path, output_dir, censored_text, stats),
+                      queue_size, io_workers, on_result)
+
+
+def censor_file_streaming(file_path, output_dir, entities_to_censor, engine=None):
+    # Censor one input in bounded chunks, "-" reads from stdin and an output dir of "-" writes to stdout
+    to_stdout = output_dir == "-"
+    if not to_stdout:
+        print("Current file: ", Path(file_path))
+
+    try:
+        input_stream = sys.stdin if file_path == "-" else open(file_path, 'r', encoding='utf-8')
+    except Exception as e:
+        print(f"Error reading file {file_path}: {e}", file=sys.stderr if to_stdout else sys.stdout)
+        return None
+
+    if to_stdout:
+        censored_file_path = "<stdout>"
+        output_stream = sys.stdout
+    else:
+        stem = "stdin" if file_path == "-" else Path(file_path).stem
+        censored_file_path = Path(output_dir) / (stem + ".censored")
+        output_stream = open(censored_file_path, 'w', encoding='utf-8')
+
+    try:
+        stats = censor_stream(input_stream, output_stream, lambda text: censor_text(text, entities_to_censor, engine))
+    finally:
+        if input_stream is not sys.stdin:
+            input_stream.close()
+        if output_stream is not sys.stdout:
+            output_stream.close()
+
+    return censored_file_path, stats
+
+
+def split_into_batches(files_to_censor, batch_size):
+    # Group the file list into consecutive batches
+    batch_size = max(1, batch_size)
+    return [files_to_censor[i:i + batch_size] for i in range(0, len(files_to_censor), batch_size)]
+
+
+def censor_files_watching(input_pattern, output_dir, entities_to_censor, watch_state, cache=None, email_mode=False,
+                          engine=None, poll_seconds=WATCH_POLL_SECONDS, debounce_seconds=WATCH_DEBOUNCE_SECONDS):
+    # Censor new and changed files as they arrive, with the models kept loaded, until interrupted
+    try:
+        for file_path in watch(input_pattern, watch_state, poll_seconds, debounce_seconds):
+            yield censor_file(file_path, output_dir, entities_to_censor, cache, email_mode, engine)
+    except KeyboardInterrupt:
+        print("Stopped watching", input_pattern)
+
+
+def _censor_files_worker(task):
+    # Unpack the task so it can be shipped through ProcessPoolExecutor.map
+    file_paths, output_dir, entities_to_censor, batch_size, cache, email_mode, engine = task
+    metrics.reset()
+    results = censor_files(file_paths, output_dir, entities_to_censor, batch_size, cache, email_mode, engine)
+
+    # Ship the worker's stage timings and entity observations back so the parent can merge them for the whole run
+    return results, metrics.snapshot(), gazetteer.active.snapshot() if gazetteer.active is not None else {}
+
+
+def _init_worker(entities_to_censor, engine=None, gazetteer_index=None, hf_backend="torch", deduplicator=None,
+                 segment_filter=None):
+    # Load the models a worker needs once, before it picks up its first task
+    use_gazetteer(gazetteer_index)
+    use_dedup(deduplicator)
+    use_prefilter(segment_filter)
+    use_hf_backend(hf_backend)
+    models.warmup(models_for(entities_to_censor, engine))
+
+
+def censor_files_in_pool(files_to_censor, output_dir, entities_to_censor, workers, batch_size=1, cache=None,
+                         email_mode=False, engine=None, hf_backend="torch"):
+    tasks = [(file_paths, output_dir, entities_to_censor, batch_size, cache, email_mode, engine)
+             for file_paths in split_into_batches(files_to_censor, batch_size)]
+    chunk_size = max(1, len(tasks) // (workers * 4))
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker,
+                             initargs=(entities_to_censor, engine, gazetteer.active, hf_backend,
+                                       dedup.active, prefilter.active)) as executor:
+        # map keeps the input order, so the merged stats report matches serial mode.
+        # Results are handed on as the batches finish, so a sharded run journals them as it goes.
+        for batch_results, worker_metrics, observed in executor.map(_censor_files_worker, tasks, chunksize=chunk_size):
+            metrics.merge(worker_metrics)
+            if gazetteer.active is not None:
+                gazetteer.active.merge(observed)
+            yield from batch_results
+
+
+def censor_files_threaded(files_to_censor, output_dir, entities_to_censor, threads, batch_size=1, cache=None,
+                          email_mode=False, engine=None):
+    # Worker threads that share the models loaded once in this process, instead of one copy per worker process.
+    # They overlap while torch and SpaCy run without the GIL, the Python parts of the pipeline still take turns.
+    models.warmup(models_for(entities_to_censor, engine))
+    with torch_threads(torch_threads_per_worker(threads)), \
+            ThreadPoolExecutor(max_workers=threads, thread_name_prefix="censor") as executor:
+        # map keeps the input order, like the process pool
+        for batch_results in executor.map(
+                lambda file_paths: censor_files(file_paths, output_dir, entities_to_censor, batch_size, cache,
+                                                email_mode, engine),
+                split_into_batches(files_to_censor, batch_size)):
+            yield from batch_results
+
+
+def main(input_pattern, output_dir, entities_to_censor, stats_output, workers=1, batch_size=1, warmup=False,
+         stream=False, cache=None, metrics_out=None, profile=None, email_mode=False, engine=None, async_io=False,
+         queue_size=INGEST_QUEUE_SIZE, io_workers=INGEST_IO_WORKERS, stats_format="text", gazetteer_index=None,
+         hf_backend="torch", watch_state=None, watch_interval=WATCH_POLL_SECONDS,
+         watch_debounce=WATCH_DEBOUNCE_SECONDS, dedup_paragraphs=False, prefilter_threshold=None,
+         spans_output=None, spans_format=None, shard=None, mmap_io=False, threads=1):
+    use_gazetteer(gazetteer_index)
+    use_dedup(Deduplicator() if dedup_paragraphs else None)
+    use_prefilter(Prefilter(prefilter_threshold) if prefilter_threshold is not None else None)
+    use_hf_backend(hf_backend)
+    span_writer = None
+    if spans_output:
+        span_writer = SpanWriter(spans_output, spans_format, label_engines(entities_to_censor, engine))
+    shard_manifest = None
+    if shard is not None:
+        # Journal of the files this shard already censored, a rerun resumes after them
+        shard_manifest = ShardManifest(manifest_path(output_dir, *shard), *shard,
+                                       shard_settings(entities_to_censor, email_mode, engine, hf_backend)).load()
+    with profiled(profile), StatsCollector(stats_output, stats_format, span_writer) as stats_collector:
+        metrics.reset()
+        try:
+            run(input_pattern, output_dir, entities_to_censor, stats_collector, workers, batch_size, warmup, stream,
+                cache, email_mode, engine, async_io, queue_size, io_workers, hf_backend, watch_state, watch_interval,
+                watch_debounce, shard_manifest, mmap_io, threads)
+        finally:
+            if shard_manifest is not None:
+                shard_manifest.close()
+        if dedup_paragraphs:
+            # Share of exact duplicate documents, paragraphs and characters served from memory, for the summary
+            stats_collector.hit_rates = {name: rate for name, rate in metrics.hit_rates().items()
+                                         if name.startswith("dedup_")}
+
+    # Keep the index, with what this run learned, for the next runs
+    if gazetteer_index is not None and gazetteer_index.path is not None:
+        gazetteer_index.save()
+
+    # Aggregate throughput and stage timings for the whole run
+    if metrics_out:
+        metrics.write(metrics_out)
+
+
+def shard_settings(entities_to_censor, email_mode, engine, hf_backend="torch"):
+    # Flags that must stay the same across the runs of a shard, or a resumed run would censor its files differently
+    return {'entities': sorted(set(entities_to_censor)), 'email': email_mode, 'engine': engine,
+            'prefilter': prefilter.active.fingerprint() if prefilter.active is not None else None,
+            'gazetteer': gazetteer.active.shard_setting() if gazetteer.active is not None else None,
+            'dedup': dedup.active is not None, 'hf_backend': hf_backend}
+
+
+def merge_shards(output_dir, stats_output, stats_format="text"):
+    # Write the stats journaled by every shard of output_dir as the stats of one run, returns the incomplete shards
+    manifest_paths = find_manifests(output_dir)
+    if not manifest_paths:
+        raise ValueError("No shard journal found")
+    with StatsCollector(stats_output, stats_format) as stats_collector:
+        return merge_manifests(manifest_paths, stats_collector)
+
+
+def parse_censor_request(body, engine=None):
+    # {"text": ..., "names": true, "dates": true, "phones": true, "address": true, "engine": ...} of a service request
+    if not isinstance(body.get('text'), str):
+        raise ValueError('The body needs a "text" string')
+    engine = body.get('engine', engine)
+    if engine is not None and engine not in ENGINES:
+        raise ValueError(f"Unknown engine {engine}, use one of {', '.join(ENGINES)}")
+
+    entities_to_censor = []
+    for entity_type, labels in ENTITY_TYPES.items():
+        if body.get(entity_type):
+            entities_to_censor.extend(labels)
+    return body['text'], entities_to_censor, engine
+
+
+def serve_censoring(entities_to_censor, host, port, cache=None, email_mode=False, engine=None,
+                    max_batch=SERVER_MAX_BATCH, window_seconds=SERVER_BATCH_WINDOW_SECONDS,
+                    max_concurrency=SERVER_MAX_CONCURRENCY, hf_backend="torch", gazetteer_index=None,
+                    dedup_paragraphs=False, prefilter_threshold=None):
+    # Censor the texts posted to the HTTP service, the models are loaded once for all requests
+    use_gazetteer(gazetteer_index)
+    use_dedup(Deduplicator() if dedup_paragraphs else None)
+    use_prefilter(Prefilter(prefilter_threshold) if prefilter_threshold is not None else None)
+    use_hf_backend(hf_backend)
+    # The CLI flags choose the models loaded up front, requests can still ask for others
+    models.warmup(models_for(entities_to_censor, engine))
+
+    server = create_server(lambda texts, entities, request_engine: cached_censor_batch(
+        texts, entities, cache, email_mode, request_engine, max_batch),
+        lambda body: parse_censor_request(body, engine), host, port, max_batch, window_seconds, max_concurrency)
+    serve(server)
+
+    if gazetteer_index is not None and gazetteer_index.path is not None:
+        gazetteer_index.save()
+
+
+def run(input_pattern, output_dir, entities_to_censor, stats_collector, workers, batch_size, warmup, stream, cache,
+        email_mode, engine, async_io, queue_size, io_workers, hf_backend="torch", watch_state=None,
+        watch_interval=WATCH_POLL_SECONDS, watch_debounce=WATCH_DEBOUNCE_SECONDS, shard_manifest=None, mmap_io=False,
+        threads=1):
+    # Find all text files, "-" stands for stdin
+    files_to_censor = ["-"] if input_pattern == "-" else glob(input_pattern)
+    if shard_manifest is not None:
+        # This shard's part of the sorted files, without the ones an earlier run of the shard finished
+        files_to_censor = [file_path for file_path in
+                           shard_files(files_to_censor, shard_manifest.index, shard_manifest.count)
+                           if not shard_manifest.done(censored_file_path_of(file_path, output_dir))]
+
+    # Models are otherwise loaded lazily, on first use, by whichever stage needs them.
+    # The watch mode keeps them for its whole life, so they are always loaded up front.
+    if (warmup and workers <= 1) or watch_state is not None:
+        models.warmup(models_for(entities_to_censor, engine))
+
+    def record_result(result):
+        if result is None:
+            return
 
         # Stats for output
-        output_stats(stats, stats_output, censored_file_path)
+        censored_file_path, stats = result
+        stats_collector.add(censored_file_path, stats)
+        if watch_state is not None:
+            # A watch run never ends on its own, its records are written as the files come in
+            stats_collector.flush()
+        if shard_manifest is not None:
+            # Only once the censored file is written, a crash before this line censors the file again
+            shard_manifest.record(censored_file_path, stats)
+
+    # Process each file
+    if watch_state is not None:
+        results = censor_files_watching(input_pattern, output_dir, entities_to_censor, watch_state, cache, email_mode,
+                                        engine, watch_interval, watch_debounce)
+    elif stream or input_pattern == "-" or output_dir == "-":
+        results = (censor_file_streaming(file_path, output_dir, entities_to_censor, engine)
+                   for file_path in files_to_censor)
+    elif mmap_io:
+        results = (censor_file_mapped(file_path, output_dir, entities_to_censor, cache, email_mode, engine)
+                   for file_path in files_to_censor)
+    elif threads > 1 and len(files_to_censor) > 1:
+        results = censor_files_threaded(files_to_censor, output_dir, entities_to_censor, threads, batch_size, cache,
+                                        email_mode, engine)
+    elif workers > 1 and len(files_to_censor) > 1:
+        results = censor_files_in_pool(files_to_censor, output_dir, entities_to_censor, workers, batch_size, cache,
+                                       email_mode, engine, hf_backend)
+    elif async_io:
+        # The writer tasks record every file as soon as it is written, a crash keeps the progress made so far
+        censor_files_async(files_to_censor, output_dir, entities_to_censor, cache, email_mode, engine, queue_size,
+                           io_workers, record_result)
+        results = ()
+    elif batch_size > 1:
+        results = (result for file_paths in split_into_batches(files_to_censor, batch_size)
+                   for result in censor_files(file_paths, output_dir, entities_to_censor, batch_size, cache,
+                                              email_mode, engine))
+    else:
+        results = (censor_file(file_path, output_dir, entities_to_censor, cache, email_mode, engine)
+                   for file_path in files_to_censor)
+
+    for result in results:
+        record_result(result)
+
+    if shard_manifest is not None:
+        shard_manifest.finish()
 
 
 if __name__ == "__main__":
+    if sys.argv[1:2] == ["merge"]:
+        # Combine the stats journaled by the shards of a --shard run
+        merge_args = merge_arguments_parser(sys.argv[2:])
+        try:
+            incomplete = merge_shards(merge_args.output, merge_args.stats, merge_args.stats_format)
+        except ValueError as e:
+            print(f"Cannot merge the shards in {merge_args.output}: {e}", file=sys.stderr)
+            sys.exit(1)
+        if incomplete:
+            print(f"Shards {', '.join(map(str, incomplete))} have not finished, their stats are missing or partial",
+                  file=sys.stderr)
+        sys.exit(1 if incomplete else 0)
+
     # Parse all command-line arguments
     args = arguments_parser()
 
     input_path, output_path, out_stats, censor_entities = extract_arguments(args)
+    result_cache = None if args.no_cache else ResultCache(args.cache_path or DEFAULT_CACHE_PATH,
+                                                              args.cache_size_mb * 1024 * 1024)
+
+    gazetteer_index = None
+    if args.gazetteer or args.gazetteer_seed:
+        gazetteer_index = Gazetteer(args.gazetteer, learn=args.gazetteer_learn,
+                                    skip_models=args.gazetteer_skip_models).load()
+        if args.gazetteer_seed:
+            gazetteer_index.load_seed(args.gazetteer_seed)
+
+    prefilter_threshold = args.prefilter_threshold if args.prefilter else None
 
-    # Process the files with the specified censorship criteria
-    main(input_path, output_path, censor_entities, out_stats)
+    if args.serve:
+        # Censor the texts posted over HTTP instead of files
+        serve_censoring(censor_entities, args.host, args.port, cache=result_cache, email_mode=args.email,
+                        engine=args.engine, max_batch=args.max_batch, window_seconds=args.batch_window_ms / 1000,
+                        max_concurrency=args.max_concurrency, hf_backend=args.hf_backend,
+                        gazetteer_index=gazetteer_index, dedup_paragraphs=args.dedup,
+                        prefilter_threshold=prefilter_threshold)
+    else:
+        watch_state = None
+        if args.watch:
+            watch_state = WatchState(args.watch_state or Path(output_path) / WATCH_STATE_NAME).load()
 
+        # Process the files with the specified censorship criteria
+        main(input_path, output_path, censor_entities, out_stats, workers=args.workers, batch_size=args.batch_size,
+             warmup=args.warmup, stream=args.stream, cache=result_cache, metrics_out=args.metrics_out,
+             profile=args.profile, email_mode=args.email, engine=args.engine, async_io=args.async_io,
+             queue_size=args.queue_size, io_workers=args.io_workers, stats_format=args.stats_format,
+             gazetteer_index=gazetteer_index, hf_backend=args.hf_backend,
+             watch_state=watch_state, watch_interval=args.watch_interval, watch_debounce=args.watch_debounce,
+             dedup_paragraphs=args.dedup, prefilter_threshold=prefilter_threshold, spans_output=args.spans_out,
+             spans_format=args.spans_format, shard=args.shard, mmap_io=args.mmap, threads=args.threads)
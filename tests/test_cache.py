@@ -0,0 +1,108 @@
+import itertools
+import pickle
+from assignment1 import cache
+
+
+def test_cache_key_depends_on_text_flags_and_versions(mocker):
+    # Execute
+    key = cache.cache_key("Hello John", ['PERSON', 'DATE'])
+
+    # Asserts
+    assert key == cache.cache_key("Hello John", ['DATE', 'PERSON'])
+    assert key != cache.cache_key("Hello Jane", ['PERSON', 'DATE'])
+    assert key != cache.cache_key("Hello John", ['PERSON'])
+    mocker.patch('assignment1.cache.model_versions', return_value='newer models')
+    assert key != cache.cache_key("Hello John", ['PERSON', 'DATE'])
+
+
+def test_model_versions_depend_on_hf_backend(mocker):
+    # Execute
+    versions = cache.model_versions()
+    mocker.patch('assignment1.models.hf_backend', 'quantized')
+
+    # Asserts
+    assert versions != cache.model_versions()
+    assert cache.model_versions().endswith("backend=quantized")
+
+
+def test_censored_spans():
+    # Execute
+    result = cache.censored_spans("████ met ███ on Monday.")
+
+    # Assert
+    assert result == [(0, 4), (9, 12)]
+
+
+def test_result_cache_round_trip(tmp_path):
+    # Initialize
+    result_cache = cache.ResultCache(tmp_path / "results.sqlite3")
+    stats = {'PERSON': {'count': 1, 'indices': [(0, 4)]}, 'B-PER': 2}
+
+    # Execute
+    result_cache.put('key', [(0, 4)], stats)
+    result = result_cache.get('key')
+
+    # Asserts
+    assert result == ([(0, 4)], stats)
+    assert result_cache.get('missing') is None
+
+
+def test_result_cache_evicts_least_recently_used(mocker, tmp_path):
+    # Mock
+    mocker.patch('assignment1.cache.time.time', side_effect=itertools.count())
+
+    # Initialize: every record takes 10 bytes, so only two fit
+    result_cache = cache.ResultCache(tmp_path / "results.sqlite3", max_bytes=25)
+
+    # Execute
+    result_cache.put('first', [(0, 4)], {})
+    result_cache.put('second', [(0, 4)], {})
+    result_cache.get('first')
+    result_cache.put('third', [(0, 4)], {})
+
+    # Asserts
+    assert result_cache.get('second') is None
+    assert result_cache.get('first') is not None
+
+
+def test_result_cache_keeps_running_size(tmp_path):
+    # Initialize: every record takes 10 bytes, so only two fit
+    result_cache = cache.ResultCache(tmp_path / "results.sqlite3", max_bytes=25)
+
+    # Execute
+    result_cache.put('first', [(0, 4)], {})
+    result_cache.put('first', [(0, 4), (5, 9)], {})
+    result_cache.put('second', [(0, 4)], {})
+    result_cache.put('third', [(0, 4)], {})
+
+    # Asserts
+    total = result_cache.connection.execute("SELECT SUM(size) FROM results").fetchone()[0]
+    assert result_cache.total_size() == total == 20
+
+
+def test_result_cache_sums_size_of_older_cache_once(tmp_path):
+    # Initialize: a cache file written before the running size existed
+    result_cache = cache.ResultCache(tmp_path / "results.sqlite3")
+    result_cache.put('first', [(0, 4)], {})
+    with result_cache.connection:
+        result_cache.connection.execute("DROP TABLE cache_size")
+    result_cache.close()
+
+    # Execute
+    reopened = cache.ResultCache(tmp_path / "results.sqlite3")
+    reopened.put('second', [(0, 4)], {})
+
+    # Assert
+    assert reopened.total_size() == 20
+
+
+def test_result_cache_pickles_without_connection(tmp_path):
+    # Initialize
+    result_cache = cache.ResultCache(tmp_path / "results.sqlite3")
+    result_cache.put('key', [], {})
+
+    # Execute
+    copy = pickle.loads(pickle.dumps(result_cache))
+
+    # Assert
+    assert copy.get('key') == ([], {})
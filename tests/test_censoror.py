@@ -1,6 +1,18 @@
+import json
+import io
+import os
+import re
+import threading
+import time
+import urllib.request
 import pytest
 from pathlib import Path
-from censoror import main
+import censoror
+from censoror import main, censor_file
+from assignment1.cache import ResultCache
+from assignment1.gazetteer import Gazetteer
+from assignment1.stats import add_stat
+from assignment1.watch import watch, WatchState
 
 
 @pytest.fixture
@@ -22,13 +34,19 @@ def mock_write_censored_file(mocker):
     return mocker.patch('censoror.write_censored_file')
 
 
+@pytest.fixture
+def mock_stats_collector(mocker):
+    # Mock the stats collector used by main, returns the collector entered by the with block
+    return mocker.patch('censoror.StatsCollector').return_value.__enter__.return_value
+
+
 @pytest.fixture
 def mock_censor_functions(mocker, stats=None):
     # Mock censoring functions
+    mocker.patch('censoror.censor_with_rules', side_effect=lambda text, entities, stats: text)
     mocker.patch('censoror.censor_with_spacy', side_effect=lambda text, entities, stats: text.replace('text', 'tx'))
     mocker.patch('censoror.censor_with_hf', side_effect=lambda text, entities, stats: text.replace('tx', 't*'))
-    mocker.patch('censoror.censor_with_regex', side_effect=lambda text, entities: text.replace('t*', '***'))
-    mocker.patch('censoror.output_stats', return_value=True)
+    mocker.patch('censoror.censor_with_regex', side_effect=lambda text, entities, stats: text.replace('t*', '***'))
 
 
 def test_main_empty_input(mock_write_censored_file):
@@ -69,3 +87,674 @@ def test_main_stderr_output(mock_glob, mock_read_text, mock_write_censored_file,
     assert "Current file:  /sample/mock/path/file1.txt" in captured.out
     assert "Current file:  /sample/mock/path/file2.txt" in captured.out
 
+
+def test_censor_file_returns_path_and_stats(mock_read_text, mock_write_censored_file, mock_censor_functions):
+    # Execute
+    result = censor_file('/sample/mock/path/file1.txt', '/output/', ['PERSON'])
+
+    # Asserts
+    assert result == (Path('/output/file1.censored'), {})
+    mock_write_censored_file.assert_called_once_with('Sample ***', Path('/output/file1.censored'))
+
+
+def test_censor_file_read_error(mocker, mock_write_censored_file, capsys):
+    # Mock
+    mocker.patch('censoror.Path.read_text', side_effect=IOError("denied"))
+
+    # Execute
+    result = censor_file('/sample/mock/path/file1.txt', '/output/', ['PERSON'])
+
+    # Asserts
+    assert result is None
+    mock_write_censored_file.assert_not_called()
+    assert "Error reading file /sample/mock/path/file1.txt: denied" in capsys.readouterr().out
+
+
+def test_main_with_workers_keeps_input_order(mocker, mock_glob, mock_stats_collector):
+    # Mock
+    pool_results = [(Path('/output/file1.censored'), {'PERSON': 1}), None,
+                    (Path('/output/file2.censored'), {'DATE': 2})]
+    mock_pool = mocker.patch('censoror.censor_files_in_pool', return_value=pool_results)
+    mock_output_stats = mock_stats_collector.add
+
+    # Execute
+    main('*.txt', '/output/', ['PERSON', 'DATE'], 'stdout', workers=4)
+
+    # Asserts
+    mock_pool.assert_called_once_with(mock_glob.return_value, '/output/', ['PERSON', 'DATE'], 4, 1, None, False, None,
+                                      'torch')
+    assert mock_output_stats.call_args_list == [
+        mocker.call(Path('/output/file1.censored'), {'PERSON': 1}),
+        mocker.call(Path('/output/file2.censored'), {'DATE': 2}),
+    ]
+
+
+def test_main_serial_run_censors_entities_past_the_bert_context(mocker, tmp_path, mock_stats_collector):
+    # Mock
+    def tokenize(text, **kwargs):
+        return {'offset_mapping': [(match.start(), match.end()) for match in re.finditer(r"\S+", text)]}
+
+    nlp_hugging_face = mocker.MagicMock()
+    nlp_hugging_face.tokenizer.side_effect = tokenize
+    nlp_hugging_face.side_effect = lambda texts, **kwargs: [
+        [{'entity_group': 'PER', 'start': match.start(), 'end': match.end()} for match in re.finditer("Zed", text)]
+        for text in texts]
+    mocker.patch.dict(censoror.models.loaded, {'hugging_face': nlp_hugging_face})
+
+    # Initialize
+    (tmp_path / "long.txt").write_text("word " * 600 + "Zed wrote this.\n", encoding="utf-8")
+
+    # Execute
+    main(str(tmp_path / "*.txt"), str(tmp_path), ['B-PER'], 'stdout', batch_size=1, engine="hf")
+
+    # Asserts
+    assert (tmp_path / "long.censored").read_text(encoding="utf-8") == "word " * 600 + "███ wrote this.\n"
+    assert mock_stats_collector.add.call_args.args[1] == {'B-PER': {'count': 1, 'indices': [(3000, 3003)],
+                                                                    'engines': [2]}}
+    windows = [text for call in nlp_hugging_face.call_args_list for text in call.args[0]]
+    assert len(windows) == 2
+    assert all(len(tokenize(window)['offset_mapping']) <= 510 for window in windows)
+
+
+def test_main_with_threads_keeps_input_order(mocker, mock_glob, mock_stats_collector):
+    # Mock
+    thread_results = [(Path('/output/file1.censored'), {'PERSON': 1}), (Path('/output/file2.censored'), {'DATE': 2})]
+    mock_threaded = mocker.patch('censoror.censor_files_threaded', return_value=thread_results)
+    mock_pool = mocker.patch('censoror.censor_files_in_pool')
+
+    # Execute
+    main('*.txt', '/output/', ['PERSON', 'DATE'], 'stdout', threads=4, batch_size=2)
+
+    # Asserts
+    mock_threaded.assert_called_once_with(mock_glob.return_value, '/output/', ['PERSON', 'DATE'], 4, 2, None, False,
+                                          None)
+    mock_pool.assert_not_called()
+    assert [call.args[0].name for call in mock_stats_collector.add.call_args_list] == ["file1.censored",
+                                                                                        "file2.censored"]
+
+
+@pytest.mark.parametrize("batch_size", [1, 2])
+def test_main_threads_match_serial_run(mocker, tmp_path, batch_size):
+    # Mock
+    def censor_names(text, entities, stats):
+        for name in ("Allen", "Zoë"):
+            for start in [match.start() for match in re.finditer(name, text)]:
+                stats.setdefault('PERSON', {'count': 0, 'indices': []})
+                stats['PERSON']['count'] += 1
+                stats['PERSON']['indices'].append((start, start + len(name)))
+                text = text[:start] + "█" * len(name) + text[start + len(name):]
+        return text
+
+    mocker.patch('censoror.censor_with_rules', side_effect=lambda text, entities, stats: text)
+    mocker.patch('censoror.censor_with_spacy', side_effect=censor_names)
+    mocker.patch('censoror.censor_batch_with_spacy', side_effect=lambda texts, entities, stats_list, batch_size: [
+        censor_names(text, entities, stats) for text, stats in zip(texts, stats_list)])
+    mocker.patch('censoror.censor_with_hf', side_effect=lambda text, entities, stats: text)
+    mocker.patch('censoror.censor_batch_with_hf', side_effect=lambda texts, entities, stats_list: texts)
+    mocker.patch('censoror.censor_with_regex', side_effect=lambda text, entities, stats: text)
+    mock_warmup = mocker.patch('censoror.models.warmup')
+
+    # Initialize
+    (tmp_path / "input").mkdir()
+    for index in range(12):
+        (tmp_path / "input" / f"mail{index:02}.txt").write_text(
+            f"Hi Allen,\n\nZoë sent file {index}.\n\nThanks Allen\n", encoding="utf-8")
+    for mode in ("serial", "threads"):
+        (tmp_path / mode).mkdir()
+
+    # Execute
+    main(str(tmp_path / "input" / "*.txt"), str(tmp_path / "serial"), ['PERSON'], str(tmp_path / "serial.jsonl"),
+         batch_size=batch_size, stats_format="jsonl", dedup_paragraphs=True)
+    main(str(tmp_path / "input" / "*.txt"), str(tmp_path / "threads"), ['PERSON'], str(tmp_path / "threads.jsonl"),
+         threads=4, batch_size=batch_size, stats_format="jsonl", dedup_paragraphs=True)
+
+    # Asserts
+    mock_warmup.assert_called_once()
+    for index in range(12):
+        name = f"mail{index:02}.censored"
+        assert (tmp_path / "threads" / name).read_text(encoding="utf-8") == \
+            (tmp_path / "serial" / name).read_text(encoding="utf-8")
+    assert "Allen" not in (tmp_path / "threads" / "mail03.censored").read_text(encoding="utf-8")
+    records = {}
+    for mode in ("serial", "threads"):
+        with open(tmp_path / f"{mode}.jsonl", encoding="utf-8") as file:
+            records[mode] = [json.loads(line) for line in file]
+    assert [Path(record['file']).name for record in records['threads'][:-1]] == \
+        [Path(record['file']).name for record in records['serial'][:-1]]
+    summaries = {mode: records[mode][-1]['summary'] for mode in records}
+    assert summaries['threads']['totals'] == summaries['serial']['totals'] == {'PERSON': 36}
+    assert summaries['threads']['files'] == summaries['serial']['files'] == 12
+    # Threads that miss the same paragraph at once both censor it, so only the serial rate is exact
+    assert summaries['serial']['hit_rates']['dedup_paragraph'] == round(22 / 36, 6)
+    assert 'dedup_paragraph' in summaries['threads']['hit_rates']
+
+
+def test_main_with_batch_size(mocker, mock_glob, mock_read_text, mock_write_censored_file, mock_censor_functions):
+    # Mock
+    mock_batch = mocker.patch('censoror.censor_batch_with_spacy',
+                              side_effect=lambda texts, entities, stats_list, batch_size: [
+                                  text.replace('text', 'tx') for text in texts])
+    mocker.patch('censoror.censor_batch_with_hf',
+                 side_effect=lambda texts, entities, stats_list: [text.replace('tx', 't*') for text in texts])
+
+    # Execute
+    main('*.txt', '/output/', ['PERSON'], 'stdout', batch_size=2)
+
+    # Asserts
+    mock_batch.assert_called_once()
+    assert mock_batch.call_args.args[0] == ['Sample text', 'Sample text']
+    mock_write_censored_file.assert_any_call('Sample ***', Path('/output/file1.censored'))
+    mock_write_censored_file.assert_any_call('Sample ***', Path('/output/file2.censored'))
+
+
+@pytest.mark.parametrize("engine, expected", [
+    (None, ['spacy']),
+    ('ensemble', ['spacy']),
+    ('rules', ['rules']),
+])
+def test_main_warmup_loads_needed_models(mocker, mock_glob, mock_read_text, mock_write_censored_file,
+                                         mock_censor_functions, engine, expected):
+    # Mock
+    mock_warmup = mocker.patch('censoror.models.warmup')
+
+    # Execute
+    main('*.txt', '/output/', ['DATE'], 'stdout', warmup=True, engine=engine)
+
+    # Assert
+    mock_warmup.assert_called_once_with(expected)
+
+
+def test_main_rules_engine_skips_models(mocker, mock_glob, mock_read_text, mock_write_censored_file,
+                                        mock_censor_functions):
+    # Execute
+    main('*.txt', '/output/', ['PERSON', 'B-PER', 'I-PER', 'PHONE'], 'stdout', engine='rules')
+
+    # Asserts
+    assert censoror.censor_with_rules.call_args.args[1] == ['PHONE']
+    # Names have no rules, so they keep their default engine
+    assert censoror.censor_with_spacy.call_args.args[1] == ['PERSON']
+    assert censoror.censor_with_hf.call_args.args[1] == ['B-PER', 'I-PER']
+
+
+def test_main_stdin_to_stdout(mocker, monkeypatch, capsys, mock_stats_collector):
+    # Mock
+    mocker.patch('censoror.censor_text', side_effect=lambda text, entities, engine: (text.replace('Allen', '█████'), {}))
+    mock_output_stats = mock_stats_collector.add
+    monkeypatch.setattr('sys.stdin', io.StringIO("Mail from Phillip Allen\n"))
+
+    # Execute
+    main('-', '-', ['PERSON'], 'stderr')
+
+    # Asserts
+    assert capsys.readouterr().out == "Mail from Phillip █████\n"
+    mock_output_stats.assert_called_once_with('<stdout>', {})
+
+
+def test_main_stream_file(mocker, tmp_path):
+    # Mock
+    mocker.patch('censoror.censor_text', side_effect=lambda text, entities, engine: (text.replace('Allen', '█████'), {}))
+
+    # Initialize
+    input_file = tmp_path / "mail.txt"
+    input_file.write_text("Mail from Phillip Allen\n", encoding="utf-8")
+
+    # Execute
+    main(str(input_file), str(tmp_path), ['PERSON'], 'stdout', stream=True)
+
+    # Assert
+    assert (tmp_path / "mail.censored").read_text(encoding="utf-8") == "Mail from Phillip █████\n"
+
+
+def test_main_cache_skips_inference_for_unchanged_files(mocker, tmp_path, mock_stats_collector):
+    # Mock
+    mock_censor_text = mocker.patch('censoror.censor_text', side_effect=lambda text, entities, engine: (
+        text.replace('Allen', '█████'), {'PERSON': 1}))
+    mock_output_stats = mock_stats_collector.add
+
+    # Initialize
+    input_file = tmp_path / "mail.txt"
+    input_file.write_text("Mail from Phillip Allen\n", encoding="utf-8")
+    result_cache = ResultCache(tmp_path / "cache.sqlite3")
+
+    # Execute
+    main(str(input_file), str(tmp_path), ['PERSON'], 'stdout', cache=result_cache)
+    main(str(input_file), str(tmp_path), ['PERSON'], 'stdout', cache=result_cache)
+
+    # Asserts
+    assert mock_censor_text.call_count == 1
+    assert (tmp_path / "mail.censored").read_text(encoding="utf-8") == "Mail from Phillip █████\n"
+    assert mock_output_stats.call_args_list[0] == mock_output_stats.call_args_list[1]
+
+
+def test_main_writes_metrics(mock_glob, mock_read_text, mock_write_censored_file, mock_censor_functions, tmp_path):
+    # Execute
+    main('*.txt', '/output/', ['PERSON'], 'stdout', metrics_out=str(tmp_path / "metrics.json"))
+
+    # Asserts
+    with open(tmp_path / "metrics.json", encoding="utf-8") as file:
+        content = json.load(file)
+    assert content['files'] == 2
+    assert content['chars'] == 2 * len('Sample text')
+    assert set(content['stages']) == {'read', 'spacy', 'hf', 'regex', 'write'}
+
+
+def test_main_email_mode_sends_only_body_to_models(mocker, tmp_path):
+    # Mock
+    mock_censor_text = mocker.patch('censoror.censor_text', side_effect=lambda text, entities, engine: (
+        text.replace('Allen', '█████'), {'PERSON': {'count': text.count('Allen'), 'indices': []}}))
+
+    # Initialize
+    input_file = tmp_path / "mail.txt"
+    input_file.write_text("Message-ID: <1@thyme>\nFrom: phillip.allen@enron.com\n\nThanks, Allen\n", encoding="utf-8")
+
+    # Execute
+    main(str(input_file), str(tmp_path), ['PERSON'], 'stdout', email_mode=True)
+
+    # Asserts
+    mock_censor_text.assert_called_once_with("Thanks, Allen\n", ['PERSON'], None)
+    with open(tmp_path / "mail.censored", encoding="utf-8") as file:
+        assert file.read() == "Message-ID: <1@thyme>\nFrom: ███████████████████████\n\nThanks, █████\n"
+
+
+@pytest.mark.parametrize("batch_size", [1, 2])
+def test_main_email_mode_matches_batched_path(mocker, tmp_path, batch_size):
+    # Mock
+    mocker.patch('censoror.censor_with_rules', side_effect=lambda text, entities, stats: text)
+    mocker.patch('censoror.censor_with_spacy', side_effect=lambda text, entities, stats: text)
+    mocker.patch('censoror.censor_batch_with_spacy', side_effect=lambda texts, entities, stats_list, batch_size: texts)
+    mocker.patch('censoror.censor_with_hf', side_effect=lambda text, entities, stats: text)
+    mocker.patch('censoror.censor_batch_with_hf', side_effect=lambda texts, entities, stats_list: texts)
+    mocker.patch('censoror.censor_with_regex', side_effect=lambda text, entities, stats: text.replace('Allen', '█████'))
+
+    # Initialize
+    (tmp_path / "a.txt").write_text("Message-ID: <1@thyme>\nDate: Mon, 14 May 2001\n\nBy Allen\n", encoding="utf-8")
+    (tmp_path / "b.txt").write_text("Plain Allen text\n", encoding="utf-8")
+
+    # Execute
+    main(str(tmp_path / "*.txt"), str(tmp_path), ['DATE'], 'stdout', batch_size=batch_size, email_mode=True)
+
+    # Asserts
+    with open(tmp_path / "a.censored", encoding="utf-8") as file:
+        assert file.read() == "Message-ID: <1@thyme>\nDate: ████████████████\n\nBy █████\n"
+    with open(tmp_path / "b.censored", encoding="utf-8") as file:
+        assert file.read() == "Plain █████ text\n"
+
+
+def test_main_async_io(mocker, tmp_path, mock_stats_collector):
+    # Mock
+    mocker.patch('censoror.censor_text', side_effect=lambda text, entities, engine: (
+        text.replace('Allen', '█████'), {'PERSON': text.count('Allen')}))
+    mock_output_stats = mock_stats_collector.add
+
+    # Initialize
+    for index in range(5):
+        (tmp_path / f"mail{index}.txt").write_text(f"Mail {index} from Allen\n", encoding="utf-8")
+    result_cache = ResultCache(tmp_path / "cache.sqlite3")
+    result_cache.get('warm')
+
+    # Execute
+    main(str(tmp_path / "*.txt"), str(tmp_path), ['PERSON'], 'stdout', cache=result_cache, async_io=True,
+         queue_size=1, io_workers=2)
+
+    # Asserts
+    for index in range(5):
+        with open(tmp_path / f"mail{index}.censored", encoding="utf-8") as file:
+            assert file.read() == f"Mail {index} from █████\n"
+    assert mock_output_stats.call_count == 5
+
+
+def test_main_stats_file_keeps_every_file(mock_glob, mock_read_text, mock_write_censored_file, mock_censor_functions,
+                                          tmp_path):
+    # Execute
+    main('*.txt', '/output/', ['PERSON'], str(tmp_path / "stats.jsonl"), stats_format="jsonl")
+
+    # Asserts
+    with open(tmp_path / "stats.jsonl", encoding="utf-8") as file:
+        records = [json.loads(line) for line in file]
+    assert [record.get('file') for record in records] == ['/output/file1.censored', '/output/file2.censored', None]
+    assert records[-1] == {'summary': {'files': 2, 'totals': {}}}
+
+
+def test_main_spans_out_exports_every_span(mocker, tmp_path):
+    # Mock
+    def censor_names(text, entities, stats):
+        start = text.index("Allen")
+        stats['PERSON'] = {'count': 1, 'indices': [(start, start + 5)]}
+        return text[:start] + "█████" + text[start + 5:]
+
+    mocker.patch('censoror.censor_with_rules', side_effect=lambda text, entities, stats: text)
+    mocker.patch('censoror.censor_with_spacy', side_effect=censor_names)
+    mocker.patch('censoror.censor_with_hf', side_effect=lambda text, entities, stats: text)
+    mocker.patch('censoror.censor_with_regex', side_effect=lambda text, entities, stats: text)
+
+    # Initialize
+    (tmp_path / "a.txt").write_text("Mail from Allen\n", encoding="utf-8")
+    (tmp_path / "b.txt").write_text("Allen wrote\n", encoding="utf-8")
+
+    # Execute
+    main(str(tmp_path / "*.txt"), str(tmp_path), ['PERSON'], None, spans_output=str(tmp_path / "spans.csv"))
+
+    # Asserts
+    with open(tmp_path / "spans.csv", encoding="utf-8") as file:
+        rows = sorted(file.read().splitlines()[1:])
+    assert rows == [f"{tmp_path / 'a.censored'},PERSON,spacy,10,15", f"{tmp_path / 'b.censored'},PERSON,spacy,0,5"]
+
+
+@pytest.mark.parametrize("batch_size", [1, 2])
+def test_main_spans_out_records_engine_of_every_span(mocker, tmp_path, batch_size):
+    # Mock
+    def censor_word(word, label, engine):
+        def censor(text, entities, stats):
+            start = text.find(word)
+            if start == -1:
+                return text
+            add_stat(stats, label, start, start + len(word), engine)
+            return text[:start] + "█" * len(word) + text[start + len(word):]
+        return censor
+
+    mocker.patch('censoror.censor_with_spacy', side_effect=censor_word("Houston", 'GPE', "spacy"))
+    mocker.patch('censoror.censor_batch_with_spacy', side_effect=lambda texts, entities, stats_list, batch_size: [
+        censor_word("Houston", 'GPE', "spacy")(text, entities, stats) for text, stats in zip(texts, stats_list)])
+    mocker.patch('censoror.censor_with_hf', side_effect=lambda text, entities, stats: text)
+    mocker.patch('censoror.censor_batch_with_hf', side_effect=lambda texts, entities, stats_list: texts)
+    mocker.patch('censoror.censor_with_regex', side_effect=censor_word("Tim", 'PERSON', "regex"))
+
+    # Initialize
+    (tmp_path / "mail.txt").write_text("Message-ID: <1@enron>\nFrom: phillip.allen@enron.com\n\n"
+                                       "Phillip Allen met Tim in Houston\n", encoding="utf-8")
+    index = Gazetteer(tmp_path / "gazetteer.json")
+    index.add("Phillip Allen", "PERSON")
+
+    # Execute
+    main(str(tmp_path / "*.txt"), str(tmp_path), ['PERSON', 'GPE'], None, batch_size=batch_size, email_mode=True,
+         gazetteer_index=index, spans_output=str(tmp_path / "spans.csv"))
+
+    # Asserts
+    with open(tmp_path / "spans.csv", encoding="utf-8") as file:
+        rows = [row.split(",")[1:] for row in file.read().splitlines()[1:]]
+    assert sorted(rows) == [['GPE', 'spacy', '78', '85'], ['PERSON', 'email', '28', '51'],
+                            ['PERSON', 'gazetteer', '53', '66'], ['PERSON', 'regex', '71', '74']]
+
+
+@pytest.mark.parametrize("async_io", [False, True])
+def test_main_shards_resume_and_merge(mocker, tmp_path, async_io):
+    # Mock
+    def censor_names(text, entities, stats):
+        if "crash" in text:
+            raise RuntimeError("Node lost")
+        stats['PERSON'] = {'count': 1, 'indices': [(0, 5)]}
+        return "█████" + text[5:]
+
+    mocker.patch('censoror.censor_with_rules', side_effect=lambda text, entities, stats: text)
+    mock_spacy = mocker.patch('censoror.censor_with_spacy', side_effect=censor_names)
+    mocker.patch('censoror.censor_with_hf', side_effect=lambda text, entities, stats: text)
+    mocker.patch('censoror.censor_with_regex', side_effect=lambda text, entities, stats: text)
+
+    # Initialize
+    for name in "abcd":
+        (tmp_path / f"{name}.txt").write_text(f"Allen wrote {name}\n", encoding="utf-8")
+    (tmp_path / "d.txt").write_text("Allen wrote crash\n", encoding="utf-8")
+    pattern = str(tmp_path / "*.txt")
+
+    # Execute
+    main(pattern, str(tmp_path), ['PERSON'], None, shard=(1, 2), async_io=async_io)
+    first_calls = mock_spacy.call_count
+    main(pattern, str(tmp_path), ['PERSON'], None, shard=(1, 2), async_io=async_io)
+    rerun_calls = mock_spacy.call_count - first_calls
+    with pytest.raises(RuntimeError):
+        main(pattern, str(tmp_path), ['PERSON'], None, shard=(2, 2), async_io=async_io)
+    incomplete = censoror.merge_shards(str(tmp_path), str(tmp_path / "partial.jsonl"), "jsonl")
+    (tmp_path / "d.txt").write_text("Allen wrote d\n", encoding="utf-8")
+    before_resume = mock_spacy.call_count
+    main(pattern, str(tmp_path), ['PERSON'], None, shard=(2, 2), async_io=async_io)
+    resumed_texts = [call.args[0] for call in mock_spacy.call_args_list[before_resume:]]
+    complete = censoror.merge_shards(str(tmp_path), str(tmp_path / "stats.jsonl"), "jsonl")
+
+    # Asserts
+    assert first_calls == 2
+    assert rerun_calls == 0
+    assert incomplete == [2]
+    assert resumed_texts == ["Allen wrote d\n"]
+    assert complete == []
+    with open(tmp_path / "stats.jsonl", encoding="utf-8") as file:
+        records = [json.loads(line) for line in file]
+    assert [Path(record['file']).name for record in records[:-1]] == ["a.censored", "c.censored", "b.censored",
+                                                                     "d.censored"]
+    assert records[-1] == {'summary': {'files': 4, 'totals': {'PERSON': 4}}}
+    assert (tmp_path / "d.censored").read_text(encoding="utf-8") == "█████ wrote d\n"
+
+
+@pytest.mark.parametrize("option", ["dedup_paragraphs", "hf_backend", "gazetteer_index"])
+def test_main_shard_refuses_other_settings(mocker, tmp_path, option):
+    # Mock
+    for stage in ['censor_with_rules', 'censor_with_spacy', 'censor_with_hf', 'censor_with_regex']:
+        mocker.patch(f'censoror.{stage}', side_effect=lambda text, entities, stats: text)
+
+    # Initialize
+    (tmp_path / "a.txt").write_text("Allen wrote a\n", encoding="utf-8")
+    (tmp_path / "seed.txt").write_text("Allen\n", encoding="utf-8")
+    pattern = str(tmp_path / "*.txt")
+    options = {'dedup_paragraphs': {'dedup_paragraphs': True}, 'hf_backend': {'hf_backend': "onnx"},
+               'gazetteer_index': {'gazetteer_index': Gazetteer().load_seed(tmp_path / "seed.txt")}}[option]
+
+    # Execute
+    main(pattern, str(tmp_path), ['PERSON'], None, shard=(1, 2))
+
+    # Asserts
+    with pytest.raises(ValueError):
+        main(pattern, str(tmp_path), ['PERSON'], None, shard=(1, 2), **options)
+
+
+@pytest.mark.parametrize("email_mode", [False, True])
+def test_main_mmap_matches_reading_whole_files(mocker, tmp_path, email_mode):
+    # Mock
+    def censor_names(text, entities, stats):
+        for name in ("Zoë", "José"):
+            for start in [match.start() for match in re.finditer(name, text)]:
+                stats.setdefault('PERSON', {'count': 0, 'indices': []})
+                stats['PERSON']['count'] += 1
+                stats['PERSON']['indices'].append((start, start + len(name)))
+                text = text[:start] + "█" * len(name) + text[start + len(name):]
+        return text
+
+    mocker.patch('censoror.censor_with_rules', side_effect=lambda text, entities, stats: text)
+    mocker.patch('censoror.censor_with_spacy', side_effect=censor_names)
+    mocker.patch('censoror.censor_with_hf', side_effect=lambda text, entities, stats: text)
+    mocker.patch('censoror.censor_with_regex', side_effect=lambda text, entities, stats: text)
+
+    # Initialize
+    text = ("Message-ID: <1@enron>\nDate: Mon, 14 May 2001 16:39:00\nFrom: zoë@enron.com\n"
+            "Subject: Café with José\n\nHi Zoë,\n\nJosé will be at the café.\n\n" + "Naïve filler line.\n" * 20 + "\nThanks José\n")
+    (tmp_path / "mail.txt").write_text(text, encoding="utf-8")
+    (tmp_path / "whole").mkdir()
+    (tmp_path / "mapped").mkdir()
+
+    # Execute
+    whole_path, whole_stats = censor_file(str(tmp_path / "mail.txt"), str(tmp_path / "whole"), ['PERSON', 'DATE'],
+                                          email_mode=email_mode)
+    mapped_path, mapped_stats = censoror.censor_file_mapped(str(tmp_path / "mail.txt"), str(tmp_path / "mapped"),
+                                                            ['PERSON', 'DATE'], email_mode=email_mode)
+    with censoror.map_file(tmp_path / "mail.txt") as data:
+        _, block_stats, chars = censoror.censor_mapped(data, ['PERSON', 'DATE'], email_mode=email_mode,
+                                                       block_bytes=64)
+
+    # Asserts
+    assert mapped_path.read_bytes() == whole_path.read_bytes()
+    assert "Z██" not in mapped_path.read_text(encoding="utf-8")
+    assert mapped_stats == whole_stats
+    assert block_stats == whole_stats
+    assert chars == len(text)
+
+
+def test_censor_mapped_catches_entity_across_block_edge(mocker, tmp_path):
+    # Mock
+    def censor_names(text, entities, stats):
+        for match in re.finditer("Allen", text):
+            add_stat(stats, 'PERSON', *match.span())
+        return re.sub("Allen", "█████", text)
+
+    mocker.patch('censoror.censor_with_rules', side_effect=lambda text, entities, stats: text)
+    mocker.patch('censoror.censor_with_spacy', side_effect=censor_names)
+    mocker.patch('censoror.censor_with_hf', side_effect=lambda text, entities, stats: text)
+    mocker.patch('censoror.censor_with_regex', side_effect=lambda text, entities, stats: text)
+
+    # Initialize: no separators, so the block edge falls inside "Allen"
+    (tmp_path / "mail.txt").write_text("x" * 18 + "Allen" + "y" * 17, encoding="utf-8")
+
+    # Execute
+    with censoror.map_file(tmp_path / "mail.txt") as data:
+        patches, stats, chars = censoror.censor_mapped(data, ['PERSON'], block_bytes=20, overlap_chars=8)
+        censoror.write_patched(data, tmp_path / "mail.censored", patches)
+
+    # Asserts
+    assert (tmp_path / "mail.censored").read_text(encoding="utf-8") == "x" * 18 + "█████" + "y" * 17
+    assert stats == {'PERSON': {'count': 1, 'indices': [(18, 23)]}}
+    assert chars == 40
+
+
+@pytest.mark.parametrize("batch_size", [1, 2])
+def test_main_gazetteer_skips_models_for_covered_files(mocker, tmp_path, mock_stats_collector, batch_size):
+    # Mock
+    mock_spacy = mocker.patch('censoror.censor_with_spacy', side_effect=lambda text, entities, stats: text)
+    mock_batch_spacy = mocker.patch('censoror.censor_batch_with_spacy',
+                                    side_effect=lambda texts, entities, stats_list, batch_size: texts)
+    mocker.patch('censoror.censor_with_hf', side_effect=lambda text, entities, stats: text)
+    mocker.patch('censoror.censor_batch_with_hf', side_effect=lambda texts, entities, stats_list: texts)
+    mocker.patch('censoror.censor_with_regex', side_effect=lambda text, entities, stats: text)
+
+    # Initialize
+    (tmp_path / "a.txt").write_text("Mail from Phillip Allen\n", encoding="utf-8")
+    (tmp_path / "b.txt").write_text("Mail from Phillip Allen to Tim\n", encoding="utf-8")
+    index = Gazetteer(tmp_path / "gazetteer.json", skip_models=True)
+    index.add("Phillip Allen", "PERSON")
+
+    # Execute
+    main(str(tmp_path / "*.txt"), str(tmp_path), ['PERSON'], 'stdout', batch_size=batch_size, gazetteer_index=index)
+
+    # Asserts
+    with open(tmp_path / "a.censored", encoding="utf-8") as file:
+        assert file.read() == "Mail from █████████████\n"
+    mock_models = mock_batch_spacy if batch_size > 1 else mock_spacy
+    assert sorted(call.args[1] for call in mock_models.call_args_list) == [[], ['PERSON']]
+    assert (tmp_path / "gazetteer.json").exists()
+
+
+def test_main_watch_censors_only_new_and_changed_files(mocker, tmp_path, mock_stats_collector):
+    # Mock
+    mocker.patch('censoror.censor_text', side_effect=lambda text, entities, engine: (
+        text.replace('Allen', '█████'), {'PERSON': text.count('Allen')}))
+    mock_warmup = mocker.patch('censoror.models.warmup')
+    # A stop that is already set makes the watch a single pass over the files present
+    stopped = threading.Event()
+    stopped.set()
+    mocker.patch('censoror.watch', side_effect=lambda *args: watch(*args, stop=stopped))
+
+    # Initialize
+    for name in ["a", "b"]:
+        (tmp_path / f"{name}.txt").write_text(f"Mail {name} from Allen\n", encoding="utf-8")
+        os.utime(tmp_path / f"{name}.txt", (time.time() - 60, time.time() - 60))
+    watch_state = WatchState(tmp_path / "state.json")
+
+    # Execute
+    main(str(tmp_path / "*.txt"), str(tmp_path), ['PERSON'], 'stdout', watch_state=watch_state)
+    (tmp_path / "b.txt").write_text("Mail b from Allen again\n", encoding="utf-8")
+    os.utime(tmp_path / "b.txt", (time.time() - 30, time.time() - 30))
+    watch_state = WatchState(tmp_path / "state.json").load()
+    main(str(tmp_path / "*.txt"), str(tmp_path), ['PERSON'], 'stdout', watch_state=watch_state)
+
+    # Asserts
+    assert [call.args[0].name for call in mock_stats_collector.add.call_args_list] == ["a.censored", "b.censored",
+                                                                                       "b.censored"]
+    assert mock_stats_collector.flush.call_count == 3
+    mock_warmup.assert_called()
+    with open(tmp_path / "b.censored", encoding="utf-8") as file:
+        assert file.read() == "Mail b from █████ again\n"
+
+
+def test_parse_censor_request():
+    # Execute
+    text, entities_to_censor, engine = censoror.parse_censor_request({'text': "Hi", 'phones': True, 'dates': True},
+                                                                     engine='rules')
+
+    # Asserts
+    assert (text, entities_to_censor, engine) == ("Hi", ['DATE', 'PHONE'], 'rules')
+    with pytest.raises(ValueError):
+        censoror.parse_censor_request({'text': "Hi", 'engine': 'gpt'})
+
+
+def test_serve_censoring_answers_local_client(mocker, tmp_path):
+    # Mock
+    responses = []
+
+    def request_then_stop(server):
+        # Stands in for serve: one request from a local client, then shut down
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        request = urllib.request.Request(f"http://127.0.0.1:{server.server_address[1]}/censor",
+                                         data=json.dumps({'text': "Call 123-456-7890", 'phones': True}).encode())
+        with urllib.request.urlopen(request, timeout=30) as response:
+            responses.append(json.loads(response.read()))
+        server.shutdown()
+        server.server_close()
+    mocker.patch('censoror.serve', side_effect=request_then_stop)
+
+    # Execute
+    censoror.serve_censoring(['PHONE'], "127.0.0.1", 0, cache=ResultCache(tmp_path / "cache.sqlite3"), engine='rules')
+
+    # Asserts
+    assert responses[0]['censored_text'] == "Call ████████████"
+    assert responses[0]['stats'] == {'PHONE': {'count': 1, 'indices': [[5, 17]]}}
+
+
+@pytest.mark.parametrize("batch_size", [1, 2])
+def test_main_dedup_censors_repeated_paragraphs_once(mocker, tmp_path, mock_stats_collector, batch_size):
+    # Mock
+    def censor_allen(text):
+        return text.replace('Allen', '█████'), {'PERSON': {'count': text.count('Allen'), 'indices': [
+            (index, index + 5) for index in range(len(text)) if text.startswith('Allen', index)]}}
+    mock_censor_text = mocker.patch('censoror.censor_text',
+                                    side_effect=lambda text, entities, engine: censor_allen(text))
+    mock_censor_batch = mocker.patch('censoror.censor_batch', side_effect=lambda texts, entities, engine, batch_size: [
+        censor_allen(text) for text in texts])
+
+    # Initialize
+    quoted = "-----Original Message-----\nFrom: Allen\nSee you on Friday"
+    (tmp_path / "a.txt").write_text(f"Sure, Allen.\n\n{quoted}\n", encoding="utf-8")
+    (tmp_path / "b.txt").write_text(f"Thanks.\n\n{quoted}\n", encoding="utf-8")
+
+    # Execute
+    main(str(tmp_path / "*.txt"), str(tmp_path), ['PERSON'], 'stdout', batch_size=batch_size, dedup_paragraphs=True)
+
+    # Asserts
+    if batch_size > 1:
+        assert [sorted(call.args[0]) for call in mock_censor_batch.call_args_list] == [
+            sorted(["Sure, Allen.", quoted, "Thanks."])]
+    else:
+        assert sorted(call.args[0] for call in mock_censor_text.call_args_list) == sorted(
+            ["Sure, Allen.", quoted, "Thanks."])
+    with open(tmp_path / "b.censored", encoding="utf-8") as file:
+        assert file.read() == "Thanks.\n\n-----Original Message-----\nFrom: █████\nSee you on Friday\n"
+    stats = {call.args[0].name: call.args[1] for call in mock_stats_collector.add.call_args_list}
+    assert stats['b.censored'] == {'PERSON': {'count': 1, 'indices': [(42, 47)]}}
+    assert censoror.metrics.hit_rates()['dedup_paragraph'] == 0.25
+    # The run report carries the same rates
+    assert mock_stats_collector.hit_rates['dedup_paragraph'] == 0.25
+    assert mock_stats_collector.hit_rates['dedup_document'] == 0.0
+
+
+def test_main_prefilter_sends_only_candidate_paragraphs(mocker, tmp_path, mock_stats_collector):
+    # Mock
+    mock_censor_text = mocker.patch('censoror.censor_text', side_effect=lambda text, entities, engine: (
+        text.replace('Allen', '█████'), {'PERSON': {'count': text.count('Allen'), 'indices': [
+            (index, index + 5) for index in range(len(text)) if text.startswith('Allen', index)]}}))
+
+    # Initialize
+    (tmp_path / "a.txt").write_text("Here is our forecast.\n\nPlease ask Allen.\n\nthanks\n", encoding="utf-8")
+
+    # Execute
+    main(str(tmp_path / "*.txt"), str(tmp_path), ['PERSON'], 'stdout', prefilter_threshold=2)
+
+    # Asserts
+    assert [call.args[0] for call in mock_censor_text.call_args_list] == ["Please ask Allen."]
+    with open(tmp_path / "a.censored", encoding="utf-8") as file:
+        assert file.read() == "Here is our forecast.\n\nPlease ask █████.\n\nthanks\n"
+    assert mock_stats_collector.add.call_args.args[1] == {'PERSON': {'count': 1, 'indices': [(34, 39)]}}
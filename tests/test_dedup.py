@@ -0,0 +1,116 @@
+import pickle
+import pytest
+from assignment1.dedup import Deduplicator, split_paragraphs
+from assignment1.instrumentation import metrics
+
+
+@pytest.fixture
+def censor_all():
+    # Censors "Allen" and remembers every text sent to the models
+    calls = []
+
+    def censor(texts):
+        calls.append(list(texts))
+        return [(text.replace('Allen', '█████'),
+                 {'PERSON': {'count': text.count('Allen'),
+                             'indices': [(text.index('Allen'), text.index('Allen') + 5)] if 'Allen' in text else []}})
+                for text in texts]
+    censor.calls = calls
+    return censor
+
+
+def test_split_paragraphs():
+    # Initialize
+    text = "Hi Tim,\n\n  Thanks Allen.\nBye\n \n\n-----Original Message-----\n"
+
+    # Execute
+    paragraphs = split_paragraphs(text)
+
+    # Asserts
+    assert [text[start:end] for start, end in paragraphs] == ["Hi Tim,", "Thanks Allen.\nBye",
+                                                              "-----Original Message-----"]
+    assert split_paragraphs(text, 9, 28) == [(11, 28)]
+    assert split_paragraphs("  \n\n ") == []
+
+
+def test_repeated_paragraphs_are_censored_once(censor_all):
+    # Initialize
+    deduplicator = Deduplicator()
+    metrics.reset()
+
+    # Execute
+    results = deduplicator.censor([["Thanks Allen", "See below"], ["Reply", "Thanks Allen"]], ['PERSON'], (),
+                                  censor_all)
+
+    # Asserts
+    assert censor_all.calls == [["Thanks Allen", "See below", "Reply"]]
+    assert results[1][1] == ("Thanks █████", {'PERSON': {'count': 1, 'indices': [(7, 12)]}})
+    assert results[0][1][0] == "See below"
+    assert metrics.counters['dedup_paragraph_lookups'] == 4
+    assert metrics.counters['dedup_paragraph_hits'] == 1
+
+
+def test_duplicate_documents_skip_the_models(censor_all):
+    # Initialize
+    deduplicator = Deduplicator()
+    metrics.reset()
+    deduplicator.censor([["Thanks Allen", "See below"]], ['PERSON'], (), censor_all)
+
+    # Execute
+    results = deduplicator.censor([["Thanks Allen", "See below"]], ['PERSON'], (), censor_all)
+
+    # Asserts
+    assert len(censor_all.calls) == 1
+    assert results[0][0][0] == "Thanks █████"
+    assert metrics.hit_rates()['dedup_document'] == 0.5
+
+
+def test_copies_get_their_own_stats(censor_all):
+    # Initialize
+    deduplicator = Deduplicator()
+
+    # Execute
+    first, second = deduplicator.censor([["Thanks Allen"], ["Thanks Allen"]], ['PERSON'], (), censor_all)
+    first[0][1]['PERSON']['count'] += 1
+
+    # Assert
+    assert second[0][1]['PERSON']['count'] == 1
+
+
+def test_flags_and_modes_are_part_of_the_key(censor_all):
+    # Initialize
+    deduplicator = Deduplicator()
+
+    # Execute
+    deduplicator.censor([["Thanks Allen"]], ['PERSON'], (False, 'rules'), censor_all)
+    deduplicator.censor([["Thanks Allen"]], ['PERSON', 'DATE'], (False, 'rules'), censor_all)
+    deduplicator.censor([["Thanks Allen"]], ['PERSON'], (True, 'rules'), censor_all)
+
+    # Assert
+    assert len(censor_all.calls) == 3
+
+
+def test_least_recently_used_paragraphs_are_dropped(censor_all):
+    # Initialize
+    deduplicator = Deduplicator(max_paragraphs=2)
+
+    # Execute
+    deduplicator.censor([["one", "two", "three"]], ['PERSON'], (), censor_all)
+    deduplicator.censor([["one", "three"]], ['PERSON'], (), censor_all)
+
+    # Asserts
+    assert censor_all.calls == [["one", "two", "three"], ["one"]]
+    assert len(deduplicator.results) == 2
+
+
+def test_deduplicator_pickles_empty():
+    # Initialize
+    deduplicator = Deduplicator(max_paragraphs=10)
+    deduplicator.remember(b'key', ([], {}))
+
+    # Execute
+    copied = pickle.loads(pickle.dumps(deduplicator))
+
+    # Asserts
+    assert copied.max_paragraphs == 10
+    assert len(copied.results) == 0
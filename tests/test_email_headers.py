@@ -0,0 +1,70 @@
+import pytest
+from assignment1 import email_headers
+
+
+EMAIL = ("Message-ID: <1.JavaMail.evans@thyme>\n"
+         "Date: Mon, 14 May 2001 16:39:00 -0700 (PDT)\n"
+         "From: phillip.allen@enron.com\n"
+         "To: tim.belden@enron.com, john.lavorato@enron.com\n"
+         "Subject: Re: forecast\n"
+         "X-From: Phillip K Allen\n"
+         "X-To: Tim Belden <Tim Belden/Enron@EnronXGate>\n"
+         "\tJohn Lavorato\n"
+         "\n"
+         "Here is our forecast.\n")
+
+
+def test_find_body_start():
+    # Execute
+    body_start = email_headers.find_body_start(EMAIL)
+
+    # Assert
+    assert EMAIL[body_start:] == "Here is our forecast.\n"
+
+
+@pytest.mark.parametrize("text", [
+    "Here is our forecast.\n\nThanks",
+    "Subject: no message headers\n\nbody",
+    "Just one line",
+])
+def test_find_body_start_not_an_email(text):
+    # Assert
+    assert email_headers.find_body_start(text) is None
+
+
+def test_header_fields_include_continuation_lines():
+    # Execute
+    fields = {name: EMAIL[start:end] for name, start, end in
+              email_headers.header_fields(EMAIL, email_headers.find_body_start(EMAIL))}
+
+    # Asserts
+    assert fields['subject'] == "Re: forecast"
+    assert fields['x-to'] == "Tim Belden <Tim Belden/Enron@EnronXGate>\n\tJohn Lavorato"
+
+
+def test_split_email_censors_headers_with_rules():
+    # Execute
+    spans, stats, segments = email_headers.split_email(EMAIL, ['PERSON', 'DATE'])
+
+    # Asserts
+    censored = {EMAIL[start:end] for start, end, _ in spans}
+    assert {"phillip.allen@enron.com", "tim.belden@enron.com", "Lavorato", "Allen"} <= censored
+    assert "Mon, 14 May 2001 16:39:00 -0700 (PDT)" in censored
+    assert stats['PERSON']['count'] == 4
+    assert stats['DATE']['count'] == 1
+    assert [EMAIL[start:end] for start, end in segments] == ["Re: forecast", "Here is our forecast.\n"]
+
+
+def test_split_email_leaves_unrequested_headers():
+    # Execute
+    spans, stats, segments = email_headers.split_email(EMAIL, ['PHONE'])
+
+    # Asserts
+    assert spans == []
+    assert stats == {}
+    assert len(segments) == 2
+
+
+def test_split_email_not_an_email():
+    # Assert
+    assert email_headers.split_email("Here is our forecast.", ['PERSON']) is None
@@ -0,0 +1,140 @@
+import json
+import pickle
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from assignment1 import gazetteer
+from assignment1.gazetteer import Gazetteer
+
+
+@pytest.fixture
+def index():
+    # Gazetteer with a few known entities
+    index = Gazetteer()
+    index.add("Phillip K Allen", "PERSON")
+    index.add("Allen", "PERSON")
+    index.add("Houston", "GPE")
+    return index
+
+
+def test_censor_known_entities(index):
+    # Initialize
+    stats = {}
+
+    # Execute
+    censored_text = index.censor("Mail from Phillip K Allen in Houston. Thanks Allen.", ['PERSON', 'GPE'], stats)
+
+    # Asserts
+    assert censored_text == "Mail from ███████████████ in ███████. Thanks █████."
+    assert stats == {'PERSON': {'count': 2, 'indices': [(10, 25), (45, 50)],
+                                'engines': [3, 3]},
+                     'GPE': {'count': 1, 'indices': [(29, 36)], 'engines': [3]}}
+
+
+def test_censor_only_requested_labels(index):
+    # Execute
+    censored_text = index.censor("Allen in Houston", ['GPE'], {})
+
+    # Assert
+    assert censored_text == "Allen in ███████"
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("Thanks ████.\nHere is ███████ data.", True),
+    ("Send it to Tim today.", False),
+    ("lower case only", True),
+])
+def test_covers(index, text, expected):
+    # Assert
+    assert index.covers(text) == expected
+
+
+def test_observe_confirms_entities_seen_in_several_documents():
+    # Initialize
+    index = Gazetteer(learn=True)
+    stats = {'PERSON': {'count': 1, 'indices': [(5, 15)]}, 'DATE': {'count': 1, 'indices': [(0, 4)]}}
+
+    # Execute
+    index.observe("Call Tim Belden", stats)
+    assert index.entities == {}
+    index.observe("Call Tim Belden", stats)
+
+    # Asserts
+    assert index.entities == {"Tim Belden": "PERSON"}
+    assert index.censor("Ask Tim Belden", ['PERSON'], {}) == "Ask ██████████"
+
+
+def test_save_and_load(index, tmp_path):
+    # Initialize
+    index.seen["Tim Belden"] = ["PERSON", 1]
+
+    # Execute
+    index.save(tmp_path / "gazetteer.json")
+    loaded = Gazetteer(tmp_path / "gazetteer.json").load()
+
+    # Asserts
+    assert loaded.entities == index.entities
+    assert loaded.seen == {"Tim Belden": ["PERSON", 1]}
+    assert json.loads((tmp_path / "gazetteer.json").read_text(encoding="utf-8"))['version'] == 1
+
+
+def test_load_seed(tmp_path):
+    # Initialize
+    seed_path = tmp_path / "seed.txt"
+    seed_path.write_text("# known entities\nTim Belden\nGPE\tHouston\n\n", encoding="utf-8")
+
+    # Execute
+    index = Gazetteer().load_seed(seed_path)
+
+    # Assert
+    assert index.entities == {"Tim Belden": "PERSON", "Houston": "GPE"}
+
+
+def test_snapshot_and_merge():
+    # Initialize
+    worker = Gazetteer(learn=True)
+    parent = Gazetteer(learn=True)
+    parent.seen["Tim Belden"] = ["PERSON", 1]
+
+    # Execute
+    worker.observe("Tim Belden", {'PERSON': {'count': 1, 'indices': [(0, 10)]}})
+    parent.merge(worker.snapshot())
+
+    # Asserts
+    assert parent.entities == {"Tim Belden": "PERSON"}
+    assert worker.snapshot() == {}
+
+
+def test_observe_from_several_threads():
+    # Initialize
+    index = Gazetteer(learn=True)
+    texts = [f"Tim Belden met Person{number:03}" for number in range(200)]
+
+    # Execute
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        list(executor.map(lambda text: index.observe(text, {'PERSON': {'count': 2, 'indices': [(0, 10), (15, 24)]}}),
+                          texts))
+
+    # Asserts
+    assert index.entities == {"Tim Belden": "PERSON"}
+    assert index.snapshot()["Tim Belden"] == ["PERSON", 200]
+    assert len(index.seen) == 200
+
+
+def test_pickles_without_matcher(index):
+    # Execute
+    index.find("Allen", ['PERSON'])
+    copied = pickle.loads(pickle.dumps(index))
+
+    # Asserts
+    assert copied._matcher is None
+    assert copied.entities == index.entities
+    assert copied.find("Mail Allen", ['PERSON']) == [(5, 10, 'PERSON')]
+
+
+def test_without_covered_labels():
+    # Execute
+    result = gazetteer.without_covered_labels({'rules': ['DATE'], 'spacy': ['PERSON', 'DATE'],
+                                               'hugging_face': ['B-PER']})
+
+    # Assert
+    assert result == {'rules': ['DATE'], 'spacy': ['DATE'], 'hugging_face': []}
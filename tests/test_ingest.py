@@ -0,0 +1,109 @@
+import threading
+import time
+import pytest
+from assignment1 import ingest
+
+
+def write_result(file_path, censored_text, stats):
+    return file_path, censored_text, stats
+
+
+def test_run_ingest_keeps_input_order():
+    # Initialize
+    delays = {'a': 0.03, 'b': 0.0, 'c': 0.01}
+
+    def read(file_path):
+        time.sleep(delays[file_path])
+        return file_path * 2
+
+    # Execute
+    results = ingest.run_ingest(['a', 'b', 'c'], read, lambda text: (text.upper(), {'len': len(text)}),
+                                write_result, queue_size=1, io_workers=3)
+
+    # Assert
+    assert results == [('a', 'AA', {'len': 2}), ('b', 'BB', {'len': 2}), ('c', 'CC', {'len': 2})]
+
+
+def test_run_ingest_skips_unreadable_files():
+    # Execute
+    results = ingest.run_ingest(['a', 'missing'], lambda file_path: None if file_path == 'missing' else file_path,
+                                lambda text: (text, {}), write_result)
+
+    # Assert
+    assert results == [('a', 'a', {}), None]
+
+
+def test_run_ingest_applies_backpressure():
+    # Initialize
+    read_count = 0
+    ahead = []
+    lock = threading.Lock()
+
+    def read(file_path):
+        nonlocal read_count
+        with lock:
+            read_count += 1
+        return file_path
+
+    def censor(text):
+        # Files read but not censored yet never exceed the queue plus the files held by the stages
+        ahead.append(read_count - int(text))
+        time.sleep(0.005)
+        return text, {}
+
+    # Execute
+    ingest.run_ingest([str(i) for i in range(30)], read, censor, write_result, queue_size=2, io_workers=2)
+
+    # Assert
+    assert max(ahead) <= 2 + 2 + 1
+
+
+def test_run_ingest_propagates_model_errors():
+    # Initialize
+    def censor(text):
+        raise ValueError("model failed")
+
+    # Execute / Assert
+    with pytest.raises(ValueError, match="model failed"):
+        ingest.run_ingest([str(i) for i in range(20)], lambda file_path: file_path, censor, write_result,
+                          queue_size=1, io_workers=2)
+
+
+def test_run_ingest_reports_results_as_files_are_written():
+    # Initialize
+    reported = []
+    first_reported = threading.Event()
+
+    def censor(text):
+        # The last file waits until the first one is reported, which fails if results only come at the end
+        if text == 'c':
+            assert first_reported.wait(timeout=5)
+        return text.upper(), {}
+
+    def on_result(result):
+        reported.append(result)
+        first_reported.set()
+
+    # Execute
+    results = ingest.run_ingest(['a', 'missing', 'c'], lambda file_path: None if file_path == 'missing' else file_path,
+                                censor, write_result, queue_size=1, io_workers=2, on_result=on_result)
+
+    # Asserts
+    assert results is None
+    assert reported == [('a', 'A', {}), None, ('c', 'C', {})]
+
+
+def test_run_ingest_writes_files_censored_before_an_error():
+    # Initialize
+    reported = []
+
+    def censor(text):
+        if text == '3':
+            raise ValueError("model failed")
+        return text, {}
+
+    # Execute / Assert
+    with pytest.raises(ValueError, match="model failed"):
+        ingest.run_ingest([str(i) for i in range(6)], lambda file_path: file_path, censor, write_result,
+                          queue_size=1, io_workers=2, on_result=reported.append)
+    assert reported == [(str(i), str(i), {}) for i in range(3)]
@@ -0,0 +1,113 @@
+import json
+import pstats
+from assignment1 import instrumentation
+
+
+def test_time_stage_accumulates(mocker):
+    # Mock
+    mocker.patch('assignment1.instrumentation.time.perf_counter', side_effect=[0.0, 1.0, 3.0, 10.0, 12.0])
+    mocker.patch('assignment1.instrumentation.time.process_time', side_effect=[0.0, 0.5, 1.0, 2.0])
+
+    # Initialize
+    metrics = instrumentation.Metrics()
+
+    # Execute
+    with metrics.time_stage('spacy'):
+        pass
+    with metrics.time_stage('spacy'):
+        pass
+
+    # Assert
+    assert metrics.stages == {'spacy': {'calls': 2, 'wall_seconds': 4.0, 'cpu_seconds': 1.5}}
+
+
+def test_merge_worker_snapshot():
+    # Initialize
+    metrics = instrumentation.Metrics()
+    worker = instrumentation.Metrics()
+    with metrics.time_stage('read'):
+        pass
+    with worker.time_stage('read'):
+        pass
+    worker.record_file('a.txt', 10)
+
+    # Execute
+    metrics.merge(worker.snapshot())
+
+    # Asserts
+    assert metrics.stages['read']['calls'] == 2
+    assert metrics.files == [{'file': 'a.txt', 'chars': 10}]
+
+
+def test_counters_merge_and_hit_rates():
+    # Initialize
+    metrics = instrumentation.Metrics()
+    worker = instrumentation.Metrics()
+    metrics.count('dedup_paragraph_lookups', 3)
+    metrics.count('dedup_paragraph_hits')
+    worker.count('dedup_paragraph_lookups')
+    worker.count('dedup_paragraph_hits')
+
+    # Execute
+    metrics.merge(worker.snapshot())
+
+    # Asserts
+    assert metrics.counters == {'dedup_paragraph_lookups': 4, 'dedup_paragraph_hits': 2}
+    assert metrics.summary()['hit_rates'] == {'dedup_paragraph': 0.5}
+    assert 'censoror_hit_rate{lookup="dedup_paragraph"} 0.5' in metrics.to_prometheus()
+
+
+def test_write_json(tmp_path):
+    # Initialize
+    metrics = instrumentation.Metrics()
+    metrics.record_file('a.txt', 10)
+    metrics.record_file('b.txt', 5)
+    with metrics.time_stage('hf'):
+        pass
+
+    # Execute
+    metrics.write(tmp_path / "metrics.json")
+
+    # Asserts
+    content = json.loads((tmp_path / "metrics.json").read_text(encoding="utf-8"))
+    assert content['files'] == 2
+    assert content['chars'] == 15
+    assert content['stages']['hf']['calls'] == 1
+    assert content['per_file'] == [{'file': 'a.txt', 'chars': 10}, {'file': 'b.txt', 'chars': 5}]
+
+
+def test_write_prometheus(tmp_path):
+    # Initialize
+    metrics = instrumentation.Metrics()
+    metrics.record_file('a.txt', 10)
+    with metrics.time_stage('regex'):
+        pass
+
+    # Execute
+    metrics.write(tmp_path / "censoror.prom")
+
+    # Asserts
+    content = (tmp_path / "censoror.prom").read_text(encoding="utf-8")
+    assert "censoror_files_total 1\n" in content
+    assert "censoror_chars_total 10\n" in content
+    assert 'censoror_stage_calls_total{stage="regex"} 1\n' in content
+    assert 'censoror_stage_seconds{stage="regex",clock="cpu"}' in content
+
+
+def test_profiled_dumps_stats(tmp_path, capsys):
+    # Execute
+    with instrumentation.profiled(str(tmp_path / "run.pstats")):
+        sum(range(1000))
+
+    # Asserts
+    assert pstats.Stats(str(tmp_path / "run.pstats")).total_calls > 0
+    assert "cumulative" in capsys.readouterr().err
+
+
+def test_profiled_disabled(tmp_path):
+    # Execute
+    with instrumentation.profiled(None):
+        pass
+
+    # Assert
+    assert list(tmp_path.iterdir()) == []
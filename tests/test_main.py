@@ -1,3 +1,6 @@
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
 import pytest
 from unittest.mock import mock_open
 from assignment1 import main
@@ -30,15 +33,21 @@ def mock_recognize_entity(mocker):
 
 @pytest.fixture
 def mock_nlp_hugging_face():
-    # Mock the Hugging Face model's output
+    # Mock the Hugging Face model's aggregated output
     return [
-        {'entity': 'I-PER', 'start': 18, 'end': 22},
-        {'entity': 'B-PER', 'start': 23, 'end': 26},
-        {'entity': 'I-LOC', 'start': 38, 'end': 41},
-        {'entity': 'B-LOC', 'start': 42, 'end': 51}
+        {'entity_group': 'PER', 'start': 18, 'end': 26},
+        {'entity_group': 'LOC', 'start': 38, 'end': 51}
     ]
 
 
+@pytest.fixture
+def mock_models(mocker):
+    # Install mocked models in the registry so nothing is loaded
+    loaded = {'spacy': mocker.MagicMock(), 'hugging_face': mocker.MagicMock()}
+    mocker.patch.dict(main.models.loaded, loaded)
+    return loaded
+
+
 @pytest.fixture
 def mock_spacy_doc(mocker):
     # Create a mock Spacy doc
@@ -94,7 +103,7 @@ def test_replace_with_black_block_by_indices(text, start, end, expected):
     assert censored_text == expected
 
 
-def test_censor_with_spacy_correct_entities(mock_recognize_entity):
+def test_censor_with_spacy_correct_entities(mock_models, mock_recognize_entity):
     # Initialize
     text = "John Doe's phone number is 123456789."
     entities_to_censor = ['PERSON', 'PHONE']
@@ -106,10 +115,10 @@ def test_censor_with_spacy_correct_entities(mock_recognize_entity):
     assert censored_text == "████████'s phone number is █████████."
 
 
-def test_censor_with_spacy_ignores_uncensored_entities(mock_recognize_entity):
+def test_censor_with_spacy_ignores_uncensored_entities(mock_models, mock_recognize_entity):
     # Initialize
     text = "John Doe lives in New York."
-    entities_to_censor = ['PHONE']  # Not censoring 'PERSON' or 'GPE'
+    entities_to_censor = ['GPE']  # Not censoring 'PERSON' or 'PHONE', the mocked doc has no 'GPE'
 
     # Execute
     censored_text = main.censor_with_spacy(text, entities_to_censor, {})
@@ -130,22 +139,26 @@ def test_censor_with_spacy_no_entities_to_censor(mock_recognize_entity):
     assert censored_text == text
 
 
-def test_censor_with_hf_entities(mocker, mock_nlp_hugging_face):
+def test_censor_with_hf_entities(mock_models, mock_nlp_hugging_face):
     # Initialize
     text = "Hello, my name is John Doe. I live in San Francisco."
-    entities_to_censor = ['I-PER', 'B-PER', 'I-LOC', 'B-LOC']
+    entities_to_censor = ['B-PER', 'I-PER', 'B-LOC', 'I-LOC']
+    stats = {}
 
     # Mock
-    mocker.patch('assignment1.main.recognize_entity', return_value=mock_nlp_hugging_face)
+    mock_models['hugging_face'].tokenizer.return_value = {'offset_mapping': [(0, 5)]}
+    mock_models['hugging_face'].return_value = [mock_nlp_hugging_face]
 
     # Expect
-    expected_censored_text = "Hello, my name is ████ ███. I live in ███ █████████."
+    expected_censored_text = "Hello, my name is ████████. I live in █████████████."
 
     # Execute
-    censored_text = main.censor_with_hf(text, entities_to_censor, {'I-PER': 0})
+    censored_text = main.censor_with_hf(text, entities_to_censor, stats)
 
-    # Assert
+    # Asserts
     assert censored_text == expected_censored_text
+    assert stats == {'B-PER': {'count': 1, 'indices': [(18, 26)], 'engines': [2]},
+                     'B-LOC': {'count': 1, 'indices': [(38, 51)], 'engines': [2]}}
 
 
 def test_censor_with_hf_no_entities_to_censor(mocker, mock_nlp_hugging_face):
@@ -166,13 +179,14 @@ def test_censor_with_hf_no_entities_to_censor(mocker, mock_nlp_hugging_face):
     assert censored_text == expected_censored_text
 
 
-def test_censor_with_hf_no_entities_found(mocker):
+def test_censor_with_hf_no_entities_found(mock_models):
     # Initialize
     text = ">What other cool newsgroups are available for us alternative thinkers?"
     entities_to_censor = ['I-PER', 'B-PER', 'I-LOC', 'B-LOC']
 
     # Mock
-    mocker.patch('assignment1.main.recognize_entity', return_value=[])
+    mock_models['hugging_face'].tokenizer.return_value = {'offset_mapping': [(0, 5)]}
+    mock_models['hugging_face'].return_value = [[]]
 
     # Expect
     expected_censored_text = text
@@ -233,7 +247,7 @@ def test_check_entity_regex_unsupported_entity():
     assert result == expected
 
 
-def test_censor_with_regex_person(mocker, mock_spacy_doc):
+def test_censor_with_regex_person(mocker, mock_candidate_nlp):
     # Mocks
     mocker.patch('assignment1.main.check_entity_regex', side_effect=lambda text, entity: {
         'NAME': [('John Doe', 7, 15)]
@@ -310,3 +324,396 @@ def test_write_censored_file_content(tmp_path):
 
     # Assert
     assert content == censored_text
+
+
+@pytest.mark.parametrize("entities_to_censor, expected", [
+    (['PHONE'], ['entity_ruler']),
+    (['PERSON', 'B-PER', 'I-PER'], ['tok2vec', 'entity_ruler', 'ner']),
+    (['DATE'], ['tok2vec', 'entity_ruler', 'ner']),
+    (['B-LOC', 'I-LOC'], []),
+])
+def test_select_spacy_pipes(mock_models, entities_to_censor, expected):
+    # Mock
+    mocked_nlp = mock_models['spacy']
+    mocked_nlp.pipe_names = ['tok2vec', 'tagger', 'parser', 'attribute_ruler', 'lemmatizer', 'entity_ruler', 'ner']
+
+    # Execute
+    result = main.select_spacy_pipes(entities_to_censor)
+
+    # Assert
+    assert result == expected
+
+
+def test_split_text_into_chunks_small_text():
+    # Execute
+    result = list(main.split_text_into_chunks("Short text", max_chunk_chars=100))
+
+    # Assert
+    assert result == [(0, "Short text")]
+
+
+def test_split_text_into_chunks_on_paragraphs():
+    # Initialize
+    text = "First paragraph here.\n\nSecond paragraph here.\n\nThird one."
+
+    # Execute
+    result = list(main.split_text_into_chunks(text, max_chunk_chars=30))
+
+    # Asserts
+    assert ''.join(chunk for _, chunk in result) == text
+    assert all(text[offset:offset + len(chunk)] == chunk for offset, chunk in result)
+    assert result[0] == (0, "First paragraph here.")
+
+
+def test_censor_batch_with_spacy_maps_offsets(mocker, mock_models):
+    # Mock
+    mocked_nlp = mock_models['spacy']
+    mocked_nlp.pipe_names = ['tok2vec', 'parser', 'entity_ruler', 'ner']
+    john = mocker.Mock(text='John', label_='PERSON', start_char=0, end_char=4)
+    mary = mocker.Mock(text='Mary', label_='PERSON', start_char=6, end_char=10)
+    mocked_nlp.pipe.side_effect = lambda chunks, **kwargs: [
+        (mocker.Mock(ents=[john]), context) if context[0] == 0 else (mocker.Mock(ents=[mary]), context)
+        for _, context in chunks]
+
+    # Initialize
+    texts = ["John called.", "Hello Mary."]
+    stats_list = [{}, {}]
+
+    # Execute
+    result = main.censor_batch_with_spacy(texts, ['PERSON'], stats_list, batch_size=8)
+
+    # Asserts
+    assert result == ["████ called.", "Hello ████."]
+    assert stats_list == [{'PERSON': {'count': 1, 'indices': [(0, 4)], 'engines': [1]}},
+                          {'PERSON': {'count': 1, 'indices': [(6, 10)], 'engines': [1]}}]
+    assert mocked_nlp.pipe.call_args.kwargs['batch_size'] == 8
+    assert mocked_nlp.pipe.call_args.kwargs['disable'] == ['parser']
+    mocked_nlp.select_pipes.assert_not_called()
+
+
+def test_censor_batch_with_spacy_skips_unneeded_model(mock_models):
+    # Mock
+    mocked_nlp = mock_models['spacy']
+    mocked_nlp.pipe_names = ['tok2vec', 'entity_ruler', 'ner']
+
+    # Execute
+    result = main.censor_batch_with_spacy(["Hello Paris"], ['B-LOC'], [{}])
+
+    # Asserts
+    assert result == ["Hello Paris"]
+    mocked_nlp.pipe.assert_not_called()
+
+
+def test_split_text_into_token_windows_short_text(mock_models):
+    # Mock
+    mock_models['hugging_face'].tokenizer.return_value = {'offset_mapping': [(0, 5), (6, 11)]}
+
+    # Execute
+    result = main.split_text_into_token_windows("Hello World", max_tokens=4, stride=1)
+
+    # Assert
+    assert result == [(0, 11)]
+
+
+def test_split_text_into_token_windows_overlap(mock_models):
+    # Mock: one token per word of "a b c d e f"
+    mock_models['hugging_face'].tokenizer.return_value = {
+        'offset_mapping': [(0, 1), (2, 3), (4, 5), (6, 7), (8, 9), (10, 11)]}
+
+    # Execute
+    result = main.split_text_into_token_windows("a b c d e f", max_tokens=3, stride=1)
+
+    # Assert
+    assert result == [(0, 5), (4, 9), (8, 11)]
+
+
+def test_merge_entity_spans():
+    # Initialize
+    spans = [(10, 20, 'B-PER'), (0, 4, 'B-LOC'), (15, 25, 'B-PER'), (30, 35, 'B-PER')]
+
+    # Execute
+    result = main.merge_entity_spans(spans)
+
+    # Assert
+    assert result == [(0, 4, 'B-LOC'), (10, 25, 'B-PER'), (30, 35, 'B-PER')]
+
+
+def test_censor_batch_with_hf_windows(mocker, mock_models):
+    # Mock
+    mocker.patch('assignment1.main.split_text_into_token_windows',
+                 side_effect=lambda text: [(0, 12), (6, len(text))] if len(text) > 20 else [(0, len(text))])
+    mocked_hf = mock_models['hugging_face']
+    mocked_hf.side_effect = lambda texts, **kwargs: [
+        [{'entity_group': 'PER', 'start': 6, 'end': 11}] if text.startswith('Hello') else
+        [{'entity_group': 'PER', 'start': 0, 'end': 5}, {'entity_group': 'LOC', 'start': 17, 'end': 22}]
+        if text.startswith('Smith') else []
+        for text in texts]
+
+    # Initialize
+    texts = ["Hello Smith and Sue in Paris", "No names"]
+    stats_list = [{}, {}]
+
+    # Execute
+    result = main.censor_batch_with_hf(texts, ['B-PER', 'I-PER', 'B-LOC', 'I-LOC'], stats_list, batch_size=4)
+
+    # Asserts
+    assert result == ["Hello █████ and Sue in █████", "No names"]
+    assert stats_list == [{'B-PER': {'count': 1, 'indices': [(6, 11)], 'engines': [2]},
+                           'B-LOC': {'count': 1, 'indices': [(23, 28)], 'engines': [2]}},
+                          {}]
+    assert mocked_hf.call_args.kwargs == {'batch_size': 4, 'aggregation_strategy': 'simple'}
+
+
+def test_censor_batch_with_hf_no_hf_entities(mock_models):
+    # Mock
+    mocked_hf = mock_models['hugging_face']
+
+    # Execute
+    result = main.censor_batch_with_hf(["Hello Smith"], ['DATE'], [{}])
+
+    # Asserts
+    assert result == ["Hello Smith"]
+    mocked_hf.assert_not_called()
+
+
+@pytest.mark.parametrize("spans, expected", [
+    ([], []),
+    ([(5, 8, 'PERSON'), (0, 3, 'DATE')], [(0, 3), (5, 8)]),
+    ([(0, 5, 'PERSON'), (3, 9, 'B-PER'), (9, 12, 'I-PER')], [(0, 12)]),
+    ([(4, 4, 'PERSON'), (6, 7, 'PERSON')], [(6, 7)]),
+])
+def test_merge_spans(spans, expected):
+    # Execute
+    result = main.merge_spans(spans)
+
+    # Assert
+    assert result == expected
+
+
+def test_redact_spans_single_pass():
+    # Initialize
+    text = "John met John Doe on Monday."
+    spans = [(9, 17, 'PERSON'), (21, 27, 'DATE'), (9, 13, 'B-PER')]
+
+    # Execute
+    result = main.redact_spans(text, spans)
+
+    # Assert: only the detected occurrence of "John" is censored
+    assert result == "John met ████████ on ██████."
+
+
+def test_censor_with_spacy_only_censors_detected_occurrence(mocker, mock_models):
+    # Mock
+    entity = mocker.Mock(text='Allen', label_='PERSON', start_char=0, end_char=5)
+    mocker.patch('assignment1.main.recognize_entity', return_value=mocker.Mock(ents=[entity]))
+
+    # Execute
+    censored_text = main.censor_with_spacy("Allen works on Allen Street.", ['PERSON'], {})
+
+    # Assert
+    assert censored_text == "█████ works on Allen Street."
+
+
+@pytest.fixture
+def mock_candidate_nlp(mocker, mock_models):
+    # Mock SpaCy so every candidate starting with a capital "J" is a PERSON
+    mocker.patch.dict('assignment1.main.regex_candidate_cache', clear=True)
+    mocked_nlp = mock_models['spacy']
+    mocked_nlp.pipe_names = ['tok2vec', 'entity_ruler', 'ner']
+    mocked_nlp.pipe.side_effect = lambda candidates, **kwargs: [
+        mocker.Mock(ents=[mocker.Mock(label_='PERSON', start_char=0, end_char=len(candidate))]
+                    if candidate.startswith('J') else [])
+        for candidate in candidates]
+    return mocked_nlp
+
+
+def test_validate_candidates_batches_unique_candidates(mock_candidate_nlp):
+    # Execute
+    result = main.validate_candidates(['John Doe', 'Hello', 'John Doe'])
+
+    # Asserts
+    assert result == {'John Doe': [('PERSON', 0, 8)], 'Hello': []}
+    mock_candidate_nlp.pipe.assert_called_once()
+    assert mock_candidate_nlp.pipe.call_args.args[0] == ['John Doe', 'Hello']
+
+
+def test_validate_candidates_uses_cache(mock_candidate_nlp):
+    # Execute
+    main.validate_candidates(['John Doe'])
+    result = main.validate_candidates(['John Doe'])
+
+    # Asserts
+    assert result == {'John Doe': [('PERSON', 0, 8)]}
+    assert mock_candidate_nlp.pipe.call_count == 1
+
+
+def test_validate_candidates_evicts_least_recently_used(mocker, mock_candidate_nlp):
+    # Mock
+    mocker.patch('assignment1.main.REGEX_CANDIDATE_CACHE_SIZE', 2)
+
+    # Execute
+    main.validate_candidates(['Jack', 'Jill'])
+    main.validate_candidates(['Jack'])
+    main.validate_candidates(['Joe'])
+
+    # Assert
+    assert list(main.regex_candidate_cache) == ['Jack', 'Joe']
+
+
+def test_spacy_path_shared_by_threads(mocker, mock_candidate_nlp):
+    # Mock
+    mocker.patch('assignment1.main.REGEX_CANDIDATE_CACHE_SIZE', 4)
+    mocker.patch('assignment1.main.check_entity_regex', side_effect=lambda text, entity: [
+        (match.group(), match.start(), match.end()) for match in re.finditer(r"[A-Z]\w+", text)])
+    mock_candidate_nlp.pipe_names = ['tok2vec', 'parser', 'entity_ruler', 'ner']
+    parse_candidates = mock_candidate_nlp.pipe.side_effect
+
+    def pipe(texts, as_tuples=False, **kwargs):
+        # Give the other threads a chance to run between the cache lookup and its update
+        time.sleep(0.001)
+        if not as_tuples:
+            return parse_candidates(texts, **kwargs)
+        return [(mocker.Mock(ents=[mocker.Mock(text=match.group(), label_='PERSON', start_char=match.start(),
+                                               end_char=match.end()) for match in re.finditer(r"J\w+", chunk)]),
+                 context) for chunk, context in texts]
+
+    mock_candidate_nlp.pipe.side_effect = pipe
+    names = [f"J{letter}n" for letter in "abcdefghijkl"]
+
+    def censor(index):
+        text = f"{names[index % len(names)]} and {names[(index + 5) % len(names)]} met Bob"
+        return (text, main.censor_with_regex(text, ['PERSON']),
+                main.censor_batch_with_spacy([text], ['PERSON'], [{}])[0])
+
+    # Execute
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(censor, range(200)))
+
+    # Asserts
+    for text, regex_text, spacy_text in results:
+        expected = re.sub(r"J\w+", lambda match: "█" * len(match.group()), text)
+        assert regex_text == expected
+        assert spacy_text == expected
+    assert len(main.regex_candidate_cache) <= 4
+    mock_candidate_nlp.select_pipes.assert_not_called()
+    assert {tuple(call.kwargs['disable']) for call in mock_candidate_nlp.pipe.call_args_list} == {('parser',)}
+
+
+def test_censor_with_regex_single_spacy_call(mocker, mock_candidate_nlp):
+    # Mock
+    mocker.patch('assignment1.main.check_entity_regex', return_value=[
+        ('Jane', 0, 4), ('Hello', 10, 15), ('Jane', 16, 20)])
+
+    # Execute
+    censored_text = main.censor_with_regex("Jane said Hello Jane", ['PERSON'])
+
+    # Asserts
+    assert censored_text == "████ said Hello ████"
+    assert mock_candidate_nlp.pipe.call_count == 1
+
+
+@pytest.mark.parametrize("entities_to_censor, expected", [
+    ([], []),
+    (['DATE'], ['spacy']),
+    (['PHONE'], ['spacy']),
+    (['PERSON', 'B-PER', 'I-PER'], ['spacy', 'hugging_face']),
+    (['B-LOC', 'I-LOC'], ['hugging_face']),
+])
+def test_models_for(entities_to_censor, expected):
+    # Execute
+    result = main.models_for(entities_to_censor)
+
+    # Assert
+    assert result == expected
+
+
+def test_censor_with_hf_finds_entities_past_the_bert_context(mock_models):
+    # Mock
+    def tokenize(text, **kwargs):
+        return {'offset_mapping': [(match.start(), match.end()) for match in re.finditer(r"\S+", text)]}
+
+    def recognize(texts, **kwargs):
+        assert all(len(tokenize(text)['offset_mapping']) <= main.HF_MAX_TOKENS for text in texts)
+        return [[{'entity_group': 'PER', 'start': match.start(), 'end': match.end()}
+                 for match in re.finditer("Zed", text)] for text in texts]
+
+    mock_models['hugging_face'].tokenizer.side_effect = tokenize
+    mock_models['hugging_face'].side_effect = recognize
+
+    # Initialize
+    text = "word " * 600 + "Zed wrote this."
+    stats = {}
+
+    # Execute
+    censored_text = main.censor_with_hf(text, ['B-PER'], stats)
+
+    # Asserts
+    assert censored_text == "word " * 600 + "███ wrote this."
+    assert stats == {'B-PER': {'count': 1, 'indices': [(3000, 3003)], 'engines': [2]}}
+
+
+def test_censor_with_hf_skips_model_without_hf_entities(mocker):
+    # Mock
+    mocked_get = mocker.patch.object(main.models, 'get')
+
+    # Execute
+    censored_text = main.censor_with_hf("Hello John", ['DATE'], {})
+
+    # Asserts
+    assert censored_text == "Hello John"
+    mocked_get.assert_not_called()
+
+
+@pytest.mark.parametrize("entities_to_censor, engine, expected", [
+    (['DATE', 'PHONE'], None, {'rules': ['PHONE'], 'spacy': ['DATE'], 'hugging_face': []}),
+    (['DATE', 'PHONE'], 'rules', {'rules': ['DATE', 'PHONE'], 'spacy': [], 'hugging_face': []}),
+    (['PERSON', 'B-PER', 'I-PER'], None, {'rules': [], 'spacy': ['PERSON'], 'hugging_face': ['B-PER', 'I-PER']}),
+    (['DATE'], 'ensemble', {'rules': [], 'spacy': ['DATE'], 'hugging_face': []}),
+    (['PERSON', 'B-PER', 'I-PER'], 'hf', {'rules': [], 'spacy': [], 'hugging_face': ['B-PER', 'I-PER']}),
+    (['DATE', 'B-PER'], 'hf', {'rules': [], 'spacy': ['DATE'], 'hugging_face': ['B-PER']}),
+    (['PERSON', 'B-PER', 'I-PER'], 'rules', {'rules': [], 'spacy': ['PERSON'], 'hugging_face': ['B-PER', 'I-PER']}),
+    (['ADDRESS', 'GPE', 'FAC', 'LOC', 'B-LOC', 'I-LOC'], 'rules',
+     {'rules': ['ADDRESS'], 'spacy': ['GPE', 'FAC', 'LOC'], 'hugging_face': ['B-LOC', 'I-LOC']}),
+    (['ADDRESS', 'GPE', 'B-LOC'], 'spacy', {'rules': [], 'spacy': ['ADDRESS', 'GPE'], 'hugging_face': []}),
+])
+def test_engine_labels(entities_to_censor, engine, expected):
+    # Execute
+    result = main.engine_labels(entities_to_censor, engine)
+
+    # Assert
+    assert result == expected
+
+
+def test_models_for_default_engines():
+    # Assert
+    assert main.models_for(['PHONE'], None) == ['rules']
+    assert main.models_for(['DATE', 'PHONE'], None) == ['rules', 'spacy']
+    assert main.models_for(['DATE', 'PHONE'], 'rules') == ['rules']
+    assert main.models_for(['ADDRESS'], 'rules') == []
+    assert main.models_for(['ADDRESS', 'GPE', 'B-LOC'], 'rules') == ['spacy', 'hugging_face']
+
+
+def test_censor_with_rules():
+    # Initialize
+    stats = {}
+
+    # Execute
+    censored_text = main.censor_with_rules("Call 123-456-7890 on 14 May 2001 at 1400 Smith Street",
+                                           ['PHONE', 'DATE', 'ADDRESS'], stats)
+
+    # Asserts
+    assert censored_text == "Call ████████████ on ███████████ at █████████████████"
+    assert stats == {'PHONE': {'count': 1, 'indices': [(5, 17)], 'engines': [0]},
+                     'DATE': {'count': 1, 'indices': [(21, 32)], 'engines': [0]},
+                     'ADDRESS': {'count': 1, 'indices': [(36, 53)], 'engines': [0]}}
+
+
+def test_censor_with_rules_never_loads_statistical_models(mocker):
+    # Mock
+    mock_get = mocker.patch.object(main.models, 'get', wraps=main.models.get)
+
+    # Execute
+    main.censor_with_rules("Mail me on 05/03/2001", ['DATE'], {})
+
+    # Assert
+    assert [call.args[0] for call in mock_get.call_args_list] == ['rules']
@@ -0,0 +1,69 @@
+import pytest
+from assignment1.mmapio import byte_spans, find_byte_split_point, map_file, mapped_blocks, write_patched
+
+
+def test_map_file(tmp_path):
+    # Initialize
+    (tmp_path / "mail.txt").write_bytes(b"Mail from Allen")
+    (tmp_path / "empty.txt").write_bytes(b"")
+
+    # Execute
+    with map_file(tmp_path / "mail.txt") as data:
+        content = data[:]
+    with map_file(tmp_path / "empty.txt") as data:
+        empty = data[:]
+
+    # Asserts
+    assert content == b"Mail from Allen"
+    assert empty == b""
+    with pytest.raises(OSError):
+        map_file(tmp_path / "missing.txt")
+
+
+def test_mapped_blocks_cut_between_paragraphs():
+    # Initialize
+    data = b"First paragraph.\n\nSecond paragraph.\n\nThird one, a bit longer.\n"
+
+    # Execute
+    blocks = mapped_blocks(data, block_bytes=40)
+
+    # Asserts
+    assert blocks == [(0, 37), (37, len(data))]
+    assert data[blocks[0][0]:blocks[0][1]].endswith(b"\n\n")
+    assert mapped_blocks(data, 18) == [(18, len(data))]
+
+
+def test_find_byte_split_point_keeps_characters_whole():
+    # Initialize
+    data = "ééééé".encode("utf-8")
+
+    # Execute
+    split_at = find_byte_split_point(data, 0, 5)
+
+    # Assert
+    assert split_at == 4
+    assert data[:split_at].decode("utf-8") == "éé"
+
+
+def test_byte_spans_of_non_ascii_text():
+    # Initialize
+    text = "José wrote to Zoë"
+
+    # Execute
+    spans = byte_spans(text, [(0, 4), (14, 17)], offset=10)
+
+    # Asserts
+    encoded = text.encode("utf-8")
+    assert [encoded[start - 10:end - 10].decode("utf-8") for start, end in spans] == ["José", "Zoë"]
+    assert byte_spans("Tim wrote", [(0, 3)], 2) == [(2, 5)]
+
+
+def test_write_patched(tmp_path):
+    # Initialize
+    data = "José called Zoë at 555-1234".encode("utf-8")
+
+    # Execute
+    write_patched(data, tmp_path / "out.censored", [(13, 17), (0, 5), (3, 5)])
+
+    # Assert
+    assert (tmp_path / "out.censored").read_text(encoding="utf-8") == "████ called ███ at 555-1234"
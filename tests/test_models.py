@@ -0,0 +1,186 @@
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import sys
+import time
+import pytest
+from assignment1 import main, models
+from assignment1.cache import censored_spans
+
+
+PARITY_CORPUS = Path(__file__).parent.parent / "files"
+PARITY_FILES = 20
+# Share of censored characters both backends agree on
+PARITY_MIN_AGREEMENT = 0.98
+
+
+def test_model_registry_loads_lazily(mocker):
+    # Initialize
+    loader = mocker.Mock(return_value='model')
+    registry = models.ModelRegistry()
+    registry.register('spacy', loader)
+
+    # Asserts
+    loader.assert_not_called()
+    assert registry.is_loaded('spacy') is False
+
+
+def test_model_registry_loads_once(mocker):
+    # Initialize
+    loader = mocker.Mock(return_value='model')
+    registry = models.ModelRegistry()
+    registry.register('spacy', loader)
+
+    # Execute
+    first = registry.get('spacy')
+    second = registry.get('spacy')
+
+    # Asserts
+    assert first == second == 'model'
+    loader.assert_called_once()
+    assert registry.is_loaded('spacy') is True
+
+
+def test_model_registry_loads_once_across_threads(mocker):
+    # Initialize
+    loader = mocker.Mock(side_effect=lambda: time.sleep(0.05) or 'model')
+    registry = models.ModelRegistry()
+    registry.register('spacy', loader)
+
+    # Execute
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        loaded = list(executor.map(lambda _: registry.get('spacy'), range(8)))
+
+    # Asserts
+    assert loaded == ['model'] * 8
+    loader.assert_called_once()
+
+
+def test_torch_threads_restores_previous_count():
+    # Initialize
+    torch = pytest.importorskip("torch")
+    previous = torch.get_num_threads()
+
+    # Execute
+    with models.torch_threads(1):
+        inside = torch.get_num_threads()
+
+    # Asserts
+    assert inside == 1
+    assert torch.get_num_threads() == previous
+
+
+def test_torch_threads_without_torch(monkeypatch):
+    # Mock
+    monkeypatch.delitem(sys.modules, "torch", raising=False)
+
+    # Execute
+    with models.torch_threads(2):
+        pass
+
+    # Asserts
+    assert "torch" not in sys.modules
+
+
+@pytest.mark.parametrize("cpus, threads, expected", [(8, 4, 2), (8, 3, 2), (2, 4, 1), (None, 2, 1)])
+def test_torch_threads_per_worker(mocker, cpus, threads, expected):
+    # Mock
+    mocker.patch('assignment1.models.os.cpu_count', return_value=cpus)
+
+    # Assert
+    assert models.torch_threads_per_worker(threads) == expected
+
+
+def test_model_registry_warmup_only_requested(mocker):
+    # Initialize
+    spacy_loader = mocker.Mock(return_value='spacy model')
+    hf_loader = mocker.Mock(return_value='hf model')
+    registry = models.ModelRegistry()
+    registry.register('spacy', spacy_loader)
+    registry.register('hugging_face', hf_loader)
+
+    # Execute
+    registry.warmup(['spacy'])
+
+    # Asserts
+    spacy_loader.assert_called_once()
+    hf_loader.assert_not_called()
+
+
+def test_default_registry_knows_all_models():
+    # Assert
+    assert set(models.models.loaders) == {'rules', 'spacy', 'hugging_face'}
+
+
+def test_model_registry_register_replaces_loaded_model(mocker):
+    # Initialize
+    registry = models.ModelRegistry()
+    registry.register('hugging_face', mocker.Mock(return_value='torch model'))
+    registry.get('hugging_face')
+
+    # Execute
+    registry.register('hugging_face', mocker.Mock(return_value='quantized model'))
+
+    # Asserts
+    assert registry.is_loaded('hugging_face') is False
+    assert registry.get('hugging_face') == 'quantized model'
+
+
+def test_use_hf_backend_swaps_loader(mocker):
+    # Mock
+    registry = models.ModelRegistry()
+    mocker.patch('assignment1.models.models', registry)
+    mocker.patch('assignment1.models.hf_backend', 'torch')
+    mock_loader = mocker.patch('assignment1.models.load_hugging_face_model', return_value='quantized model')
+
+    # Execute
+    models.use_hf_backend('quantized')
+
+    # Asserts
+    assert models.hf_backend == 'quantized'
+    assert registry.get('hugging_face') == 'quantized model'
+    mock_loader.assert_called_once_with('quantized')
+
+
+def test_use_hf_backend_rejects_unknown_backend(mocker):
+    # Mock
+    mocker.patch('assignment1.models.hf_backend', 'torch')
+
+    # Execute and Asserts
+    with pytest.raises(ValueError, match="Unknown Hugging face backend"):
+        models.use_hf_backend('tensorrt')
+
+
+@pytest.fixture(scope="module")
+def parity_texts():
+    # First files of the bundled corpus, the same inputs for every backend
+    file_paths = sorted(PARITY_CORPUS.glob("*.txt"))[:PARITY_FILES]
+    return [file_path.read_text(encoding="utf-8") for file_path in file_paths]
+
+
+def hf_censored_chars(mocker, hf_model, texts):
+    # (text index, offset) of every character censor_with_hf blocks out with the given model
+    mocker.patch.dict(main.models.loaded, {'hugging_face': hf_model})
+    labels = ["B-PER", "I-PER", "B-LOC", "I-LOC"]
+    return {(index, offset) for index, text in enumerate(texts)
+            for start, end in censored_spans(main.censor_with_hf(text, labels, {}))
+            for offset in range(start, end)}
+
+
+@pytest.mark.parametrize("backend", ["quantized", "onnx"])
+def test_hf_backend_parity_with_torch(mocker, parity_texts, backend):
+    # Initialize
+    if backend == "onnx":
+        pytest.importorskip("optimum.onnxruntime")
+    try:
+        reference_model = models.load_hugging_face_model("torch")
+        backend_model = models.load_hugging_face_model(backend)
+    except OSError:
+        pytest.skip(f"{models.HF_MODEL_NAME} is not available")
+
+    # Execute
+    reference = hf_censored_chars(mocker, reference_model, parity_texts)
+    candidate = hf_censored_chars(mocker, backend_model, parity_texts)
+
+    # Asserts
+    agreement = len(reference & candidate) / max(1, len(reference | candidate))
+    assert agreement >= PARITY_MIN_AGREEMENT
@@ -0,0 +1,52 @@
+import pytest
+from assignment1 import gazetteer
+from assignment1.gazetteer import Gazetteer
+from assignment1.instrumentation import metrics
+from assignment1.prefilter import Prefilter, segment_score
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("Here is our forecast.", 0),
+    ("Thanks. I will send it", 0),
+    ("please call bill tomorrow", 0),
+    ("Send it to Allen", 2),
+    ("Allen sent it.", 1),
+    ("Call me at 713", 4),
+    ("the office on main street", 2),
+])
+def test_segment_score(text, expected):
+    # Assert
+    assert segment_score(text) == expected
+
+
+def test_segment_score_counts_known_entities(mocker):
+    # Mock
+    index = Gazetteer()
+    index.add("houston", "GPE")
+    mocker.patch('assignment1.gazetteer.active', index)
+
+    # Asserts
+    assert segment_score("see you in houston", ['GPE']) == 4
+    assert segment_score("see you in houston", ['PERSON']) == 0
+
+
+def test_prefilter_keeps_candidates_only():
+    # Initialize
+    text = "Here is our forecast.\n\nSend it to Allen\n\nthanks"
+    segments = [(0, 21), (23, 39), (41, 47)]
+    metrics.reset()
+
+    # Execute
+    candidates = Prefilter(2).candidates(text, segments)
+
+    # Asserts
+    assert candidates == [(23, 39)]
+    assert metrics.hit_rates()['prefilter'] == pytest.approx(2 / 3, abs=1e-6)
+    assert metrics.counters['prefilter_chars_hits'] == 27
+
+
+def test_lower_threshold_keeps_more():
+    # Assert
+    assert Prefilter(1).is_candidate("Allen sent it.")
+    assert not Prefilter(2).is_candidate("Allen sent it.")
+    assert gazetteer.active is None
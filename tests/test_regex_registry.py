@@ -0,0 +1,108 @@
+import pytest
+from assignment1 import regex_registry
+
+
+@pytest.fixture(autouse=True)
+def restore_registry():
+    # Every test starts and ends with the default registry
+    regex_registry.reset_patterns()
+    yield
+    regex_registry.reset_patterns()
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("call 713-853-7041 now", [('PHONE', '713-853-7041', 5, 17)]),
+    ("call (713) 853-7041 now", [('PHONE', '(713) 853-7041', 5, 19)]),
+    ("on 05/03/2001 and", [('DATE', '05/03/2001', 3, 13)]),
+    ("since 14 May 2001", [('DATE', '14 May 2001', 6, 17)]),
+    ("mail pallen@enron.com", [('EMAIL', 'pallen@enron.com', 5, 21)]),
+    ("at 1400 Smith Street", [('ADDRESS', '1400 Smith Street', 3, 20)]),
+    ("(and we're open to more suggestions)", []),
+    ("Mark 12, Marketing 10 and Mayor 10", [('NAME', 'Mark', 0, 4), ('NAME', 'Marketing', 9, 18),
+                                            ('NAME', 'Mayor', 26, 31)]),
+    ("Allen 12", [('NAME', 'Allen', 0, 5)]),
+])
+def test_scan_entities_single_entity(text, expected):
+    # Execute
+    result = regex_registry.scan_entities(text)
+
+    # Assert
+    assert result == expected
+
+
+def test_scan_entities_finds_all_kinds_in_text_order():
+    # Initialize
+    text = "John Doe: 713-853-7041, jdoe@enron.com, 12/13/2000"
+
+    # Execute
+    result = regex_registry.scan_entities(text)
+
+    # Assert
+    assert [entity for entity, _, _, _ in result] == ['NAME', 'PHONE', 'EMAIL', 'DATE']
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("Sent Dec 13, 2000 by Tim", [('DATE', 'Dec 13, 2000', 5, 17), ('NAME', 'Tim', 21, 24)]),
+    ("Meeting May 14 2001", [('DATE', 'May 14', 8, 14)]),
+    ("Call Tim 713-853-7041", [('NAME', 'Call Tim', 0, 8), ('PHONE', '713-853-7041', 9, 21)]),
+])
+def test_scan_entities_name_does_not_swallow_specific_entity(text, expected):
+    # Execute
+    result = regex_registry.scan_entities(text)
+
+    # Assert
+    assert result == expected
+
+
+@pytest.mark.parametrize("text", ["Sept 5", "Sep. 5", "September 5", "June 3", "Jun 3", "Dec 13, 2000"])
+def test_scan_entities_month_names(text):
+    # Execute
+    result = regex_registry.scan_entities(text, ['DATE'])
+
+    # Assert
+    assert result == [('DATE', text, 0, len(text))]
+
+
+def test_scan_entities_filtered():
+    # Initialize
+    text = "John Doe: 713-853-7041, jdoe@enron.com"
+
+    # Execute
+    result = regex_registry.scan_entities(text, ['PHONE'])
+
+    # Assert
+    assert result == [('PHONE', '713-853-7041', 10, 22)]
+
+
+def test_scan_entities_unknown_entity():
+    # Execute
+    result = regex_registry.scan_entities("John Doe", ['LOCATION'])
+
+    # Assert
+    assert result == []
+
+
+def test_register_pattern_at_runtime():
+    # Execute
+    regex_registry.register_pattern('TICKET', r"\bINC-\d+\b", before='NAME')
+    result = regex_registry.scan_entities("See INC-42 today")
+
+    # Asserts
+    assert ('TICKET', 'INC-42', 4, 10) in result
+    assert list(regex_registry.compiled_patterns).index('TICKET') < list(regex_registry.compiled_patterns).index('NAME')
+
+
+def test_register_pattern_rejects_named_groups():
+    # Assert
+    with pytest.raises(ValueError):
+        # Execute
+        regex_registry.register_pattern('BAD', r"(?P<inner>x)")
+
+
+def test_get_pattern_is_precompiled():
+    # Execute
+    pattern = regex_registry.get_pattern('NAME')
+
+    # Asserts
+    assert pattern is regex_registry.get_pattern('NAME')
+    assert regex_registry.get_pattern('LOCATION') is None
@@ -0,0 +1,200 @@
+import http.client
+import json
+import threading
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from assignment1.server import create_server, MicroBatcher
+
+
+def fake_censor_batch(calls):
+    # Censors "Allen" and remembers the texts of every call
+    def censor_batch(texts, entities_to_censor, engine):
+        calls.append((list(texts), entities_to_censor, engine))
+        return [(text.replace('Allen', '█████'), {'PERSON': {'count': text.count('Allen'), 'indices': []}})
+                for text in texts]
+    return censor_batch
+
+
+def parse_request(body):
+    # Same request format as censoror.parse_censor_request, with fixed labels per flag
+    if 'text' not in body:
+        raise ValueError('The body needs a "text" string')
+    if body.get('engine', 'rules') != 'rules':
+        raise ValueError("Unknown engine")
+    entities_to_censor = [label for flag, label in [('names', 'PERSON'), ('dates', 'DATE')] if body.get(flag)]
+    return body['text'], entities_to_censor, body.get('engine')
+
+
+@pytest.fixture
+def start_server():
+    # Run a server on a free local port, shut down after the test
+    servers = []
+
+    def start(censor_batch, **options):
+        server = create_server(censor_batch, parse_request, port=0, verbose=False, **options)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return f"http://127.0.0.1:{server.server_address[1]}"
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def post(url, body):
+    # (status, headers, json) of a POST request
+    request = urllib.request.Request(url, data=json.dumps(body).encode("utf-8"),
+                                     headers={'Content-Type': "application/json"})
+    try:
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return response.status, response.headers, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, e.headers, json.loads(e.read())
+
+
+def test_censor_request(start_server):
+    # Initialize
+    calls = []
+    url = start_server(fake_censor_batch(calls))
+
+    # Execute
+    status, headers, content = post(url + "/censor", {'text': "Mail from Allen", 'names': True, 'dates': True})
+
+    # Asserts
+    assert status == 200
+    assert content['censored_text'] == "Mail from █████"
+    assert content['stats'] == {'PERSON': {'count': 1, 'indices': []}}
+    assert content['batch_size'] == 1
+    assert float(headers['X-Latency-Ms']) == content['latency_ms'] > 0
+    assert calls == [(["Mail from Allen"], ['PERSON', 'DATE'], None)]
+
+
+def test_concurrent_requests_are_batched(start_server):
+    # Initialize
+    calls = []
+    url = start_server(fake_censor_batch(calls), window_seconds=0.5, max_batch=8)
+
+    # Execute
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        responses = list(executor.map(lambda index: post(url + "/censor", {'text': f"Mail {index} from Allen",
+                                                                           'names': True}), range(4)))
+
+    # Asserts
+    assert [content['censored_text'] for _, _, content in responses] == [f"Mail {index} from █████"
+                                                                         for index in range(4)]
+    assert len(calls) < 4
+    assert max(content['batch_size'] for _, _, content in responses) > 1
+
+
+def test_requests_with_other_flags_get_their_own_call():
+    # Initialize
+    calls = []
+    batcher = MicroBatcher(fake_censor_batch(calls), window_seconds=0.5)
+
+    # Execute
+    futures = [batcher.submit("Allen", ['PERSON']), batcher.submit("Allen", ['DATE']),
+               batcher.submit("Allen again", ['PERSON'])]
+    results = [future.result(timeout=10) for future in futures]
+    batcher.close()
+
+    # Asserts
+    assert sorted((texts, entities) for texts, entities, _ in calls) == [
+        (["Allen"], ['DATE']), (["Allen", "Allen again"], ['PERSON'])]
+    assert [batch_size for _, _, batch_size in results] == [2, 1, 2]
+
+
+def test_concurrency_limit(start_server):
+    # Mock
+    started = threading.Event()
+    release = threading.Event()
+
+    def slow_censor_batch(texts, entities_to_censor, engine):
+        started.set()
+        release.wait(10)
+        return [(text, {}) for text in texts]
+
+    # Initialize
+    url = start_server(slow_censor_batch, max_concurrency=1, window_seconds=0)
+
+    # Execute
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        first = executor.submit(post, url + "/censor", {'text': "first"})
+        # The first request holds the only slot while it is censored
+        started.wait(10)
+        status, headers, content = post(url + "/censor", {'text': "second"})
+        release.set()
+
+    # Asserts
+    assert status == 503
+    assert headers['Retry-After'] == "1"
+    assert first.result()[0] == 200
+
+
+@pytest.mark.parametrize("path, body, expected_status", [
+    ("/censor", {'names': True}, 400),
+    ("/censor", {'text': "Allen", 'engine': "gpt"}, 400),
+    ("/unknown", {'text': "Allen"}, 404),
+])
+def test_invalid_requests(start_server, path, body, expected_status):
+    # Initialize
+    calls = []
+    url = start_server(fake_censor_batch(calls))
+
+    # Execute
+    status, _, content = post(url + path, body)
+
+    # Asserts
+    assert status == expected_status
+    assert 'error' in content
+    assert calls == []
+
+
+@pytest.mark.parametrize("content_length", ["-1", "abc"])
+def test_invalid_content_length(start_server, content_length):
+    # Initialize
+    calls = []
+    url = start_server(fake_censor_batch(calls))
+    connection = http.client.HTTPConnection(url[len("http://"):], timeout=10)
+
+    # Execute
+    # The connection stays open, a handler waiting for the end of the body would never answer
+    connection.request("POST", "/censor", body=b'{"text": "Allen"}', headers={'Content-Length': content_length})
+    response = connection.getresponse()
+    content = json.loads(response.read())
+    connection.close()
+
+    # Asserts
+    assert response.status == 400
+    assert "Content-Length" in content['error']
+    assert calls == []
+
+
+def test_censor_error_is_reported(start_server):
+    # Mock
+    def failing_censor_batch(texts, entities_to_censor, engine):
+        raise RuntimeError("model failed")
+
+    # Initialize
+    url = start_server(failing_censor_batch)
+
+    # Execute
+    status, _, content = post(url + "/censor", {'text': "Allen"})
+
+    # Asserts
+    assert status == 500
+    assert content == {'error': "model failed"}
+
+
+def test_health(start_server):
+    # Initialize
+    url = start_server(fake_censor_batch([]))
+
+    # Execute
+    with urllib.request.urlopen(url + "/health", timeout=10) as response:
+        content = json.loads(response.read())
+
+    # Assert
+    assert content == {'status': 'ok'}
@@ -0,0 +1,144 @@
+import json
+import pytest
+from assignment1.shard import (ShardManifest, find_manifests, journal_records, manifest_path, merge_manifests,
+                               parse_shard, read_journal, shard_files)
+from assignment1.stats import StatsCollector
+
+
+SETTINGS = {'entities': ['PERSON'], 'email': False, 'engine': None, 'prefilter': None, 'gazetteer': None,
+            'dedup': False, 'hf_backend': "torch"}
+
+
+def test_parse_shard():
+    # Asserts
+    assert parse_shard("3/8") == (3, 8)
+    for value in ["0/2", "3/2", "1", "a/b", "1/0"]:
+        with pytest.raises(ValueError):
+            parse_shard(value)
+
+
+def test_shard_files_partition_the_sorted_files():
+    # Initialize
+    file_paths = [f"files/{index}.txt" for index in range(10)]
+
+    # Execute
+    shards = [shard_files(reversed(file_paths), index, 3) for index in range(1, 4)]
+
+    # Asserts
+    assert shards[0] == ["files/0.txt", "files/3.txt", "files/6.txt", "files/9.txt"]
+    assert sorted(file_path for shard in shards for file_path in shard) == sorted(file_paths)
+    assert shard_files(file_paths, 2, 3) == shards[1]
+
+
+def test_manifest_resumes_recorded_files(tmp_path):
+    # Initialize
+    path = manifest_path(tmp_path, 1, 2)
+    manifest = ShardManifest(path, 1, 2, SETTINGS).load()
+
+    # Execute
+    manifest.record(tmp_path / "a.censored", {'PERSON': {'count': 1, 'indices': [(0, 5)]}})
+    manifest.close()
+    resumed = ShardManifest(path, 1, 2, SETTINGS).load()
+
+    # Asserts
+    assert path.name == ".censoror-shard-1-of-2.jsonl"
+    assert resumed.done(tmp_path / "a.censored")
+    assert not resumed.done(tmp_path / "b.censored")
+    assert resumed.completed == {str(tmp_path / "a.censored")}
+    assert list(journal_records(path)) == [(str(tmp_path / "a.censored"),
+                                            {'PERSON': {'count': 1, 'indices': [(0, 5)]}})]
+    assert resumed.complete is False
+
+
+def test_manifest_drops_line_cut_by_crash(tmp_path):
+    # Initialize
+    path = manifest_path(tmp_path, 1, 1)
+    manifest = ShardManifest(path, 1, 1, SETTINGS)
+    manifest.record("a.censored", {})
+    manifest.close()
+    with open(path, "a", encoding="utf-8") as file:
+        file.write('{"file": "b.censored", "sta')
+
+    # Execute
+    resumed = ShardManifest(path, 1, 1, SETTINGS).load()
+    resumed.record("c.censored", {})
+    resumed.finish()
+    resumed.close()
+
+    # Asserts
+    header, records, complete, _ = read_journal(path)
+    assert header['shard'] == [1, 1]
+    assert records == {"a.censored": 1, "c.censored": 1}
+    assert complete is True
+
+
+def test_manifest_rejects_other_flags(tmp_path):
+    # Initialize
+    path = manifest_path(tmp_path, 1, 2)
+    manifest = ShardManifest(path, 1, 2, SETTINGS)
+    manifest.record("a.censored", {})
+    manifest.close()
+
+    # Asserts
+    with pytest.raises(ValueError):
+        ShardManifest(path, 1, 2, dict(SETTINGS, engine="rules")).load()
+    with pytest.raises(ValueError):
+        ShardManifest(path, 2, 2, SETTINGS).load()
+
+
+def test_merge_manifests_reports_incomplete_shards(tmp_path):
+    # Initialize
+    first = ShardManifest(manifest_path(tmp_path, 1, 3), 1, 3, SETTINGS)
+    first.record("a.censored", {'PERSON': {'count': 2, 'indices': [(0, 5), (9, 12)]}})
+    first.finish()
+    first.close()
+    second = ShardManifest(manifest_path(tmp_path, 2, 3), 2, 3, SETTINGS)
+    second.record("b.censored", {'PERSON': {'count': 1, 'indices': [(3, 6)]}})
+    second.close()
+
+    # Execute
+    with StatsCollector(str(tmp_path / "stats.jsonl"), "jsonl") as collector:
+        incomplete = merge_manifests(find_manifests(tmp_path), collector)
+
+    # Asserts
+    assert incomplete == [2, 3]
+    with open(tmp_path / "stats.jsonl", encoding="utf-8") as file:
+        records = [json.loads(line) for line in file]
+    assert [record.get('file') for record in records] == ["a.censored", "b.censored", None]
+    assert records[-1] == {'summary': {'files': 2, 'totals': {'PERSON': 3}}}
+
+
+def test_merge_manifests_counts_files_censored_again_once(tmp_path):
+    # Initialize
+    manifest = ShardManifest(manifest_path(tmp_path, 1, 1), 1, 1, SETTINGS)
+    manifest.record("a.censored", {'PERSON': {'count': 1, 'indices': [(0, 5)]}})
+    manifest.record("b.censored", {'PERSON': {'count': 1, 'indices': [(2, 4)]}})
+    manifest.record("a.censored", {'PERSON': {'count': 2, 'indices': [(0, 5), (7, 9)]}})
+    manifest.finish()
+    manifest.close()
+
+    # Execute
+    with StatsCollector(str(tmp_path / "stats.jsonl"), "jsonl") as collector:
+        incomplete = merge_manifests(find_manifests(tmp_path), collector)
+
+    # Asserts
+    assert incomplete == []
+    with open(tmp_path / "stats.jsonl", encoding="utf-8") as file:
+        records = [json.loads(line) for line in file]
+    assert records[:-1] == [{'file': "b.censored", 'stats': {'PERSON': {'count': 1, 'indices': [[2, 4]]}}},
+                            {'file': "a.censored", 'stats': {'PERSON': {'count': 2, 'indices': [[0, 5], [7, 9]]}}}]
+    assert records[-1] == {'summary': {'files': 2, 'totals': {'PERSON': 3}}}
+
+
+def test_merge_manifests_rejects_several_splits(tmp_path):
+    # Initialize
+    for index, count in [(1, 2), (1, 3)]:
+        manifest = ShardManifest(manifest_path(tmp_path, index, count), index, count, SETTINGS)
+        manifest.finish()
+        manifest.close()
+
+    # Assert
+    with pytest.raises(ValueError):
+        merge_manifests(find_manifests(tmp_path), StatsCollector(None))
+    with pytest.raises(ValueError):
+        merge_manifests(find_manifests(tmp_path / "empty"), StatsCollector(None))
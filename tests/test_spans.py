@@ -0,0 +1,150 @@
+import csv
+import sys
+import pytest
+from assignment1.spans import CompactSpans, SpanTable, SpanWriter, spans_format_of
+
+
+STATS = {'PERSON': {'count': 2, 'indices': [(0, 4), (9, 13)]}, 'PHONE': 1, 'DATE': {'count': 1, 'indices': [(20, 30)]}}
+ENGINES = {'PERSON': "spacy", 'DATE': "rules"}
+ROWS = [("a.censored", "PERSON", "spacy", 0, 4), ("a.censored", "PERSON", "spacy", 9, 13),
+        ("a.censored", "DATE", "rules", 20, 30), ("b.censored", "PERSON", "spacy", 5, 9)]
+
+
+def write_spans(path, spans_format=None, batch_rows=2):
+    with SpanWriter(path, spans_format, ENGINES, batch_rows) as writer:
+        writer.add("a.censored", STATS)
+        writer.add("b.censored", {'PERSON': {'count': 1, 'indices': [(5, 9)]}})
+    return writer
+
+
+def test_compact_spans_round_trip():
+    # Execute
+    spans = CompactSpans.from_stats(STATS)
+
+    # Asserts
+    assert len(spans) == 3
+    # Three ints per span plus a one-byte engine id
+    assert spans.nbytes() == 4 * (3 + 3 * 3) + 3
+    assert spans.to_stats() == {'PERSON': {'count': 2, 'indices': [(0, 4), (9, 13)]},
+                                'PHONE': {'count': 1, 'indices': []},
+                                'DATE': {'count': 1, 'indices': [(20, 30)]}}
+    assert list(spans.to_stats()) == ['PERSON', 'PHONE', 'DATE']
+    # Every call returns new lists
+    assert spans.to_stats()['PERSON']['indices'] is not spans.to_stats()['PERSON']['indices']
+
+
+def test_compact_spans_keep_engines():
+    # Initialize
+    stats = {'PERSON': {'count': 2, 'indices': [(0, 4), (9, 13)], 'engines': [3, 4]},
+             'DATE': {'count': 1, 'indices': [(20, 30)]}}
+
+    # Execute
+    spans = CompactSpans.from_stats(stats)
+
+    # Asserts
+    assert spans.to_stats() == stats
+
+
+def test_span_table_interns_names():
+    # Initialize
+    table = SpanTable()
+
+    # Execute
+    table.add("a.censored", STATS, ENGINES)
+    table.add("b.censored", {'PERSON': {'count': 1, 'indices': [(5, 9)]}}, ENGINES)
+
+    # Asserts
+    assert list(table.rows()) == ROWS
+    assert table.names == {'file': ["a.censored", "b.censored"], 'label': ["PERSON", "DATE"],
+                           'engine': ["spacy", "rules"]}
+    assert table.nbytes() == 4 * 4 * 4 + 4
+
+
+def test_span_table_records_engine_of_every_span():
+    # Initialize
+    table = SpanTable()
+    stats = {'PERSON': {'count': 3, 'indices': [(0, 4), (9, 13), (15, 19)], 'engines': [5, 3, 4]},
+             'DATE': {'count': 2, 'indices': [(20, 30), (35, 40)], 'engines': [-1, 5]}}
+
+    # Execute
+    table.add("a.censored", stats, ENGINES)
+
+    # Asserts
+    assert [row[1:] for row in table.rows()] == [("PERSON", "email", 0, 4), ("PERSON", "gazetteer", 9, 13),
+                                                 ("PERSON", "regex", 15, 19), ("DATE", "rules", 20, 30),
+                                                 ("DATE", "email", 35, 40)]
+
+
+@pytest.mark.parametrize("file_name, expected", [("spans.parquet", "parquet"), ("spans.ARROW", "arrow"),
+                                                 ("spans.feather", "arrow"), ("spans.csv", "csv"), ("spans", "csv")])
+def test_spans_format_of_extension(file_name, expected):
+    # Assert
+    assert spans_format_of(file_name) == expected
+    assert spans_format_of(file_name, "parquet") == "parquet"
+
+
+def test_span_writer_csv(tmp_path):
+    # Execute
+    writer = write_spans(tmp_path / "spans.csv")
+
+    # Asserts
+    with open(tmp_path / "spans.csv", encoding="utf-8") as file:
+        rows = list(csv.reader(file))
+    assert rows == [["file", "label", "engine", "start", "end"]] + [[str(value) for value in row] for row in ROWS]
+    assert writer.spans == 4
+
+
+@pytest.mark.parametrize("file_name", ["spans.parquet", "spans.arrow"])
+def test_span_writer_columnar(tmp_path, file_name):
+    # Initialize
+    pa = pytest.importorskip("pyarrow")
+    pytest.importorskip("pyarrow.parquet")
+
+    # Execute
+    write_spans(tmp_path / file_name)
+
+    # Asserts
+    if file_name.endswith(".parquet"):
+        import pyarrow.parquet as pq
+        table = pq.read_table(tmp_path / file_name)
+        assert pq.ParquetFile(tmp_path / file_name).num_row_groups == 2
+    else:
+        table = pa.ipc.open_file(tmp_path / file_name).read_all()
+    assert table.schema.field("start").type == pa.int32()
+    assert list(zip(*(table.column(name).to_pylist() for name in table.column_names))) == ROWS
+
+
+def test_span_writer_empty_parquet(tmp_path):
+    # Initialize
+    pytest.importorskip("pyarrow")
+    import pyarrow.parquet as pq
+
+    # Execute
+    with SpanWriter(tmp_path / "spans.parquet") as writer:
+        writer.add("a.censored", {'PHONE': 2})
+
+    # Asserts
+    table = pq.read_table(tmp_path / "spans.parquet")
+    assert table.num_rows == 0
+    assert table.column_names == ["file", "label", "engine", "start", "end"]
+
+
+def test_span_writer_falls_back_to_csv(tmp_path, monkeypatch, capsys):
+    # Mock
+    monkeypatch.setitem(sys.modules, "pyarrow", None)
+
+    # Execute
+    writer = write_spans(tmp_path / "spans.parquet")
+
+    # Asserts
+    assert writer.spans_format == "csv"
+    assert writer.path == tmp_path / "spans.csv"
+    assert "pyarrow is not installed" in capsys.readouterr().err
+    with open(tmp_path / "spans.csv", encoding="utf-8") as file:
+        assert len(list(csv.reader(file))) == len(ROWS) + 1
+
+
+def test_span_writer_unknown_format(tmp_path):
+    # Assert
+    with pytest.raises(ValueError):
+        SpanWriter(tmp_path / "spans.xml", "xml")
@@ -0,0 +1,185 @@
+import json
+import pytest
+from assignment1 import stats as stats_module
+from assignment1.spans import SpanWriter
+from assignment1.stats import StatsCollector
+
+
+def test_add_stat_uniform_schema():
+    # Initialize
+    stats = {'B-PER': 2}
+
+    # Execute
+    stats_module.add_stat(stats, 'PERSON', 0, 4)
+    stats_module.add_stat(stats, 'PERSON', 10, 14)
+    stats_module.add_stat(stats, 'B-PER', 20, 24)
+
+    # Assert
+    assert stats == {'B-PER': {'count': 3, 'indices': [(20, 24)]},
+                     'PERSON': {'count': 2, 'indices': [(0, 4), (10, 14)]}}
+
+
+def test_add_stat_records_engines():
+    # Initialize
+    stats = {}
+
+    # Execute
+    stats_module.add_stat(stats, 'PERSON', 0, 4)
+    stats_module.add_stat(stats, 'PERSON', 10, 14, "gazetteer")
+    stats_module.add_stat(stats, 'PERSON', 20, 24, "spacy")
+    stats_module.add_stat(stats, 'DATE', 30, 34)
+
+    # Assert
+    assert stats == {'PERSON': {'count': 3, 'indices': [(0, 4), (10, 14), (20, 24)],
+                                'engines': [-1, 3, 1]},
+                     'DATE': {'count': 1, 'indices': [(30, 34)]}}
+    assert stats_module.span_engines(stats['PERSON']) == [None, "gazetteer", "spacy"]
+    assert stats_module.span_engines(stats['DATE']) == [None]
+
+
+def test_stats_collector_to_stderr(capsys):
+    # Execute
+    with StatsCollector("stderr") as collector:
+        collector.add("output/path/to/file.censored", {"PERSON": {'count': 5, 'indices': []}, "DATE": 3})
+    captured = capsys.readouterr()
+
+    # Asserts
+    assert captured.err == ("File: output/path/to/file.censored\nPERSON: 5 occurrences\nDATE: 3 occurrences\n\n"
+                            "Summary: 1 files\nPERSON: 5 occurrences\nDATE: 3 occurrences\n\n")
+    assert captured.out == ""
+
+
+def test_stats_collector_to_stdout(capsys):
+    # Execute
+    with StatsCollector("stdout") as collector:
+        collector.add("output/path/to/anotherfile.censored", {"LOCATION": 2, "PHONE": 4})
+    captured = capsys.readouterr()
+
+    # Asserts
+    assert captured.out.startswith("File: output/path/to/anotherfile.censored\nLOCATION: 2 occurrences\n"
+                                   "PHONE: 4 occurrences\n\n")
+    assert captured.err == ""
+
+
+def test_stats_collector_keeps_every_file(tmp_path):
+    # Initialize
+    stats_output = tmp_path / "stats.txt"
+
+    # Execute
+    with StatsCollector(str(stats_output)) as collector:
+        collector.add("first.censored", {"ORG": 1})
+        collector.add("second.censored", {"ORG": 2, "GPE": 2})
+
+    # Asserts
+    with open(stats_output, encoding="utf-8") as file:
+        content = file.read()
+    assert "File: first.censored\nORG: 1 occurrences\n" in content
+    assert "File: second.censored\nORG: 2 occurrences\nGPE: 2 occurrences\n" in content
+    assert content.endswith("Summary: 2 files\nORG: 3 occurrences\nGPE: 2 occurrences\n\n")
+
+
+def test_stats_collector_jsonl(tmp_path):
+    # Initialize
+    stats_output = tmp_path / "stats.jsonl"
+
+    # Execute
+    with StatsCollector(str(stats_output), "jsonl") as collector:
+        collector.add("first.censored", {"PERSON": {'count': 1, 'indices': [(0, 4)]}})
+        collector.add("second.censored", {"B-PER": 2})
+
+    # Asserts
+    with open(stats_output, encoding="utf-8") as file:
+        records = [json.loads(line) for line in file]
+    assert records == [
+        {'file': 'first.censored', 'stats': {'PERSON': {'count': 1, 'indices': [[0, 4]]}}},
+        {'file': 'second.censored', 'stats': {'B-PER': {'count': 2, 'indices': []}}},
+        {'summary': {'files': 2, 'totals': {'PERSON': 1, 'B-PER': 2}}},
+    ]
+
+
+def test_stats_collector_jsonl_leaves_out_engines(tmp_path):
+    # Initialize
+    stats_output = tmp_path / "stats.jsonl"
+    stats = {}
+    stats_module.add_stat(stats, 'PERSON', 0, 4, "spacy")
+
+    # Execute
+    with StatsCollector(str(stats_output), "jsonl") as collector:
+        collector.add("first.censored", stats)
+
+    # Asserts
+    with open(stats_output, encoding="utf-8") as file:
+        records = [json.loads(line) for line in file]
+    assert records[0] == {'file': 'first.censored', 'stats': {'PERSON': {'count': 1, 'indices': [[0, 4]]}}}
+    assert stats['PERSON']['engines'] == [1]
+
+
+def test_stats_collector_csv(tmp_path):
+    # Initialize
+    stats_output = tmp_path / "stats.csv"
+
+    # Execute
+    with StatsCollector(str(stats_output), "csv") as collector:
+        collector.add("first.censored", {"PERSON": {'count': 2, 'indices': [(0, 4), (9, 13)]}})
+
+    # Assert
+    with open(stats_output, encoding="utf-8") as file:
+        assert file.read() == "file,label,count,indices\nfirst.censored,PERSON,2,0-4;9-13\nTOTAL,PERSON,2,\n"
+
+
+@pytest.mark.parametrize("stats_format, expected", [
+    ("text", "Summary: 2 files\nPERSON: 3 occurrences\ndedup_document hit rate: 50.0%\n"
+             "dedup_paragraph hit rate: 66.7%\n\n"),
+    ("jsonl", '{"summary": {"files": 2, "totals": {"PERSON": 3}, '
+              '"hit_rates": {"dedup_document": 0.5, "dedup_paragraph": 0.666667}}}\n'),
+    ("csv", "TOTAL,PERSON,3,\nHIT_RATE,dedup_document,0.5,\nHIT_RATE,dedup_paragraph,0.666667,\n"),
+])
+def test_stats_collector_summary_hit_rates(tmp_path, stats_format, expected):
+    # Initialize
+    stats_output = tmp_path / "stats.out"
+
+    # Execute
+    with StatsCollector(str(stats_output), stats_format) as collector:
+        collector.add("first.censored", {"PERSON": 2})
+        collector.add("second.censored", {"PERSON": 1})
+        collector.hit_rates = {'dedup_document': 0.5, 'dedup_paragraph': 0.666667}
+
+    # Asserts
+    with open(stats_output, encoding="utf-8") as file:
+        assert file.read().endswith(expected)
+    assert collector.summary()['hit_rates'] == {'dedup_document': 0.5, 'dedup_paragraph': 0.666667}
+
+
+def test_stats_collector_span_writer(tmp_path):
+    # Initialize
+    span_writer = SpanWriter(tmp_path / "spans.csv", engines={'PERSON': "spacy"})
+
+    # Execute
+    with StatsCollector(None, span_writer=span_writer) as collector:
+        collector.add("first.censored", {"PERSON": {'count': 2, 'indices': [(0, 4), (9, 13)]}, "PHONE": 1})
+
+    # Asserts
+    assert span_writer.closed
+    with open(tmp_path / "spans.csv", encoding="utf-8") as file:
+        assert file.read() == ("file,label,engine,start,end\nfirst.censored,PERSON,spacy,0,4\n"
+                               "first.censored,PERSON,spacy,9,13\n")
+
+
+def test_stats_collector_file_error(mocker, capsys):
+    # Mock
+    mocker.patch("builtins.open", side_effect=IOError("An error occurred"))
+
+    # Execute
+    with StatsCollector("/invalid/path/to/stats.txt") as collector:
+        collector.add("output/path/to/file.censored", {"LOC": 3})
+    captured = capsys.readouterr()
+
+    # Asserts
+    assert "An error occurred" in captured.out
+    assert collector.summary() == {'files': 1, 'totals': {'LOC': 3}}
+
+
+def test_stats_collector_unknown_format():
+    # Assert
+    with pytest.raises(ValueError):
+        StatsCollector("stdout", "xml")
@@ -0,0 +1,98 @@
+import io
+import re
+import pytest
+from assignment1 import streaming
+
+
+def censor_names(text):
+    # Length preserving censor used by the tests: every "Allen" becomes black blocks
+    stats = {'PERSON': {'count': 0, 'indices': []}}
+    for match in re.finditer("Allen", text):
+        stats['PERSON']['count'] += 1
+        stats['PERSON']['indices'].append((match.start(), match.end()))
+    return text.replace("Allen", "█████"), stats
+
+
+@pytest.mark.parametrize("buffer, limit, expected", [
+    ("first para\n\nsecond para", 20, 12),
+    ("first line\nsecond line", 20, 11),
+    ("no line breaks at all here", 20, 18),
+    ("x" * 30, 20, 20),
+])
+def test_find_split_point(buffer, limit, expected):
+    # Execute
+    result = streaming.find_split_point(buffer, limit)
+
+    # Assert
+    assert result == expected
+
+
+def test_read_chunks_is_bounded_and_lossless():
+    # Initialize
+    text = "".join(f"Paragraph number {i} talks about forecasts.\n\n" for i in range(50))
+
+    # Execute
+    chunks = list(streaming.read_chunks(io.StringIO(text), chunk_chars=100))
+
+    # Asserts
+    assert "".join(chunks) == text
+    assert all(len(chunk) <= 100 for chunk in chunks)
+    assert all(chunk.endswith("\n\n") for chunk in chunks)
+
+
+def test_read_chunks_empty_stream():
+    # Execute
+    chunks = list(streaming.read_chunks(io.StringIO(""), chunk_chars=100))
+
+    # Assert
+    assert chunks == []
+
+
+def test_censor_stream_matches_whole_text():
+    # Initialize
+    text = "".join(f"Mail {i} from Phillip Allen about the forecast.\n" for i in range(40))
+    output = io.StringIO()
+
+    # Execute
+    stats = streaming.censor_stream(io.StringIO(text), output, censor_names, chunk_chars=120, overlap_chars=16)
+
+    # Asserts
+    expected_text, expected_stats = censor_names(text)
+    assert output.getvalue() == expected_text
+    assert stats == expected_stats
+
+
+def test_censor_stream_catches_entity_across_chunk_edge():
+    # Initialize: no separators, so the chunk edge falls inside "Allen"
+    text = "x" * 18 + "Allen" + "y" * 17
+    output = io.StringIO()
+
+    # Execute
+    stats = streaming.censor_stream(io.StringIO(text), output, censor_names, chunk_chars=20, overlap_chars=8)
+
+    # Asserts
+    assert output.getvalue() == "x" * 18 + "█████" + "y" * 17
+    assert stats == {'PERSON': {'count': 1, 'indices': [(18, 23)]}}
+
+
+def test_merge_window_stats_adds_bare_counts():
+    # Initialize
+    stats = {'B-PER': 1}
+
+    # Execute
+    streaming.merge_window_stats(stats, {'B-PER': 2, 'DATE': {'count': 1, 'indices': [(2, 6)]}}, 0, 10, 100)
+
+    # Assert
+    assert stats == {'B-PER': 3, 'DATE': {'count': 1, 'indices': [(102, 106)]}}
+
+
+def test_merge_window_stats_keeps_engines():
+    # Initialize
+    stats = {}
+    window_stats = {'PERSON': {'count': 2, 'indices': [(2, 6), (12, 16)], 'engines': [4, 1]}}
+
+    # Execute
+    streaming.merge_window_stats(stats, window_stats, 10, 20, 100)
+
+    # Assert
+    assert stats == {'PERSON': {'count': 1, 'indices': [(112, 116)], 'engines': [1]}}
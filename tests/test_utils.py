@@ -13,79 +13,6 @@ def mock_arg_parser(mocker):
     return mock_parser
 
 
-def test_output_stats_to_stderr(capsys):
-    # Initialize
-    stats = {"PERSON": 5, "DATE": 3}
-    stats_output = "stderr"
-    censored_file_path = "output/path/to/file.censored"
-
-    # Expect
-    expected_output = "File: output/path/to/file.censored\nPERSON: 5 occurrences\nDATE: 3 occurrences\n\n"
-
-    # Execute
-    utils.output_stats(stats, stats_output, censored_file_path)
-    captured = capsys.readouterr()
-
-    # Asserts
-    assert captured.err == expected_output
-    assert captured.out == ""
-
-
-def test_output_stats_to_stdout(capsys):
-    # Initialize
-    stats = {"LOCATION": 2, "PHONE": 4}
-    stats_output = "stdout"
-    censored_file_path = "output/path/to/anotherfile.censored"
-
-    # Expect
-    expected_output = "File: output/path/to/anotherfile.censored\nLOCATION: 2 occurrences\nPHONE: 4 occurrences\n\n"
-
-    # Execute
-    utils.output_stats(stats, stats_output, censored_file_path)
-    captured = capsys.readouterr()
-
-    # Asserts
-    assert captured.out == expected_output
-    assert captured.err == ""
-
-
-def test_output_stats_to_file(mocker):
-    # Initialize
-    stats = {"ORG": 1, "GPE": 2}
-    stats_output = "output/path/to/stats.txt"
-    censored_file_path = "output/path/to/file.censored"
-
-    # Mock
-    mock_open = mocker.patch("builtins.open", mocker.mock_open())
-
-    # Expect
-    expected_output = "File: output/path/to/file.censored\nORG: 1 occurrences\nGPE: 2 occurrences\n"
-
-    # Execute
-    utils.output_stats(stats, stats_output, censored_file_path)
-
-    # Asserts
-    mock_open.assert_called_once_with(stats_output, "w")
-    mock_open().write.assert_called_once_with(expected_output + "\n")
-
-
-def test_output_stats_file_error(mocker, capsys):
-    # Initialize
-    stats = {"LOC": 3}
-    stats_output = "/invalid/path/to/stats.txt"
-    censored_file_path = "output/path/to/file.censored"
-
-    # Mock
-    mocker.patch("builtins.open", side_effect=IOError("An error occurred"))
-
-    # Execute
-    utils.output_stats(stats, stats_output, censored_file_path)
-    captured = capsys.readouterr()
-
-    # Assert
-    assert "An error occurred" in captured.out
-
-
 def test_extract_arguments_all_arg_passed(mock_arg_parser):
     # Mock
     mock_arg_parser.names = True
@@ -195,3 +122,78 @@ def test_parse_arguments_missing_required_options(monkeypatch):
     with pytest.raises(SystemExit):
         # Execute
         utils.arguments_parser()
+
+
+def test_parse_arguments_serve_without_input_and_output(monkeypatch):
+    # Initialize
+    cli_args = ['program', '--serve', '--names', '--port', '8080', '--batch-window-ms', '5']
+
+    # Mock
+    monkeypatch.setattr(sys, 'argv', cli_args)
+
+    # Execute
+    args = utils.arguments_parser()
+
+    # Asserts
+    assert args.serve is True
+    assert args.input is None
+    assert args.port == 8080
+    assert args.batch_window_ms == 5
+
+
+def test_parse_arguments_with_workers(monkeypatch):
+    # Initialize
+    cli_args = ['program', '--input', 'sample/path/input.txt', '--output', 'output/', '--workers', '8']
+
+    # Mock
+    monkeypatch.setattr(sys, 'argv', cli_args)
+
+    # Execute
+    args = utils.arguments_parser()
+
+    # Assert
+    assert args.workers == 8
+
+
+@pytest.mark.parametrize("extra_args, expected", [(['--threads', '4'], 4), ([], 1),
+                                                  (['--threads', '4', '--workers', '2'], None)])
+def test_parse_arguments_threads(monkeypatch, extra_args, expected):
+    # Initialize
+    cli_args = ['program', '--input', '*.txt', '--output', 'output/'] + extra_args
+
+    # Mock
+    monkeypatch.setattr(sys, 'argv', cli_args)
+
+    # Execute and Assert
+    if expected is None:
+        with pytest.raises(SystemExit):
+            utils.arguments_parser()
+    else:
+        assert utils.arguments_parser().threads == expected
+
+
+@pytest.mark.parametrize("shard, expected", [("2/4", (2, 4)), ("1/1", (1, 1)), ("0/4", None), ("5/4", None),
+                                             ("2-4", None)])
+def test_parse_arguments_shard(monkeypatch, shard, expected):
+    # Initialize
+    cli_args = ['program', '--input', '*.txt', '--output', 'output/', '--shard', shard]
+
+    # Mock
+    monkeypatch.setattr(sys, 'argv', cli_args)
+
+    # Execute and Assert
+    if expected is None:
+        with pytest.raises(SystemExit):
+            utils.arguments_parser()
+    else:
+        assert utils.arguments_parser().shard == expected
+
+
+def test_parse_merge_arguments():
+    # Execute
+    args = utils.merge_arguments_parser(['--output', 'output/', '--stats', 'stats.jsonl', '--stats-format', 'jsonl'])
+
+    # Asserts
+    assert args.output == 'output/'
+    assert args.stats == 'stats.jsonl'
+    assert args.stats_format == 'jsonl'
@@ -0,0 +1,149 @@
+import os
+import threading
+import time
+import pytest
+from assignment1 import watch as watch_module
+from assignment1.watch import WatchState, PollingWatcher, InotifyWatcher, watch
+
+
+@pytest.fixture
+def stopped():
+    # A stop that is already set makes the watch a single pass over the existing files
+    event = threading.Event()
+    event.set()
+    return event
+
+
+def write_file(file_path, text, age=60):
+    # Write a file whose last write happened age seconds ago
+    file_path.write_text(text, encoding="utf-8")
+    os.utime(file_path, (time.time() - age, time.time() - age))
+
+
+def test_watch_state_round_trip(tmp_path):
+    # Initialize
+    write_file(tmp_path / "a.txt", "Mail from Allen")
+    state = WatchState(tmp_path / "state.json")
+
+    # Execute
+    state.record(str(tmp_path / "a.txt"), os.stat(tmp_path / "a.txt"), "digest")
+    state.save()
+    loaded = WatchState(tmp_path / "state.json").load()
+
+    # Asserts
+    assert loaded.files == state.files
+    assert loaded.unchanged(str(tmp_path / "a.txt"), os.stat(tmp_path / "a.txt"))
+    assert loaded.dirty is False
+
+
+def test_watch_yields_new_and_changed_files_once(tmp_path, stopped):
+    # Initialize
+    pattern = str(tmp_path / "*.txt")
+    write_file(tmp_path / "a.txt", "Mail from Allen")
+    write_file(tmp_path / "b.txt", "Mail from Tim")
+    state = WatchState(tmp_path / "state.json")
+
+    # Execute
+    first = list(watch(pattern, state, stop=stopped))
+    second = list(watch(pattern, state, stop=stopped))
+    write_file(tmp_path / "b.txt", "Mail from Tim Belden", age=30)
+    third = list(watch(pattern, WatchState(tmp_path / "state.json").load(), stop=stopped))
+
+    # Asserts
+    assert first == [str(tmp_path / "a.txt"), str(tmp_path / "b.txt")]
+    assert second == []
+    assert third == [str(tmp_path / "b.txt")]
+
+
+def test_watch_skips_touched_files_with_same_content(tmp_path, stopped):
+    # Initialize
+    pattern = str(tmp_path / "*.txt")
+    write_file(tmp_path / "a.txt", "Mail from Allen")
+    state = WatchState(tmp_path / "state.json")
+    list(watch(pattern, state, stop=stopped))
+
+    # Execute
+    os.utime(tmp_path / "a.txt", (time.time() - 30, time.time() - 30))
+    touched = list(watch(pattern, state, stop=stopped))
+
+    # Asserts
+    assert touched == []
+    assert state.unchanged(str(tmp_path / "a.txt"), os.stat(tmp_path / "a.txt"))
+
+
+def test_watch_debounces_files_still_being_written(tmp_path, stopped):
+    # Initialize
+    pattern = str(tmp_path / "*.txt")
+    write_file(tmp_path / "partial.txt", "Mail from", age=0)
+    state = WatchState(tmp_path / "state.json")
+
+    # Execute
+    files = list(watch(pattern, state, debounce_seconds=5, stop=stopped))
+
+    # Asserts
+    assert files == []
+    assert state.files == {}
+
+
+def test_watch_picks_up_files_reported_by_the_watcher(mocker, tmp_path):
+    # Mock
+    stop = threading.Event()
+    mock_watcher = mocker.Mock()
+
+    def arrive(timeout):
+        write_file(tmp_path / "new.txt", "Mail from Allen")
+        stop.set()
+        return [str(tmp_path / "new.txt")]
+    mock_watcher.wait.side_effect = arrive
+
+    # Execute
+    files = list(watch(str(tmp_path / "*.txt"), WatchState(tmp_path / "state.json"), stop=stop,
+                       watcher=mock_watcher))
+
+    # Asserts
+    assert files == [str(tmp_path / "new.txt")]
+    mock_watcher.close.assert_called_once()
+
+
+def test_polling_watcher_rescans_pattern(mocker, tmp_path):
+    # Mock
+    mock_sleep = mocker.patch('assignment1.watch.time.sleep')
+
+    # Initialize
+    write_file(tmp_path / "a.txt", "Mail")
+    write_file(tmp_path / "a.censored", "Mail")
+
+    # Execute
+    files = PollingWatcher(str(tmp_path / "*.txt")).wait(1.0)
+
+    # Asserts
+    assert files == [str(tmp_path / "a.txt")]
+    mock_sleep.assert_called_once_with(1.0)
+
+
+def test_inotify_watcher_reports_matching_files(tmp_path):
+    # Initialize
+    try:
+        watcher = InotifyWatcher(str(tmp_path / "*.txt"))
+    except (AttributeError, OSError):
+        pytest.skip("inotify is not available")
+
+    # Execute
+    (tmp_path / "a.txt").write_text("Mail", encoding="utf-8")
+    (tmp_path / "a.censored").write_text("Mail", encoding="utf-8")
+    files = watcher.wait(1.0)
+    watcher.close()
+
+    # Asserts
+    assert files == {str(tmp_path / "a.txt")}
+
+
+def test_create_watcher_falls_back_to_polling(mocker, tmp_path):
+    # Mock
+    mocker.patch('assignment1.watch.InotifyWatcher', side_effect=AttributeError("inotify_init1"))
+
+    # Execute
+    watcher = watch_module.create_watcher(str(tmp_path / "*.txt"))
+
+    # Asserts
+    assert isinstance(watcher, PollingWatcher)